@@ -1,171 +1,337 @@
 import asyncio
 from playwright.async_api import async_playwright
 import argparse
+from collections import OrderedDict
 from datetime import datetime
+import hashlib
 import os
 import json
 from pathlib import Path
-import tempfile
+import shutil
+import sys
 import base64
+import uuid
 
-async def execute_playwright_script(url: str, script: str, output_dir: str = ".screenshots", capture_logs: bool = False):
-    """
-    Executes a Playwright script and captures outputs.
-    """
-    # Create output directory
-    
-    automation_output_dir = 'automation_output'
-
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(automation_output_dir, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    run_dir = Path(automation_output_dir) / timestamp
-    run_dir.mkdir(exist_ok=True)
-
-    screenshot_dir = Path(output_dir)
-    screenshot_dir.mkdir(exist_ok=True)
-    
-    result = {
-        "status": "success",
+# Compiled scripts kept, keyed by a hash of their source
+SCRIPT_CACHE_SIZE = 256
+
+SCREENSHOT_OPTIONS = {"full_page": True, "type": "jpeg", "quality": 50}
+
+
+def _decode(script: str) -> str:
+    # Decode script if base64 encoded
+    if script.startswith('base64:'):
+        return base64.b64decode(script[7:]).decode('utf-8')
+    return script
+
+
+def _error_result(message: str) -> dict:
+    return {
+        "status": "error",
         "data": {
             "screenshots": [],
             "console_logs": [],
-            "error": None,
+            "error": message,
             "output": None
         }
     }
 
-    try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            page = await context.new_page()
-            
-            # Store console logs if requested
-            console_logs = []
-            if capture_logs:
-                page.on("console", lambda msg: console_logs.append(f"{msg.type}: {msg.text}"))
-            
-            try:
-                # Navigate to URL first
-                await page.goto(url, wait_until="networkidle", timeout=30000)
-                
-                # Decode script if base64 encoded
-                if script.startswith('base64:'):
-                    script = base64.b64decode(script[7:]).decode('utf-8')
-                
-                # Add proper indentation to the script
-                indented_script = ""
-                for line in script.split('\n'):
-                    if line.strip():
-                        indented_script += "    " + line + "\n"
-                    else:
-                        indented_script += "\n"
-                
-                # Create test script with proper indentation
-                test_script = f"""async def run_test(page, output_dir):
+
+def _wrap(script: str) -> str:
+    # Indent the script into the body of run_test(page, output_dir)
+    indented_script = ""
+    for line in script.split('\n'):
+        if line.strip():
+            indented_script += "    " + line + "\n"
+        else:
+            indented_script += "\n"
+    return f"""async def run_test(page, output_dir):
 {indented_script}"""
 
-                # Write the test script to a file for debugging
-                test_script_path = run_dir / "test_script.py"
-                with open(test_script_path, "w") as f:
-                    f.write(test_script)
-
-                # Save script to temp file for execution
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                    f.write(test_script)
-                    script_path = f.name
-
-                # Import and execute the script
-                import importlib.util
-                spec = importlib.util.spec_from_file_location("dynamic_script", script_path)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                
-                # Run the test
-                output = await module.run_test(page, str(run_dir))
-                if output is not None:
-                    result["data"]["output"] = output
-                
-                # Take a screenshot if none were taken
-                screenshot_files = list(run_dir.glob('*.{png,jpg,jpeg}'))
-                if not screenshot_files:
-                    final_screenshot = run_dir / f"final_{timestamp}.png"
-                    await page.screenshot(
-                        path=str(final_screenshot),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
-                    )
-                    result["data"]["screenshots"].append(str(final_screenshot))
-
-                    # Save additional screenshot to .screenshot folder
-                    await page.screenshot(
-                        path=str(screenshot_dir / "screenshot.jpeg"),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
-                    )
-                else:
-                    result["data"]["screenshots"].extend(str(f) for f in screenshot_files)
 
-                # Save console logs if captured
-                if capture_logs and console_logs:
-                    log_path = run_dir / f"console_{timestamp}.log"
-                    with open(log_path, "w", encoding="utf-8") as f:
-                        f.write("\n".join(console_logs))
-                    result["data"]["console_logs"].append(str(log_path))
+class PlaywrightExecutor:
+    """
+    Runs Playwright scripts against one long-lived Chromium.
+
+    Each run gets a fresh browser context (its own cookies and storage) from
+    a small pool that is refilled in the background, so runs are isolated
+    without paying for browser or context startup. At most `concurrency`
+    scripts run at once, and scripts are compiled once per distinct source.
+    """
+
+    def __init__(self, concurrency: int = 4, headless: bool = True):
+        self.concurrency = concurrency
+        self.headless = headless
+        self._playwright = None
+        self._browser = None
+        self._slots = asyncio.Semaphore(concurrency)
+        self._contexts: asyncio.Queue = asyncio.Queue()
+        self._refills = set()
+        self._scripts: "OrderedDict[str, tuple]" = OrderedDict()
 
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        for _ in range(self.concurrency):
+            self._contexts.put_nowait(await self._browser.new_context())
+
+    async def close(self):
+        for task in self._refills:
+            task.cancel()
+        await asyncio.gather(*self._refills, return_exceptions=True)
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _refill(self):
+        try:
+            context = await self._browser.new_context()
+        except Exception as e:
+            # The pool stays one short; checkouts open their own context meanwhile
+            print(f"Context refill failed: {str(e)}", file=sys.stderr)
+            return
+        self._contexts.put_nowait(context)
+
+    async def _checkout(self):
+        try:
+            context = self._contexts.get_nowait()
+        except asyncio.QueueEmpty:
+            # A refill failed or hasn't finished; don't wait on it
+            context = await self._browser.new_context()
+        # Replace it while this run uses it
+        task = asyncio.create_task(self._refill())
+        self._refills.add(task)
+        task.add_done_callback(self._refills.discard)
+        return context
+
+    def compile(self, script: str):
+        """The run_test coroutine function for a script, and its wrapped source."""
+        source = _wrap(_decode(script))
+        digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        compiled = self._scripts.get(digest)
+        if compiled is None:
+            namespace = {}
+            exec(compile(source, f"<playwright_script_{digest[:12]}>", "exec"), namespace)
+            compiled = (namespace["run_test"], source)
+            self._scripts[digest] = compiled
+            while len(self._scripts) > SCRIPT_CACHE_SIZE:
+                self._scripts.popitem(last=False)
+        else:
+            self._scripts.move_to_end(digest)
+        return compiled
+
+    async def run(self, url: str, script: str, output_dir: str = ".screenshots", capture_logs: bool = False):
+        """
+        Executes a Playwright script and captures outputs.
+        """
+        automation_output_dir = 'automation_output'
+
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(automation_output_dir, exist_ok=True)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Concurrent runs can start in the same second
+        run_dir = Path(automation_output_dir) / f"{timestamp}_{uuid.uuid4().hex[:8]}"
+        run_dir.mkdir(exist_ok=True)
+
+        screenshot_dir = Path(output_dir)
+
+        result = {
+            "status": "success",
+            "data": {
+                "screenshots": [],
+                "console_logs": [],
+                "error": None,
+                "output": None
+            }
+        }
+
+        async with self._slots:
+            try:
+                context = await self._checkout()
             except Exception as e:
                 result["status"] = "error"
-                result["data"]["error"] = f"Script error: {str(e)}"
-                error_screenshot = run_dir / f"error_{timestamp}.png"
-                await page.screenshot(
-                        path=str(error_screenshot),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
-                    )
-                result["data"]["screenshots"].append(str(error_screenshot))
-
-                # Save additional screenshot to .screenshot folder
-                await page.screenshot(
-                        path=str(screenshot_dir / "screenshot.jpeg"),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
+                result["data"]["error"] = f"Setup error: {str(e)}"
+                return result
+
+            try:
+                page = await context.new_page()
+
+                # Store console logs if requested
+                console_logs = []
+                if capture_logs:
+                    page.on("console", lambda msg: console_logs.append(f"{msg.type}: {msg.text}"))
+
+                try:
+                    # Navigate to URL first
+                    await page.goto(url, wait_until="networkidle", timeout=30000)
+
+                    run_test, test_script = self.compile(script)
+
+                    # Write the test script to a file for debugging
+                    with open(run_dir / "test_script.py", "w") as f:
+                        f.write(test_script)
+
+                    # Run the test
+                    output = await run_test(page, str(run_dir))
+                    if output is not None:
+                        result["data"]["output"] = output
+
+                    # Take a screenshot if none were taken
+                    screenshot_files = sorted(
+                        f for pattern in ('*.png', '*.jpg', '*.jpeg') for f in run_dir.glob(pattern)
                     )
-            
+                    if not screenshot_files:
+                        final_screenshot = run_dir / f"final_{timestamp}.jpeg"
+                        await self._screenshot(page, final_screenshot, screenshot_dir)
+                        result["data"]["screenshots"].append(str(final_screenshot))
+                    else:
+                        result["data"]["screenshots"].extend(str(f) for f in screenshot_files)
+
+                    # Save console logs if captured
+                    if capture_logs and console_logs:
+                        log_path = run_dir / f"console_{timestamp}.log"
+                        with open(log_path, "w", encoding="utf-8") as f:
+                            f.write("\n".join(console_logs))
+                        result["data"]["console_logs"].append(str(log_path))
+
+                except Exception as e:
+                    result["status"] = "error"
+                    result["data"]["error"] = f"Script error: {str(e)}"
+                    error_screenshot = run_dir / f"error_{timestamp}.jpeg"
+                    await self._screenshot(page, error_screenshot, screenshot_dir)
+                    result["data"]["screenshots"].append(str(error_screenshot))
+
+            except Exception as e:
+                result["status"] = "error"
+                result["data"]["error"] = f"Setup error: {str(e)}"
+
             finally:
-                if os.path.exists(script_path):
-                    os.unlink(script_path)
-                await browser.close()
+                await context.close()
+
+        return result
+
+    async def _screenshot(self, page, path: Path, screenshot_dir: Path):
+        """Capture once, then copy into `screenshot_dir` under the run's own name.
 
+        screenshot.jpeg there always holds the most recent capture; with
+        concurrent runs the last one to finish wins, so read the per-run copy.
+        """
+        await page.screenshot(path=str(path), **SCREENSHOT_OPTIONS)
+        run_copy = screenshot_dir / f"screenshot_{path.parent.name}.jpeg"
+        shutil.copyfile(path, run_copy)
+        # Swap the latest copy in whole so readers never see a half-written file
+        latest = screenshot_dir / f".screenshot_{path.parent.name}.jpeg"
+        shutil.copyfile(path, latest)
+        os.replace(latest, screenshot_dir / "screenshot.jpeg")
+
+    async def run_many(self, jobs):
+        """Run {url, script, output?, capture_logs?} jobs concurrently; results are in job order."""
+        return await asyncio.gather(*(
+            self.run(job["url"], job["script"], job.get("output", ".screenshots"), job.get("capture_logs", False))
+            for job in jobs
+        ))
+
+
+async def execute_playwright_script(
+    url: str, script: str, output_dir: str = ".screenshots", capture_logs: bool = False
+):
+    """
+    Executes a Playwright script and captures outputs.
+    """
+    try:
+        async with PlaywrightExecutor(concurrency=1) as executor:
+            return await executor.run(url, script, output_dir, capture_logs)
     except Exception as e:
-        result["status"] = "error"
-        result["data"]["error"] = f"Setup error: {str(e)}"
+        return _error_result(f"Setup error: {str(e)}")
+
+
+async def serve(concurrency: int):
+    """
+    Long-lived mode: one JSON job per line on stdin, one JSON result per line
+    on stdout (with the job's "id" echoed back), completed in any order.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = set()
+
+    async def handle(job):
+        try:
+            result = await executor.run(
+                job["url"], job["script"], job.get("output", ".screenshots"), job.get("capture_logs", False)
+            )
+        except KeyError as e:
+            result = _error_result(f"Invalid job: missing {str(e)}")
+        result["id"] = job.get("id")
+        print(json.dumps(result), flush=True)
+
+    async with PlaywrightExecutor(concurrency=concurrency) as executor:
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                print(json.dumps(_error_result(f"Invalid job: {str(e)}")), flush=True)
+                continue
+            if not isinstance(job, dict):
+                print(json.dumps(_error_result("Invalid job: expected a JSON object")), flush=True)
+                continue
+            task = asyncio.create_task(handle(job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+
+async def run_batch(path: str, concurrency: int):
+    with open(path, encoding="utf-8") as f:
+        jobs = json.load(f)
+    async with PlaywrightExecutor(concurrency=concurrency) as executor:
+        return await executor.run_many(jobs)
 
-    return result
 
 def main():
     parser = argparse.ArgumentParser(description="Execute Playwright automation script")
-    parser.add_argument("url", help="URL to automate")
-    parser.add_argument("--script", required=True, help="Playwright script to execute (plain text or base64 encoded with 'base64:' prefix)")
+    parser.add_argument("url", nargs="?", help="URL to automate")
+    parser.add_argument("--script",
+                        help="Playwright script to execute (plain text or base64 encoded with 'base64:' prefix)")
     parser.add_argument("--output", "-o", default=".screenshots",
                         help="Output directory for screenshots and logs")
     parser.add_argument("--capture-logs", action="store_true", help="Capture console logs")
-    
+    parser.add_argument("--batch", help="JSON file with a list of {url, script, output, capture_logs} jobs")
+    parser.add_argument("--serve", action="store_true", help="Keep the browser running and read jobs from stdin")
+    parser.add_argument("--concurrency", type=int, default=4, help="Scripts run at once in --batch and --serve modes")
+
     args = parser.parse_args()
-    
+
+    if args.serve:
+        asyncio.run(serve(args.concurrency))
+        return
+    if args.batch:
+        print(json.dumps(asyncio.run(run_batch(args.batch, args.concurrency))))
+        return
+    if not args.url or args.script is None:
+        parser.error("url and --script are required unless --batch or --serve is given")
+
     result = asyncio.run(execute_playwright_script(
         args.url,
         args.script,
         args.output,
         args.capture_logs
     ))
-    
+
     print(json.dumps(result))
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
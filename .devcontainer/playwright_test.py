@@ -5,6 +5,53 @@ from datetime import datetime
 import os
 
 
+async def _capture(browser, url: str, screenshot_path: str, log_path: str, capture_logs: bool = False):
+    """
+    Captures one URL in its own browser context.
+    """
+    # Create a new context and page
+    context = await browser.new_context()
+    page = await context.new_page()
+
+    # Store console logs
+    console_logs = []
+
+    if capture_logs:
+        # Console log handler
+        page.on("console", lambda msg: console_logs.append(f"{msg.type}: {msg.text}"))
+
+    try:
+        # Navigate to the URL
+        await page.goto(url, wait_until="networkidle")
+
+        # Wait for any animations or dynamic content to settle
+        await page.wait_for_timeout(2000)
+
+        # Take full page screenshot
+        await page.screenshot(
+            path=screenshot_path,
+            full_page=True,
+            type="jpeg",
+            quality = 50  # Add this line - adjust value between 0-100
+        )
+        # print(f"Screenshot saved to: {screenshot_path}")
+
+        if capture_logs:
+            # Save console logs
+            with open(log_path, "w", encoding="utf-8") as f:
+                f.write(f"Console logs for {url}\n")
+                f.write("=" * 50 + "\n")
+                f.write("\n".join(console_logs))
+            # print(f"Console logs saved to: {log_path}")
+        return True
+    except Exception as e:
+        print(f"Error capturing page {url}: {str(e)}")
+        return False
+
+    finally:
+        await context.close()
+
+
 async def capture_page(url: str, output_dir: str = "screenshots", capture_logs: bool = False):
     """
     Captures a full-page screenshot and console logs from the specified URL.
@@ -24,62 +71,62 @@ async def capture_page(url: str, output_dir: str = "screenshots", capture_logs:
     async with async_playwright() as p:
         # Launch the browser
         browser = await p.chromium.launch(headless=True)
+        try:
+            screenshot_path = os.path.join(output_dir, f"screenshot.jpeg")
+            log_path = os.path.join(output_dir, f"console_logs_{timestamp}.txt")
+            if await _capture(browser, url, screenshot_path, log_path, capture_logs):
+                print("Screenshot Generated")
+        finally:
+            await browser.close()
 
-        # Create a new context and page
-        context = await browser.new_context()
-        page = await context.new_page()
-
-        # Store console logs
-        console_logs = []
 
-        if capture_logs:
-            # Console log handler
-            page.on("console", lambda msg: console_logs.append(f"{msg.type}: {msg.text}"))
+async def capture_pages(urls, output_dir: str = "screenshots", capture_logs: bool = False, concurrency: int = 4):
+    """
+    Batch mode of capture_page: one browser, up to `concurrency` pages at a time.
 
-        try:
-            # Navigate to the URL
-            await page.goto(url, wait_until="networkidle")
+    The screenshot for urls[i] is saved as screenshot_{i}.jpeg (and its logs as
+    console_logs_{timestamp}_{i}.txt). Returns the URLs that failed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    slots = asyncio.Semaphore(concurrency)
 
-            # Wait for any animations or dynamic content to settle
-            await page.wait_for_timeout(2000)
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
 
-            # Take full page screenshot
-            screenshot_path = os.path.join(output_dir, f"screenshot.jpeg")
-            await page.screenshot(
-                path=screenshot_path,
-                full_page=True,
-                type="jpeg",
-                quality = 50  # Add this line - adjust value between 0-100
-            )
-            # print(f"Screenshot saved to: {screenshot_path}")
-
-            if capture_logs:
-                # Save console logs
-                log_path = os.path.join(output_dir, f"console_logs_{timestamp}.txt")
-                with open(log_path, "w", encoding="utf-8") as f:
-                    f.write(f"Console logs for {url}\n")
-                    f.write("=" * 50 + "\n")
-                    f.write("\n".join(console_logs))
-                # print(f"Console logs saved to: {log_path}")
-            print("Screenshot Generated")
-        except Exception as e:
-            print(f"Error capturing page: {str(e)}")
+        async def capture(index, url):
+            async with slots:
+                return await _capture(
+                    browser, url,
+                    os.path.join(output_dir, f"screenshot_{index}.jpeg"),
+                    os.path.join(output_dir, f"console_logs_{timestamp}_{index}.txt"),
+                    capture_logs,
+                )
 
+        try:
+            captured = await asyncio.gather(*(capture(index, url) for index, url in enumerate(urls)))
         finally:
             await browser.close()
 
+    print(f"Screenshots Generated: {sum(captured)}/{len(urls)}")
+    return [url for url, ok in zip(urls, captured) if not ok]
+
 
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Capture webpage screenshot and console logs")
-    parser.add_argument("url", help="URL to capture")
+    parser.add_argument("url", nargs="+", help="URL to capture (several URLs are captured as a batch)")
     parser.add_argument("--console", help="Should Capture to capture")
     parser.add_argument("--output", "-o", default="screenshots",
                         help="Output directory for screenshots and logs")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pages captured at once in batch mode")
     args = parser.parse_args()
 
     # Run the async capture function
-    asyncio.run(capture_page(args.url, args.output, args.console is not None))
+    if len(args.url) == 1:
+        asyncio.run(capture_page(args.url[0], args.output, args.console is not None))
+    else:
+        asyncio.run(capture_pages(args.url, args.output, args.console is not None, args.concurrency))
 
 
 if __name__ == "__main__":
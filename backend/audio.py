@@ -0,0 +1,181 @@
+"""Streaming audio mixdown for exports.
+
+Each audio clip is decoded by its own ffmpeg process as a stream of float
+samples, opened only while the clip overlaps the block being mixed. Clips
+are scaled by their gain and fade envelope and summed with NumPy one fixed
+block at a time, and each finished block is piped straight into the
+encoder, so memory stays the same however long the timeline is.
+
+Clip `audioEffects` (from the EffectsPanel audio tab):
+    volume   0..100, percent of the source level (default 100)
+    fadeIn   0..100, percent of the clip's duration spent fading in
+    fadeOut  0..100, percent of the clip's duration spent fading out
+"""
+import math
+import os
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+# Sample frames mixed per block (~0.7s at 48kHz)
+BLOCK_FRAMES = 32768
+FRAME_BYTES = CHANNELS * 4
+
+
+class AudioError(Exception):
+    pass
+
+
+def audio_levels(effects: Any) -> Tuple[float, float, float]:
+    """(volume, fade in, fade out) of an `audioEffects` object, each as a fraction."""
+    effects = effects or {}
+    if not isinstance(effects, dict):
+        raise AudioError(f"Invalid audioEffects: {effects!r}")
+
+    def percent(name: str, default: float) -> float:
+        value = effects.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise AudioError(f"Invalid {name}: {value!r}")
+        return max(0.0, min(100.0, float(value))) / 100
+
+    return percent('volume', 100), percent('fadeIn', 0), percent('fadeOut', 0)
+
+
+def clip_envelope(clip: Dict[str, Any]) -> Tuple[float, float, float]:
+    """(gain, fade in seconds, fade out seconds) for a clip."""
+    gain, fade_in, fade_out = audio_levels(clip.get('audioEffects'))
+    duration = clip['duration']
+    return gain, fade_in * duration, fade_out * duration
+
+
+def audio_filter(clip: Dict[str, Any]) -> str:
+    """The same envelope as an ffmpeg filter chain, for single-pass renders."""
+    gain, fade_in, fade_out = clip_envelope(clip)
+    filters = [f"volume={gain:.4f}"]
+    if fade_in > 0:
+        filters.append(f"afade=t=in:st=0:d={fade_in:.3f}")
+    if fade_out > 0:
+        filters.append(f"afade=t=out:st={clip['duration'] - fade_out:.3f}:d={fade_out:.3f}")
+    return ','.join(filters)
+
+
+def _envelope(gain: float, fade_in: int, fade_out: int, length: int, first: int, count: int) -> np.ndarray:
+    """Gain for clip-relative frames [first, first + count) of a clip `length` frames long."""
+    positions = np.arange(first, first + count, dtype=np.float32)
+    envelope = np.full(count, gain, dtype=np.float32)
+    if fade_in > 0:
+        envelope *= np.minimum(1.0, positions / fade_in)
+    if fade_out > 0:
+        envelope *= np.clip((length - positions) / fade_out, 0.0, 1.0)
+    return envelope
+
+
+class ClipStream:
+    """A lazily started decoder for one clip's samples, read in order."""
+
+    def __init__(self, clip: Dict[str, Any]):
+        self.clip = clip
+        self.start = round(clip['start'] * SAMPLE_RATE)
+        self.length = round(clip['duration'] * SAMPLE_RATE)
+        self.end = self.start + self.length
+        gain, fade_in, fade_out = clip_envelope(clip)
+        self.gain = gain
+        self.fade_in = round(fade_in * SAMPLE_RATE)
+        self.fade_out = round(fade_out * SAMPLE_RATE)
+        self.position = 0
+        self._proc = None
+
+    def open(self) -> None:
+        self._proc = subprocess.Popen(
+            [FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error',
+             '-ss', f"{self.clip.get('trimStart', 0):.3f}", '-t', f"{self.clip['duration']:.3f}",
+             '-i', self.clip['src'], '-vn', '-ac', str(CHANNELS), '-ar', str(SAMPLE_RATE), '-f', 'f32le', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+
+    def read(self, count: int) -> np.ndarray:
+        """The next `count` frames with the envelope applied; zero-padded past the end of the source."""
+        if self._proc is None:
+            self.open()
+        data = self._proc.stdout.read(count * FRAME_BYTES)
+        samples = np.zeros((count, CHANNELS), dtype=np.float32)
+        got = len(data) // FRAME_BYTES
+        if got:
+            samples[:got] = np.frombuffer(data[:got * FRAME_BYTES], dtype=np.float32).reshape(got, CHANNELS)
+        samples *= _envelope(self.gain, self.fade_in, self.fade_out, self.length, self.position, count)[:, None]
+        self.position += count
+        return samples
+
+    def close(self, check: bool = True) -> None:
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        proc.stdout.close()
+        if proc.poll() is None:
+            # -t rounding can leave a few samples unread
+            proc.kill()
+            proc.wait()
+        elif check and proc.returncode != 0:
+            raise AudioError(f"ffmpeg failed to decode audio from {self.clip['src']}")
+
+
+def mix_audio(tracks: List[Dict[str, Any]], duration: float, codec: List[str], output: str) -> None:
+    """Mix every audio clip into `output` (Matroska) with the given codec args. Runs in a pool worker."""
+    streams = sorted(
+        (ClipStream(clip) for track in tracks if track.get('type') == 'audio' for clip in track.get('clips', [])),
+        key=lambda stream: stream.start,
+    )
+    total = round(duration * SAMPLE_RATE)
+    with tempfile.TemporaryFile() as log:
+        encoder = subprocess.Popen(
+            [FFMPEG_BIN, '-hide_banner', '-nostdin', '-y', '-v', 'error',
+             '-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', str(CHANNELS), '-i', 'pipe:0',
+             *codec, '-f', 'matroska', output],
+            stdin=subprocess.PIPE, stderr=log,
+        )
+        active: List[ClipStream] = []
+        upcoming = iter(streams)
+        pending = next(upcoming, None)
+        try:
+            block = np.zeros((BLOCK_FRAMES, CHANNELS), dtype=np.float32)
+            for block_start in range(0, total, BLOCK_FRAMES):
+                block_end = min(total, block_start + BLOCK_FRAMES)
+                while pending is not None and pending.start < block_end:
+                    active.append(pending)
+                    pending = next(upcoming, None)
+
+                mix = block[:block_end - block_start]
+                mix.fill(0)
+                for stream in active:
+                    first = max(block_start, stream.start)
+                    last = min(block_end, stream.end)
+                    if last > first:
+                        mix[first - block_start:last - block_start] += stream.read(last - first)
+                for stream in [s for s in active if s.end <= block_end]:
+                    stream.close()
+                    active.remove(stream)
+
+                np.clip(mix, -1.0, 1.0, out=mix)
+                encoder.stdin.write(mix.tobytes())
+            encoder.stdin.close()
+        except BrokenPipeError:
+            # The encoder died; its exit status is reported below
+            pass
+        except BaseException:
+            encoder.kill()
+            encoder.wait()
+            raise
+        finally:
+            for stream in active:
+                stream.close(check=False)
+
+        if encoder.wait() != 0:
+            log.seek(0)
+            tail = log.read().decode('utf-8', 'replace')[-2000:]
+            raise AudioError(f"Audio encoder exited with {encoder.returncode}: {tail}")
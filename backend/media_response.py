@@ -0,0 +1,81 @@
+"""Byte-range file responses for media playback and scrubbing.
+
+Only the requested range is read. When the ASGI server offers the
+`http.response.zerocopysend` extension the bytes go out via sendfile;
+otherwise they are streamed in small blocks. For deployments behind nginx
+the file can be handed off entirely with `X-Accel-Redirect`.
+"""
+from typing import Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+STREAM_CHUNK_BYTES = 256 * 1024
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into an inclusive (start, end).
+
+    Returns None when the whole file should be sent (no header, or a
+    multi-range request) and raises ValueError when the range cannot be
+    satisfied.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(0, size - int(last))
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFileResponse(Response):
+    def __init__(self, path: str, size: int, byte_range: Optional[Tuple[int, int]], headers: dict,
+                 media_type: str, send_body: bool = True):
+        self.path = path
+        self.start, self.end = byte_range if byte_range else (0, size - 1)
+        self.send_body = send_body
+        status_code = 206 if byte_range else 200
+        headers = dict(headers, **{'Accept-Ranges': 'bytes', 'Content-Length': str(self.end - self.start + 1)})
+        if byte_range:
+            headers['Content-Range'] = f"bytes {self.start}-{self.end}/{size}"
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        remaining = self.end - self.start + 1
+        if not self.send_body or remaining <= 0:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        if 'http.response.zerocopysend' in scope.get('extensions', {}):
+            with open(self.path, 'rb') as f:
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': f.fileno(),
+                    'offset': self.start,
+                    'count': remaining,
+                })
+            return
+
+        async with await anyio.open_file(self.path, 'rb') as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(STREAM_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+        if remaining > 0:
+            await send({'type': 'http.response.body', 'body': b''})
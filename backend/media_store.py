@@ -0,0 +1,147 @@
+"""Content-addressed media storage with resumable chunked uploads.
+
+Upload chunks are streamed straight onto a partial file while a SHA-256 is
+updated incrementally, so a multi-GB file is never held in memory. Any
+worker process may take the next chunk; a worker whose running hash is
+behind reads back only the bytes the others appended. A finished
+upload is moved to `blobs/<digest[:2]>/<digest>`; if that blob already exists
+the partial is dropped and the existing copy is shared.
+"""
+import fcntl
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+# Bytes gathered from the request stream before each disk write
+WRITE_BUFFER_BYTES = 1024 * 1024
+# Running hashes of uploads idle this long are dropped; a resumed upload rebuilds its hash from disk
+HASHER_IDLE_SECONDS = 3600
+
+
+class UploadError(Exception):
+    pass
+
+
+class MediaStore:
+    def __init__(self, root: Path):
+        self.root = root
+        self.partial_dir = root / 'partial'
+        self.blob_dir = root / 'blobs'
+        self._hashers: Dict[str, 'hashlib._Hash'] = {}
+        self._hashed: Dict[str, int] = {}
+        self._used: Dict[str, float] = {}
+
+    def start(self) -> None:
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+
+    def partial_path(self, upload_id: str) -> Path:
+        return self.partial_dir / upload_id
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def is_blob(self, path: str) -> bool:
+        """Whether `path` names a stored blob, and nothing outside the store."""
+        if not os.path.isabs(path):
+            return False
+        resolved = Path(path).resolve()
+        return resolved.parent.parent == self.blob_dir.resolve() and resolved.is_file()
+
+    def create(self, upload_id: str) -> None:
+        self.partial_path(upload_id).touch()
+
+    def offset(self, upload_id: str) -> int:
+        """Bytes received so far; the partial file on disk is the source of truth."""
+        path = self.partial_path(upload_id)
+        return path.stat().st_size if path.exists() else 0
+
+    def _hasher(self, upload_id: str, offset: int):
+        """The running hash of the first `offset` bytes of an upload."""
+        hasher = self._hashers.get(upload_id)
+        hashed = self._hashed.get(upload_id, 0)
+        if hasher is None or hashed > offset:
+            # Lost after a restart or an idle sweep: rebuild from disk
+            hasher, hashed = hashlib.sha256(), 0
+        if hashed < offset:
+            # The partial only ever grows, so just hash what other workers appended
+            with open(self.partial_path(upload_id), 'rb') as f:
+                f.seek(hashed)
+                for block in iter(lambda: f.read(min(WRITE_BUFFER_BYTES, offset - f.tell())), b''):
+                    hasher.update(block)
+        self._hashers[upload_id] = hasher
+        self._hashed[upload_id] = offset
+        self._used[upload_id] = time.monotonic()
+        return hasher
+
+    def sweep(self, max_idle: float = HASHER_IDLE_SECONDS) -> None:
+        """Forget running hashes of uploads that have gone quiet (abandoned, or finished by another worker)."""
+        cutoff = time.monotonic() - max_idle
+        for upload_id in [upload_id for upload_id, used in self._used.items() if used < cutoff]:
+            self.discard(upload_id, remove_partial=False)
+
+    async def append(self, upload_id: str, offset: int, size: int, stream: AsyncIterator[bytes]) -> int:
+        """Append one chunk at `offset`; returns the new offset.
+
+        Bytes that did reach the disk before a dropped connection are kept, so
+        the client can resume from the returned (or next HEAD) offset.
+        """
+        with open(self.partial_path(upload_id), 'ab') as f:
+            try:
+                # flock covers every worker process; a second writer is turned away rather than queued
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError("Another request is already appending to this upload")
+            current = self.offset(upload_id)
+            if offset != current:
+                raise UploadError(f"Expected offset {current}, got {offset}")
+            self.sweep()
+            hasher = await run_in_threadpool(self._hasher, upload_id, current)
+
+            def write(data):
+                f.write(data)
+                hasher.update(data)
+                self._hashed[upload_id] += len(data)
+                self._used[upload_id] = time.monotonic()
+
+            buffer = bytearray()
+            received = current
+            try:
+                async for data in stream:
+                    received += len(data)
+                    if received > size:
+                        raise UploadError("Chunk runs past the declared upload size")
+                    buffer += data
+                    if len(buffer) >= WRITE_BUFFER_BYTES:
+                        await run_in_threadpool(write, bytes(buffer))
+                        buffer.clear()
+            finally:
+                if buffer:
+                    await run_in_threadpool(write, bytes(buffer))
+        return self.offset(upload_id)
+
+    async def finalize(self, upload_id: str) -> Tuple[str, bool]:
+        """Move a complete upload into the blob store; returns (digest, deduplicated)."""
+        hasher = await run_in_threadpool(self._hasher, upload_id, self.offset(upload_id))
+        digest = hasher.hexdigest()
+        partial = self.partial_path(upload_id)
+        blob = self.blob_path(digest)
+        deduplicated = blob.exists()
+        if deduplicated:
+            partial.unlink()
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(partial, blob)
+        self.discard(upload_id, remove_partial=False)
+        return digest, deduplicated
+
+    def discard(self, upload_id: str, remove_partial: bool = True) -> None:
+        self._hashers.pop(upload_id, None)
+        self._hashed.pop(upload_id, None)
+        self._used.pop(upload_id, None)
+        if remove_partial:
+            self.partial_path(upload_id).unlink(missing_ok=True)
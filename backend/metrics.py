@@ -0,0 +1,128 @@
+"""Prometheus instrumentation.
+
+Request latency and in-flight counts come from an ASGI middleware, labelled
+by route template rather than raw path so ids don't explode the series
+count. Every MongoDB command is timed by a pymongo command listener, which
+sees what Motor actually sends (`insert_one` is an `insert`, a cursor is a
+`find` plus `getMore`s). Queue depth, worker utilization, cache hit ratios
+and encode rate are read from the live objects when Prometheus scrapes, so
+they cost nothing on the hot path.
+
+When several worker processes serve the app, set PROMETHEUS_MULTIPROC_DIR
+(to an empty directory) so that request and Mongo metrics are summed over
+every worker; the live gauges are then those of the worker that answered.
+"""
+import os
+import time
+from typing import Any, Dict, List
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from pymongo import monitoring
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to handle an API request, by route template',
+    ['method', 'route', 'status'],
+)
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'API requests currently being handled', multiprocess_mode='livesum')
+MONGO_LATENCY = Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command round trip time',
+    ['command'], buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+MONGO_FAILURES = Counter('mongo_command_failures_total', 'MongoDB commands that failed', ['command'])
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Pass as `event_listeners=[...]` to the Motor client."""
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event) -> None:
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(event.command_name).inc()
+
+
+class MetricsMiddleware:
+    """Records REQUEST_LATENCY and REQUESTS_IN_FLIGHT for every HTTP request.
+
+    Streaming responses (SSE, media) are timed until their last byte, so
+    their route labels are best read separately.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            REQUEST_LATENCY.labels(scope['method'], route, str(status)).observe(time.perf_counter() - start)
+
+
+class StatsCollector:
+    """Gauges for the render engine and caches, read from their `stats()` at scrape time."""
+
+    def __init__(self, engine, caches: Dict[str, Any]):
+        self.engine = engine
+        self.caches = caches
+
+    def collect(self):
+        stats = self.engine.stats()
+        yield GaugeMetricFamily('render_queue_depth', 'Export jobs waiting for a dispatcher', value=stats['queued_jobs'])
+        yield GaugeMetricFamily('render_jobs_running', 'Export jobs being rendered', value=stats['running_jobs'])
+        yield GaugeMetricFamily('render_tasks_waiting', 'Pool tasks waiting for a free worker', value=stats['waiting_tasks'])
+        yield GaugeMetricFamily('render_workers', 'Render pool size', value=stats['workers'])
+        yield GaugeMetricFamily('render_workers_busy', 'Render pool workers in use', value=stats['busy_workers'])
+        yield GaugeMetricFamily('render_worker_utilization', 'Fraction of render pool workers in use', value=stats['utilization'])
+        yield GaugeMetricFamily('render_encode_fps', 'Frames per second encoded across running exports', value=stats['encode_fps'])
+
+        hit_ratio = GaugeMetricFamily('cache_hit_ratio', 'Hits over lookups since startup', labels=['cache'])
+        entries = GaugeMetricFamily('cache_entries', 'Entries held', labels=['cache'])
+        for name, cache in self.caches.items():
+            cache_stats = cache.stats()
+            hit_ratio.add_metric([name], cache_stats['hit_ratio'])
+            entries.add_metric([name], cache_stats['entries'])
+        yield hit_ratio
+        yield entries
+
+
+_live_collectors: List[Any] = []
+
+
+def register_collector(collector) -> None:
+    """Register a collector of this process's live state."""
+    REGISTRY.register(collector)
+    _live_collectors.append(collector)
+
+
+def latest_metrics():
+    """(body, content type) of every metric in the text exposition format."""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _live_collectors:
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
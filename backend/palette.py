@@ -0,0 +1,143 @@
+"""Palette generation for GIF exports.
+
+A GIF frame can only use 256 colours, so every export segment gets its own
+palette, built from a low-rate, downscaled sample of that segment rather
+than from every output frame. Sampled frames are streamed from an ffmpeg
+pipe in batches and folded into a colour histogram (5 bits per channel) with
+`bincount`, so the sample is never held in memory. The histogram is split
+into 256 boxes by a weighted median cut and polished with a few vectorized
+k-means passes. The dithering itself is left to ffmpeg's `paletteuse`,
+which streams one frame at a time.
+"""
+import subprocess
+import tempfile
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+PALETTE_COLORS = 256
+# Histogram resolution per channel
+HIST_BITS = 5
+# Sampled frames per NumPy batch
+BATCH_FRAMES = 32
+# k-means passes over the median cut, and histogram cells per distance chunk
+REFINE_ITERATIONS = 2
+REFINE_CHUNK = 4096
+
+
+class PaletteError(Exception):
+    pass
+
+
+def frame_batches(stream, width: int, height: int, batch: int = BATCH_FRAMES) -> Iterator[np.ndarray]:
+    frame_bytes = width * height * 3
+    while True:
+        data = stream.read(frame_bytes * batch)
+        count = len(data) // frame_bytes
+        if not count:
+            return
+        yield np.frombuffer(data[:count * frame_bytes], dtype=np.uint8).reshape(count * width * height, 3)
+
+
+def color_histogram(batches: Iterable[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pixel counts and per-channel sums for each histogram cell of (n, 3) uint8 pixel batches."""
+    cells = 1 << (3 * HIST_BITS)
+    shift = 8 - HIST_BITS
+    counts = np.zeros(cells, dtype=np.int64)
+    sums = np.zeros((cells, 3))
+    for pixels in batches:
+        q = (pixels >> shift).astype(np.intp)
+        index = (q[:, 0] << (2 * HIST_BITS)) | (q[:, 1] << HIST_BITS) | q[:, 2]
+        counts += np.bincount(index, minlength=cells)
+        for channel in range(3):
+            sums[:, channel] += np.bincount(index, weights=pixels[:, channel], minlength=cells)
+    return counts, sums
+
+
+def _box_score(colors: np.ndarray, weights: np.ndarray, box: np.ndarray) -> float:
+    if len(box) < 2:
+        return 0.0
+    return float(weights[box].sum() * np.ptp(colors[box], axis=0).max())
+
+
+def median_cut(colors: np.ndarray, weights: np.ndarray, size: int) -> np.ndarray:
+    """Split weighted (n, 3) colours into at most `size` boxes; returns their weighted means."""
+    boxes = [np.arange(len(colors))]
+    scores = [_box_score(colors, weights, boxes[0])]
+    while len(boxes) < size:
+        # Split the box with the most pixels times colour spread
+        index = int(np.argmax(scores))
+        if scores[index] <= 0:
+            break
+        box = boxes.pop(index)
+        scores.pop(index)
+        members = colors[box]
+        channel = int(np.ptp(members, axis=0).argmax())
+        order = box[np.argsort(members[:, channel], kind='stable')]
+        cumulative = np.cumsum(weights[order])
+        cut = int(np.searchsorted(cumulative, cumulative[-1] / 2)) + 1
+        cut = min(max(cut, 1), len(order) - 1)
+        for half in (order[:cut], order[cut:]):
+            boxes.append(half)
+            scores.append(_box_score(colors, weights, half))
+    return np.array([np.average(colors[box], axis=0, weights=weights[box]) for box in boxes])
+
+
+def _nearest(colors: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    norms = (palette ** 2).sum(axis=1)
+    nearest = np.empty(len(colors), dtype=np.intp)
+    for first in range(0, len(colors), REFINE_CHUNK):
+        chunk = colors[first:first + REFINE_CHUNK]
+        # |c - p|^2 without the |c|^2 term, which doesn't change the argmin
+        nearest[first:first + REFINE_CHUNK] = (norms - 2 * chunk @ palette.T).argmin(axis=1)
+    return nearest
+
+
+def refine(colors: np.ndarray, weights: np.ndarray, palette: np.ndarray, iterations: int = REFINE_ITERATIONS) -> np.ndarray:
+    """Weighted k-means (Lloyd) passes starting from `palette`."""
+    palette = palette.copy()
+    for _ in range(iterations):
+        nearest = _nearest(colors, palette)
+        totals = np.bincount(nearest, weights=weights, minlength=len(palette))
+        used = totals > 0
+        for channel in range(3):
+            sums = np.bincount(nearest, weights=weights * colors[:, channel], minlength=len(palette))
+            palette[used, channel] = sums[used] / totals[used]
+    return palette
+
+
+def quantize(counts: np.ndarray, sums: np.ndarray, size: int = PALETTE_COLORS) -> np.ndarray:
+    """A (size, 3) uint8 palette for a colour histogram, padded with its last colour."""
+    cells = np.flatnonzero(counts)
+    if not len(cells):
+        return np.zeros((size, 3), dtype=np.uint8)
+    weights = counts[cells].astype(np.float64)
+    colors = sums[cells] / weights[:, None]
+    if len(cells) <= size:
+        palette = colors
+    else:
+        palette = refine(colors, weights, median_cut(colors, weights, size))
+    palette = np.clip(np.rint(palette), 0, 255).astype(np.uint8)
+    return np.concatenate([palette, np.repeat(palette[-1:], size - len(palette), axis=0)])
+
+
+def sample_palette(cmd: List[str], width: int, height: int) -> bytes:
+    """Run a command that writes rgb24 frames to stdout; returns their palette as 256 RGB triples. Runs in a pool worker."""
+    with tempfile.TemporaryFile() as log:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log)
+        try:
+            counts, sums = color_histogram(frame_batches(proc.stdout, width, height))
+        finally:
+            proc.stdout.close()
+        if proc.wait() != 0:
+            log.seek(0)
+            tail = log.read().decode('utf-8', 'replace')[-2000:]
+            raise PaletteError(f"ffmpeg exited with {proc.returncode}: {tail}")
+    return quantize(counts, sums).tobytes()
+
+
+def palette_frames(palettes: Sequence[bytes], starts: Sequence[float], frames: int, fps: float) -> bytes:
+    """One 16x16 rgb24 palette image per output frame, switching at each segment start."""
+    table = np.stack([np.frombuffer(palette, dtype=np.uint8) for palette in palettes])
+    index = np.searchsorted(np.asarray(starts), np.arange(frames) / fps + 1e-6, side='right') - 1
+    return table[np.clip(index, 0, len(table) - 1)].tobytes()
@@ -0,0 +1,124 @@
+"""ffprobe helpers for media metadata.
+
+These run ffprobe synchronously and are meant to be called inside a pool
+worker (see RenderEngine.run_in_pool), never on the event loop.
+"""
+import bisect
+import json
+import os
+import subprocess
+from typing import Any, Dict, List, Optional
+
+FFPROBE_BIN = os.environ.get('FFPROBE_BIN', 'ffprobe')
+
+
+class ProbeError(Exception):
+    pass
+
+
+def _ffprobe(args):
+    proc = subprocess.run([FFPROBE_BIN, '-v', 'error'] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise ProbeError(proc.stderr.decode('utf-8', 'replace')[-2000:])
+    return proc.stdout.decode('utf-8', 'replace')
+
+
+def probe_duration(src: str) -> float:
+    """Container duration in seconds, or 0 when it is unknown."""
+    out = _ffprobe(['-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', src])
+    try:
+        return float(out.strip())
+    except ValueError:
+        return 0.0
+
+
+def _rate(value: str) -> float:
+    num, _, den = value.partition('/')
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _rotation(stream: Dict[str, Any]) -> int:
+    """Clockwise display rotation in degrees, from the display matrix or the legacy rotate tag."""
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            # The display matrix angle is counter-clockwise
+            return int(-float(side_data['rotation'])) % 360
+    try:
+        return int(stream.get('tags', {}).get('rotate', 0)) % 360
+    except ValueError:
+        return 0
+
+
+def probe_media(src: str) -> Dict[str, Any]:
+    """Duration, container and first video/audio stream parameters in one ffprobe call."""
+    info = json.loads(_ffprobe(['-show_format', '-show_streams', '-show_data_hash', 'sha256', '-of', 'json', src]))
+    fmt = info.get('format', {})
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    try:
+        duration = float(fmt.get('duration', 0))
+    except ValueError:
+        duration = 0.0
+    result: Dict[str, Any] = {'duration': duration, 'format': fmt.get('format_name'), 'video': None, 'audio': None}
+    if video:
+        result['video'] = {
+            'codec': video.get('codec_name'),
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'fps': _rate(video.get('avg_frame_rate', '0/1')) or _rate(video.get('r_frame_rate', '0/1')),
+            'pix_fmt': video.get('pix_fmt'),
+            'rotation': _rotation(video),
+            # Smart cuts only copy sources whose headers match the export encoder's
+            'profile': video.get('profile'),
+            'level': video.get('level'),
+            'extradata_hash': video.get('extradata_hash'),
+        }
+    if audio:
+        result['audio'] = {
+            'codec': audio.get('codec_name'),
+            'channels': audio.get('channels'),
+            'layout': audio.get('channel_layout'),
+            'sample_rate': int(audio.get('sample_rate') or 0),
+        }
+    return result
+
+
+def probe_keyframes(src: str) -> List[float]:
+    """Sorted keyframe timestamps of the first video stream.
+
+    Reads packet flags only, so nothing is decoded.
+    """
+    out = _ffprobe([
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0', src,
+    ])
+    keyframes = []
+    for line in out.splitlines():
+        pts, _, flags = line.partition(',')
+        if 'K' in flags and pts not in ('', 'N/A'):
+            keyframes.append(round(float(pts), 6))
+    return sorted(set(keyframes))
+
+
+def index_media(src: str, probe: Dict[str, Any]) -> Dict[str, Any]:
+    """Stream parameters and keyframe index for a media file. Runs in a pool worker.
+
+    `probe` is the file's `probe_media` result, so only the packet scan runs here.
+    """
+    video = probe.get('video')
+    return {'video': video, 'keyframes': probe_keyframes(src) if video else []}
+
+
+def keyframe_before(keyframes: List[float], t: float) -> Optional[float]:
+    i = bisect.bisect_right(keyframes, t + 1e-6)
+    return keyframes[i - 1] if i else None
+
+
+def keyframe_after(keyframes: List[float], t: float) -> Optional[float]:
+    i = bisect.bisect_left(keyframes, t - 1e-6)
+    return keyframes[i] if i < len(keyframes) else None
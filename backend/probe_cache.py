@@ -0,0 +1,92 @@
+"""Media metadata probes, cached by content digest.
+
+A probe result never changes for a given digest, so it is kept in the
+`probes` collection and in an in-process LRU in front of it; a file is
+probed once, ever. Misses run ffprobe on a bounded thread pool (each thread
+only waits on its subprocess), so a bulk import probes many files at once
+without spawning an unbounded number of processes. Concurrent requests for
+one digest share a single probe.
+"""
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Tuple
+
+from probe import probe_media
+
+
+class ProbeCache:
+    def __init__(self, db, workers: int, max_entries: int = 4096):
+        self.collection = db.probes
+        self.workers = workers
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.probes = 0
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='probe')
+
+    async def create_indexes(self) -> None:
+        await self.collection.create_index('digest', unique=True)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _remember(self, digest: str, result: Dict[str, Any]) -> None:
+        self._memory[digest] = result
+        self._memory.move_to_end(digest)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, digest: str, src: str) -> Dict[str, Any]:
+        result = self._memory.get(digest)
+        if result is not None:
+            self._memory.move_to_end(digest)
+            self.memory_hits += 1
+            return result
+
+        # Shared by concurrent callers, and not cancelled when one of them is
+        pending = self._pending.get(digest)
+        if pending is None:
+            pending = self._pending[digest] = asyncio.ensure_future(self._probe(digest, src))
+        return await asyncio.shield(pending)
+
+    async def _probe(self, digest: str, src: str) -> Dict[str, Any]:
+        try:
+            doc = await self.collection.find_one({'digest': digest}, {'_id': 0, 'digest': 0})
+            if doc is not None:
+                self.db_hits += 1
+                result = doc
+            else:
+                self.probes += 1
+                result = await asyncio.get_running_loop().run_in_executor(self._pool, probe_media, src)
+                # Another worker may have raced us to it; both results are the same
+                await self.collection.update_one({'digest': digest}, {'$setOnInsert': result}, upsert=True)
+            self._remember(digest, result)
+            return result
+        finally:
+            del self._pending[digest]
+
+    async def get_many(self, items: Iterable[Tuple[str, str]]) -> Dict[str, Any]:
+        """Probe results (or exceptions) for (digest, src) pairs, keyed by digest."""
+        sources = dict(items)
+        missing = [digest for digest in sources if digest not in self._memory]
+        # One round trip for everything already known, then probe the rest in parallel
+        if missing:
+            async for doc in self.collection.find({'digest': {'$in': missing}}, {'_id': 0}):
+                self._remember(doc.pop('digest'), doc)
+        digests = list(sources)
+        results = await asyncio.gather(*(self.get(digest, sources[digest]) for digest in digests), return_exceptions=True)
+        return dict(zip(digests, results))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.db_hits + self.probes
+        return {
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'probes': self.probes,
+            'hit_ratio': (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            'entries': len(self._memory),
+            'workers': self.workers,
+        }
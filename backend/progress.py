@@ -0,0 +1,229 @@
+"""In-process progress broker for export and media processing jobs.
+
+Producers `publish` the latest snapshot for a topic (e.g. "export:<id>") as
+often as they like; that is just a dict assignment. A single ticker fans the
+snapshots that changed out to subscribers at a fixed rate, and each
+subscriber only ever holds the newest snapshot, so a slow client gets fewer
+updates instead of a growing backlog. Samplers registered with the broker
+run on the same tick to refresh progress that has to be read rather than
+pushed (such as ffmpeg progress files).
+
+A job runs in whichever server worker process accepted it, but its
+subscribers may be connected to another. With a `relay_dir` every broker
+writes the topics it publishes there on each tick, one small file per
+topic, and reads back the topics its subscribers follow but nobody in this
+process publishes, so every worker on the host sees the same progress.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Final snapshots kept so a late subscriber still learns how a job ended
+FINISHED_TOPICS = 1024
+# Relay files untouched for this many seconds are swept
+RELAY_TTL = 3600
+
+
+class _Subscription:
+    def __init__(self):
+        self._latest: Optional[Tuple[Dict[str, Any], bool]] = None
+        self._ready = asyncio.Event()
+
+    def put(self, snapshot: Dict[str, Any], final: bool) -> None:
+        self._latest = (snapshot, final)
+        self._ready.set()
+
+    async def get(self) -> Tuple[Dict[str, Any], bool]:
+        await self._ready.wait()
+        self._ready.clear()
+        return self._latest
+
+
+class ProgressBroker:
+    def __init__(self, rate: float, relay_dir: Optional[Path] = None):
+        self.interval = 1 / rate
+        self.relay_dir = relay_dir
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._finished: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._subscribers: Dict[str, Set[_Subscription]] = {}
+        self._samplers: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        # Topics published in this process; subscribers to any other topic follow its relay file
+        self._owned: Set[str] = set()
+        # topic -> relay file contents last read, so unchanged files are skipped
+        self._relayed: Dict[str, bytes] = {}
+        self._next_sweep = 0.0
+
+    def start(self) -> None:
+        if self.relay_dir is not None:
+            self.relay_dir.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def add_sampler(self, sampler: Callable[[], None]) -> None:
+        self._samplers.append(sampler)
+
+    def publish(self, topic: str, snapshot: Dict[str, Any], final: bool = False) -> None:
+        self._owned.add(topic)
+        if final:
+            self._latest.pop(topic, None)
+            self._finished[topic] = snapshot
+            self._finished.move_to_end(topic)
+            while len(self._finished) > FINISHED_TOPICS:
+                self._finished.popitem(last=False)
+        else:
+            # A finished topic can start again, e.g. media being reprocessed
+            self._finished.pop(topic, None)
+            self._latest[topic] = snapshot
+        self._dirty.add(topic)
+
+    def latest(self, topic: str) -> Optional[Dict[str, Any]]:
+        """The newest snapshot for `topic`, from this process or any other on the relay."""
+        snapshot = self._latest.get(topic) or self._finished.get(topic)
+        if snapshot is None and topic not in self._owned:
+            relayed = self._read_relay(topic)
+            if relayed is not None:
+                snapshot = relayed[1]
+        return snapshot
+
+    async def subscribe(self, topic: str, keepalive: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield snapshots for `topic` until it finishes; yields None after `keepalive` idle seconds."""
+        if self.relay_dir is not None and topic not in self._owned and topic not in self._subscribers:
+            self._poll_relay(topic)
+        if topic in self._finished:
+            yield self._finished[topic]
+            return
+        subscription = _Subscription()
+        if topic in self._latest:
+            subscription.put(self._latest[topic], False)
+        self._subscribers.setdefault(topic, set()).add(subscription)
+        try:
+            while True:
+                try:
+                    snapshot, final = await asyncio.wait_for(subscription.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield snapshot
+                if final:
+                    return
+        finally:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+                    if topic not in self._owned:
+                        # Followed from the relay; nothing here keeps it current any more
+                        self._latest.pop(topic, None)
+                        self._relayed.pop(topic, None)
+
+    def _relay_path(self, topic: str) -> Path:
+        # Topics carry ids from request paths, so they never become file names directly
+        return self.relay_dir / f"{hashlib.sha1(topic.encode()).hexdigest()}.json"
+
+    def _write_relay(self, topic: str) -> None:
+        final = topic in self._finished
+        snapshot = self._finished[topic] if final else self._latest.get(topic)
+        if snapshot is None:
+            return
+        path = self._relay_path(topic)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_text(json.dumps({'snapshot': snapshot, 'final': final}, default=str))
+        os.replace(tmp, path)
+
+    def _read_relay(self, topic: str) -> Optional[Tuple[bytes, Dict[str, Any], bool]]:
+        if self.relay_dir is None:
+            return None
+        try:
+            data = self._relay_path(topic).read_bytes()
+            entry = json.loads(data)
+        except (FileNotFoundError, ValueError):
+            # Not relayed (yet), or caught between write and rename on a non-POSIX filesystem
+            return None
+        return data, entry['snapshot'], entry['final']
+
+    def _poll_relay(self, topic: str) -> bool:
+        """Take in another process's latest snapshot for `topic`; False if it has not changed."""
+        relayed = self._read_relay(topic)
+        if relayed is None or relayed[0] == self._relayed.get(topic):
+            return False
+        data, snapshot, final = relayed
+        if final:
+            self._latest.pop(topic, None)
+            self._relayed.pop(topic, None)
+            self._finished[topic] = snapshot
+            self._finished.move_to_end(topic)
+            while len(self._finished) > FINISHED_TOPICS:
+                self._finished.popitem(last=False)
+        else:
+            self._finished.pop(topic, None)
+            self._latest[topic] = snapshot
+            self._relayed[topic] = data
+        return True
+
+    def _sweep_relay(self) -> None:
+        cutoff = time.time() - RELAY_TTL
+        with os.scandir(self.relay_dir) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+
+    def _flush(self) -> None:
+        for sampler in self._samplers:
+            try:
+                sampler()
+            except Exception as e:
+                logger.warning("Progress sampler failed: %s", e)
+        if self.relay_dir is not None:
+            followed = [topic for topic in self._subscribers if topic not in self._owned and topic not in self._finished]
+            self._dirty.update(topic for topic in followed if self._poll_relay(topic))
+        dirty, self._dirty = self._dirty, set()
+        for topic in dirty:
+            if self.relay_dir is not None and topic in self._owned:
+                try:
+                    self._write_relay(topic)
+                except OSError as e:
+                    logger.warning("Relaying progress for %s failed: %s", topic, e)
+            if topic in self._finished:
+                self._owned.discard(topic)
+            subscribers = self._subscribers.get(topic)
+            if not subscribers:
+                continue
+            final = topic in self._finished
+            snapshot = self._finished[topic] if final else self._latest.get(topic)
+            if snapshot is None:
+                continue
+            for subscription in subscribers:
+                subscription.put(snapshot, final)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self._flush()
+            if self.relay_dir is not None and time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + RELAY_TTL / 10
+                try:
+                    self._sweep_relay()
+                except OSError as e:
+                    logger.warning("Sweeping progress relay failed: %s", e)
@@ -0,0 +1,279 @@
+"""Server-side projects stored as a snapshot plus an op log.
+
+Clients send small edit ops (move a clip, trim it, set an effect) tagged with
+the version they were made against. Each accepted batch is one small document
+in `project_ops` with a unique (project_id, version), which gives optimistic
+concurrency across workers without rewriting the project. The op log is
+periodically folded back into the snapshot on the `projects` document.
+"""
+import asyncio
+import copy
+import logging
+import math
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from audio import AudioError, audio_levels
+from effects import EffectError, compile_stack
+
+logger = logging.getLogger(__name__)
+
+# Fold the op log into the snapshot once this many versions have piled up
+COMPACT_AFTER_OPS = 50
+
+# Clip fields an op may change; ids and types are fixed at creation
+CLIP_FIELDS = {
+    'start', 'duration', 'trimStart', 'name', 'src', 'mediaId',
+    'filter', 'adjustments', 'effects', 'audioEffects', 'transition',
+    'text', 'color', 'font',
+}
+PROJECT_FIELDS = {'name', 'zoom', 'currentTime'}
+# Fields that must be finite numbers wherever an op sets them
+NUMBER_FIELDS = {'start', 'duration', 'trimStart', 'zoom', 'currentTime'}
+# Fields that together make up a clip's effect stack (see effects.compile_stack)
+EFFECT_FIELDS = {'filter', 'adjustments', 'effects'}
+
+
+class PatchError(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    def __init__(self, version: int):
+        super().__init__(f"Project is at version {version}")
+        self.version = version
+
+
+def empty_state(name: str) -> Dict[str, Any]:
+    # Mirrors `initialProject` in App.js
+    return {
+        'name': name,
+        'currentTime': 0,
+        'duration': 0,
+        'zoom': 1,
+        'tracks': [
+            {'id': 'video-track-1', 'type': 'video', 'clips': []},
+            {'id': 'audio-track-1', 'type': 'audio', 'clips': []},
+            {'id': 'text-track-1', 'type': 'text', 'clips': []},
+        ],
+    }
+
+
+def _find_clip(state: Dict[str, Any], clip_id: str) -> Tuple[Dict[str, Any], int]:
+    for track in state['tracks']:
+        for index, clip in enumerate(track['clips']):
+            if clip['id'] == clip_id:
+                return track, index
+    raise PatchError(f"Unknown clip: {clip_id}")
+
+
+def _find_track(state: Dict[str, Any], track_id: str) -> Dict[str, Any]:
+    for track in state['tracks']:
+        if track['id'] == track_id:
+            return track
+    raise PatchError(f"Unknown track: {track_id}")
+
+
+def _number(name: str, value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise PatchError(f"{name} must be a number")
+    return value
+
+
+def _check_values(fields: Dict[str, Any]) -> None:
+    for name in NUMBER_FIELDS & fields.keys():
+        _number(name, fields[name])
+    stack = {name: fields[name] for name in EFFECT_FIELDS & fields.keys()}
+    if stack:
+        # A stack the renderer can't compile would break every export and frame of the project
+        try:
+            compile_stack(stack)
+        except EffectError as e:
+            raise PatchError(str(e))
+    if 'audioEffects' in fields:
+        try:
+            audio_levels(fields['audioEffects'])
+        except AudioError as e:
+            raise PatchError(str(e))
+
+
+def _check_fields(fields: Any, allowed) -> None:
+    if not isinstance(fields, dict):
+        raise PatchError("set must be an object")
+    unknown = set(fields) - allowed
+    if unknown:
+        raise PatchError(f"Cannot set {', '.join(sorted(unknown))}")
+    _check_values(fields)
+
+
+def apply_op(state: Dict[str, Any], op: Dict[str, Any]) -> None:
+    """Apply one op to `state` in place."""
+    kind = op.get('op')
+    if kind == 'add_clip':
+        track = _find_track(state, op['trackId'])
+        clip = op['clip']
+        if not isinstance(clip, dict) or not {'id', 'start', 'duration'} <= clip.keys():
+            raise PatchError("A clip needs id, start and duration")
+        _check_values(clip)
+        track['clips'].append({'type': track['type'], **clip})
+    elif kind == 'remove_clip':
+        track, index = _find_clip(state, op['clipId'])
+        del track['clips'][index]
+    elif kind == 'move_clip':
+        track, index = _find_clip(state, op['clipId'])
+        clip = track['clips'][index]
+        clip['start'] = max(0, _number('start', op['start']))
+        if op.get('trackId') and op['trackId'] != track['id']:
+            target = _find_track(state, op['trackId'])
+            if target['type'] != track['type']:
+                raise PatchError("Clips can only move between tracks of the same type")
+            target['clips'].append(track['clips'].pop(index))
+    elif kind == 'update_clip':
+        # Trims, effects, text edits
+        track, index = _find_clip(state, op['clipId'])
+        _check_fields(op['set'], CLIP_FIELDS)
+        track['clips'][index].update(op['set'])
+    elif kind == 'set':
+        _check_fields(op['set'], PROJECT_FIELDS)
+        state.update(op['set'])
+    else:
+        raise PatchError(f"Unknown op: {kind}")
+
+
+def apply_ops(state: Dict[str, Any], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply a batch to a copy of `state`; the batch is all-or-nothing."""
+    state = copy.deepcopy(state)
+    for op in ops:
+        try:
+            apply_op(state, op)
+        except KeyError as e:
+            raise PatchError(f"{op.get('op')} is missing {e}")
+        except (TypeError, ValueError) as e:
+            # Anything the checks above let through is still the client's mistake
+            raise PatchError(f"Invalid {op.get('op')}: {e}")
+    state['duration'] = max(
+        (clip['start'] + clip['duration'] for track in state['tracks'] for clip in track['clips']),
+        default=0,
+    )
+    return state
+
+
+class ProjectStore:
+    def __init__(self, db, cache_size: int = 256):
+        self.db = db
+        self.cache_size = cache_size
+        # project id -> (version, state); saves replaying the op log on every patch
+        self._states: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._compacting: set = set()
+
+    async def create_indexes(self) -> None:
+        await self.db.projects.create_index('id', unique=True)
+        await self.db.project_ops.create_index([('project_id', 1), ('version', 1)], unique=True)
+
+    async def create(self, project_id: str, name: str, state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        state = apply_ops(state or empty_state(name), [])
+        doc = {
+            'id': project_id,
+            'name': state['name'],
+            'version': 0,
+            'snapshot_version': 0,
+            'snapshot': state,
+            'updated_at': datetime.utcnow(),
+        }
+        await self.db.projects.insert_one(doc)
+        self._remember(project_id, 0, state)
+        return {'id': project_id, 'version': 0, 'state': state}
+
+    def _remember(self, project_id: str, version: int, state: Dict[str, Any]) -> None:
+        self._states[project_id] = (version, state)
+        self._states.move_to_end(project_id)
+        while len(self._states) > self.cache_size:
+            self._states.popitem(last=False)
+
+    async def load(self, project_id: str) -> Tuple[int, Dict[str, Any]]:
+        """Snapshot plus any later ops."""
+        doc = await self.db.projects.find_one({'id': project_id}, {'_id': 0})
+        if doc is None:
+            raise KeyError(project_id)
+        version, state = doc['snapshot_version'], doc['snapshot']
+        cached = self._states.get(project_id)
+        if cached is not None and cached[0] >= version:
+            version, state = cached
+        ops = self.db.project_ops.find({'project_id': project_id, 'version': {'$gt': version}}).sort('version', 1)
+        async for entry in ops:
+            state = apply_ops(state, entry['ops'])
+            version = entry['version']
+        self._remember(project_id, version, state)
+        return version, state
+
+    async def patch(self, project_id: str, base_version: int, ops: List[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+        cached = self._states.get(project_id)
+        if cached is not None and cached[0] == base_version:
+            version, state = cached
+        else:
+            # Another worker may have moved on; the op log is authoritative
+            version, state = await self.load(project_id)
+        if version != base_version:
+            raise VersionConflict(version)
+
+        new_state = apply_ops(state, ops)
+        try:
+            await self.db.project_ops.insert_one({
+                'project_id': project_id,
+                'version': version + 1,
+                'ops': ops,
+                'created_at': datetime.utcnow(),
+            })
+        except DuplicateKeyError:
+            self._states.pop(project_id, None)
+            raise VersionConflict(version + 1)
+        await self.db.projects.update_one(
+            {'id': project_id},
+            {'$max': {'version': version + 1}, '$set': {'updated_at': datetime.utcnow()}},
+        )
+        self._remember(project_id, version + 1, new_state)
+
+        doc_version = version + 1
+        if doc_version % COMPACT_AFTER_OPS == 0:
+            self.compact_soon(project_id)
+        return doc_version, new_state
+
+    async def ops_since(self, project_id: str, version: int) -> Optional[List[Dict[str, Any]]]:
+        """Op batches after `version`, or None if they were compacted away and the client must reload."""
+        doc = await self.db.projects.find_one({'id': project_id}, {'snapshot_version': 1})
+        if doc is None:
+            raise KeyError(project_id)
+        if version < doc['snapshot_version']:
+            return None
+        cursor = self.db.project_ops.find(
+            {'project_id': project_id, 'version': {'$gt': version}}, {'_id': 0, 'project_id': 0},
+        ).sort('version', 1)
+        return await cursor.to_list(None)
+
+    def compact_soon(self, project_id: str) -> None:
+        if project_id not in self._compacting:
+            self._compacting.add(project_id)
+            task = asyncio.create_task(self.compact(project_id))
+            task.add_done_callback(lambda _: self._compacting.discard(project_id))
+
+    async def compact(self, project_id: str) -> None:
+        """Write the current state as the snapshot and drop the ops it covers."""
+        try:
+            version, state = await self.load(project_id)
+            result = await self.db.projects.update_one(
+                {'id': project_id, 'snapshot_version': {'$lt': version}},
+                {'$set': {'snapshot': state, 'snapshot_version': version, 'name': state['name']}},
+            )
+            if result.modified_count:
+                await self.db.project_ops.delete_many({'project_id': project_id, 'version': {'$lte': version}})
+        except Exception as e:
+            logger.warning("Compacting project %s failed: %s", project_id, e)
+
+    async def compact_all(self) -> None:
+        """Sweep projects with ops not yet folded into their snapshot."""
+        query = {'$expr': {'$gt': ['$version', '$snapshot_version']}}
+        async for doc in self.db.projects.find(query, {'id': 1}):
+            await self.compact(doc['id'])
@@ -0,0 +1,35 @@
+"""Low-resolution editing proxies for smooth preview playback.
+
+Proxies are short-GOP 360p H.264 so the preview can seek and decode cheaply
+on weak machines. They are only ever used for preview; exports always read
+the original media. The transcode can also feed a second, raw output to an
+analysis pass (see `scenes`) so the source is only decoded once.
+"""
+from typing import List, Optional
+
+from render import FFMPEG_BIN
+
+PROXY_HEIGHT = 360
+# Half-second GOP: near-instant seeks without the size of all-intra
+PROXY_GOP = 15
+
+
+def build_proxy_command(src: str, output: str, scan_filter: Optional[str] = None) -> List[str]:
+    """Transcode `src` to a proxy; with `scan_filter`, also write those frames as raw RGB to stdout."""
+    cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-y', '-v', 'error', '-i', src]
+    if scan_filter:
+        cmd += [
+            '-filter_complex', f"[0:v]split=2[proxy][scan];[proxy]scale=-2:{PROXY_HEIGHT}[pv];[scan]{scan_filter}[sv]",
+            '-map', '[pv]', '-map', '0:a?',
+        ]
+    else:
+        cmd += ['-vf', f"scale=-2:{PROXY_HEIGHT}"]
+    cmd += [
+        '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'fastdecode', '-crf', '28',
+        '-g', str(PROXY_GOP), '-keyint_min', str(PROXY_GOP), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '96k', '-ac', '2',
+        '-movflags', '+faststart', '-f', 'mp4', output,
+    ]
+    if scan_filter:
+        cmd += ['-map', '[sv]', '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1']
+    return cmd
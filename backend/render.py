@@ -0,0 +1,1145 @@
+"""Server-side timeline rendering.
+
+Exports are rendered by ffmpeg processes dispatched onto a bounded process
+pool. Jobs are queued per owner and served round-robin, so one user queueing
+many exports cannot starve everybody else.
+
+Each export is cut into segments at clip edges (or GOP-aligned intervals for
+long clips). Segments are encoded concurrently on the pool and joined with a
+stream-copy concat, so a single long export uses every core. Spans that are
+plain cuts of a source already in the export codec are stream-copied between
+keyframes instead, re-encoding only the head and tail around the cut. Encoded
+segments are kept in a content-addressed cache, so a re-export after a small
+edit only re-encodes the segments that changed. Audio is mixed in one
+streaming pass (see `audio`) and muxed in by the concat.
+
+HLS exports are the exception: the timeline is composited once and the
+frames are split between one encoder per rendition, so a ladder of N rungs
+costs one decode and N encodes rather than N full renders.
+
+GIFs are rendered in one pass at GIF_FPS, dithered against a palette per
+segment (see `palette`); the palettes come from a cheap sampling pass and
+are cached with the segments, so a re-export only samples what changed.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from audio import AudioError, audio_filter, clip_envelope, mix_audio
+from palette import palette_frames, sample_palette
+from effects import EffectError, compile_stack, ffmpeg_filter, has_effects
+from probe import keyframe_after, keyframe_before, probe_media
+from render_cache import SegmentCache, segment_key
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+
+# Output frame rate for every export
+EXPORT_FPS = 30
+
+# Keyframe interval; segment boundaries are aligned to it
+GOP_SECONDS = 2
+
+# Target length of a parallel-encoded segment, rounded to whole GOPs
+SEGMENT_SECONDS = float(os.environ.get('RENDER_SEGMENT_SECONDS', 10))
+
+# GIF frame rate; GIF timing is in centiseconds, and ffmpeg spreads the rounding
+GIF_FPS = 15
+# Palette sampling pass: frames per second and linear downscale of the export size
+PALETTE_SAMPLE_FPS = 2
+PALETTE_SAMPLE_SCALE = 4
+
+# Pool priorities: lower runs first. Background work only gets a worker
+# when no interactive work is waiting for one.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Mirrors `qualityPresets` in ExportPanel.js, plus the per-segment encoder settings
+QUALITY_PRESETS = {
+    'low': {'resolution': '480p', 'height': 480, 'bitrate': '1M', 'maxrate': '1500k', 'bufsize': '2M', 'preset': 'veryfast'},
+    'medium': {'resolution': '720p', 'height': 720, 'bitrate': '2M', 'maxrate': '3M', 'bufsize': '4M', 'preset': 'veryfast'},
+    'high': {'resolution': '1080p', 'height': 1080, 'bitrate': '5M', 'maxrate': '7500k', 'bufsize': '10M', 'preset': 'fast'},
+    'ultra': {'resolution': '4K', 'height': 2160, 'bitrate': '20M', 'maxrate': '30M', 'bufsize': '40M', 'preset': 'fast'},
+}
+
+# Mirrors `formatOptions` in ExportPanel.js
+FORMAT_OPTIONS = {
+    'mp4': {
+        'video': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-sc_threshold', '0'],
+        'audio': ['-c:a', 'aac', '-b:a', '192k'],
+        'extra': ['-movflags', '+faststart'],
+    },
+    'webm': {
+        'video': ['-c:v', 'libvpx-vp9', '-deadline', 'good', '-cpu-used', '4', '-row-mt', '1'],
+        'audio': ['-c:a', 'libopus', '-b:a', '128k'],
+        'extra': [],
+    },
+    'gif': {
+        'video': ['-c:v', 'gif'],
+        'audio': None,
+        'extra': ['-loop', '0'],
+    },
+    # Adaptive streaming: every rung of `renditions` from one composite (see build_ladder_command)
+    'hls': {
+        'video': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-sc_threshold', '0'],
+        'audio': ['-c:a', 'aac', '-b:a', '192k'],
+        'extra': [],
+        'ladder': True,
+    },
+}
+
+# HLS media segment length; whole GOPs, so every segment starts on a keyframe
+HLS_SEGMENT_SECONDS = 3 * GOP_SECONDS
+# Bits per second of the shared HLS audio rendition, for the master playlist
+HLS_AUDIO_BANDWIDTH = 192000
+
+
+class RenderError(Exception):
+    pass
+
+
+def frame_size(quality: str):
+    """16:9 frame size for a quality preset, rounded to even dimensions."""
+    height = QUALITY_PRESETS[quality]['height']
+    width = int(round(height * 16 / 9 / 2)) * 2
+    return width, height
+
+
+def track_clips(tracks: List[Dict[str, Any]], kind: str) -> List[Dict[str, Any]]:
+    """All clips of one track type in timeline order."""
+    clips = [clip for track in tracks if track.get('type') == kind for clip in track.get('clips', [])]
+    return sorted(clips, key=lambda clip: clip['start'])
+
+
+def timeline_duration(tracks: List[Dict[str, Any]]) -> float:
+    return max(
+        (clip['start'] + clip['duration'] for track in tracks for clip in track.get('clips', [])),
+        default=0.0,
+    )
+
+
+def _snap(t: float) -> float:
+    """Round a time to the nearest output frame."""
+    return round(t * EXPORT_FPS) / EXPORT_FPS
+
+
+def split_span(start: float, end: float, segment_seconds: float = SEGMENT_SECONDS):
+    """Cut [start, end) into GOP-aligned pieces of about `segment_seconds`."""
+    step = max(1, round(segment_seconds / GOP_SECONDS)) * GOP_SECONDS
+    cuts = [start]
+    while end - cuts[-1] > step:
+        cuts.append(cuts[-1] + step)
+    # A short tail is merged into the previous piece
+    if len(cuts) > 1 and end - cuts[-1] < GOP_SECONDS:
+        cuts.pop()
+    cuts.append(end)
+    return list(zip(cuts, cuts[1:]))
+
+
+def plan_segments(tracks: List[Dict[str, Any]], segment_seconds: Optional[float] = SEGMENT_SECONDS):
+    """Split the timeline into independently encodable (start, end) windows.
+
+    Cuts fall on clip edges, dropping edges closer together than one GOP.
+    Unless `segment_seconds` is None, spans longer than that are cut again
+    at GOP-aligned intervals.
+    """
+    duration = _snap(timeline_duration(tracks))
+    if duration <= 0:
+        return []
+
+    # Audio is mixed in its own pass, so only video and text edges cut segments
+    edges = {duration}
+    for track in tracks:
+        if track.get('type') == 'audio':
+            continue
+        for clip in track.get('clips', []):
+            edges.add(_snap(clip['start']))
+            edges.add(_snap(clip['start'] + clip['duration']))
+
+    cuts = [0.0]
+    for edge in sorted(e for e in edges if 0 < e <= duration):
+        if edge - cuts[-1] >= GOP_SECONDS:
+            cuts.append(edge)
+    if cuts[-1] != duration:
+        if len(cuts) > 1:
+            cuts.pop()
+        cuts.append(duration)
+    spans = list(zip(cuts, cuts[1:]))
+    if segment_seconds is None:
+        return spans
+    return [piece for start, end in spans for piece in split_span(start, end, segment_seconds)]
+
+
+def slice_tracks(tracks: List[Dict[str, Any]], start: float, end: float) -> List[Dict[str, Any]]:
+    """The part of the timeline inside [start, end), rebased to start at 0."""
+    sliced = []
+    for track in tracks:
+        clips = []
+        for clip in track.get('clips', []):
+            clip_start, clip_end = clip['start'], clip['start'] + clip['duration']
+            if clip_end <= start or clip_start >= end:
+                continue
+            head = max(0.0, start - clip_start)
+            clips.append({
+                **clip,
+                'start': max(clip_start, start) - start,
+                'duration': min(clip_end, end) - max(clip_start, start),
+                'trimStart': clip.get('trimStart', 0) + head,
+            })
+        sliced.append({**track, 'clips': clips})
+    return sliced
+
+
+# Source codec that can be stream-copied into each export format
+COPY_CODECS = {'mp4': 'h264', 'webm': 'vp9'}
+# The joined file carries one set of codec headers (the first part's), so copied
+# sources must match the export encoder's exactly
+COPY_MATCH_FIELDS = ('profile', 'level', 'extradata_hash')
+# How far off the export frame grid a source keyframe may be and still be cut on
+FRAME_TOLERANCE = 0.01
+
+
+def _whole_frames(seconds: float) -> Optional[int]:
+    """`seconds` in export frames, or None when it falls between two frames."""
+    frames = seconds * EXPORT_FPS
+    if abs(frames - round(frames)) > FRAME_TOLERANCE:
+        return None
+    return round(frames)
+
+
+def _sole_window(clip: Dict[str, Any], others: List[Dict[str, Any]], duration: float) -> Optional[Tuple[float, float]]:
+    """The longest stretch of a (sliced) segment where `clip` is the only thing on screen."""
+    windows = [(max(0.0, clip['start']), min(duration, clip['start'] + clip['duration']))]
+    for other in others:
+        if other is clip:
+            continue
+        lo, hi = other['start'], other['start'] + other['duration']
+        windows = [piece for start, end in windows for piece in ((start, min(end, lo)), (max(start, hi), end))]
+    windows = [(start, end) for start, end in windows if end > start]
+    return max(windows, key=lambda w: w[1] - w[0]) if windows else None
+
+
+def _copyable_source(clip: Dict[str, Any], fmt: str, quality: str, encoder: Dict[str, Any]) -> bool:
+    stream = clip.get('video')
+    if not stream or not clip.get('keyframes') or has_effects(clip):
+        return False
+    return not (
+        stream.get('codec') != COPY_CODECS.get(fmt)
+        or (stream.get('width'), stream.get('height')) != frame_size(quality)
+        or abs((stream.get('fps') or 0) - EXPORT_FPS) > 0.01
+        or stream.get('pix_fmt') != 'yuv420p'
+        or any(stream.get(field) is None or stream.get(field) != encoder.get(field) for field in COPY_MATCH_FIELDS)
+    )
+
+
+def smart_cut_span(tracks: List[Dict[str, Any]], duration: float, fmt: str, quality: str,
+                   encoder: Optional[Dict[str, Any]] = None):
+    """Find the stream-copyable stretch of a (sliced) segment.
+
+    A stretch qualifies when one video clip is alone on screen for it (no
+    other video clip and no text), has no effects, and its source already
+    matches the export codec, frame size and rate, and the `encoder`
+    parameters (see `encoder_signature`); the rest of the segment is
+    encoded around it. Returns (head, tail, copy_in, copy_out, src): the
+    segment-relative times where copying starts and stops, both whole
+    export frames, the matching source times, both on source keyframes,
+    and the source. Returns None when no stretch spans a full GOP.
+    """
+    if encoder is None:
+        return None
+    video, texts = track_clips(tracks, 'video'), track_clips(tracks, 'text')
+    best = None
+    for clip in video:
+        if not _copyable_source(clip, fmt, quality, encoder):
+            continue
+        window = _sole_window(clip, video + texts, duration)
+        if window is None:
+            continue
+        lo, hi = window
+        source_in = clip.get('trimStart', 0) + lo - clip['start']
+        source_out = source_in + hi - lo
+        copy_in = keyframe_after(clip['keyframes'], source_in)
+        copy_out = keyframe_before(clip['keyframes'], source_out)
+        if copy_in is None or copy_out is None or copy_out - copy_in < GOP_SECONDS:
+            continue
+        # Copied frames keep their place in the source, so both cuts must sit on the export's frame grid
+        head, tail = _whole_frames(lo + copy_in - source_in), _whole_frames(lo + copy_out - source_in)
+        if head is None or tail is None:
+            continue
+        if best is None or tail - head > best[1] - best[0]:
+            best = (head, tail, copy_in, copy_out, clip['src'])
+    if best is None:
+        return None
+    head, tail, copy_in, copy_out, src = best
+    return head / EXPORT_FPS, tail / EXPORT_FPS, copy_in, copy_out, src
+
+
+def plan_parts(tracks: List[Dict[str, Any]], fmt: str, quality: str,
+               encoder: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """The ordered pieces an export is assembled from.
+
+    Cut-only spans are stream-copied between source keyframes, with only the
+    short head and tail around the cut re-encoded; everything else is
+    encoded in GOP-aligned segments. Every piece is a whole number of frames.
+    """
+    parts: List[Dict[str, Any]] = []
+
+    def encode(start, end):
+        parts.extend({'kind': 'encode', 'start': s, 'end': e} for s, e in split_span(start, end))
+
+    for start, end in plan_segments(tracks, segment_seconds=None):
+        span = smart_cut_span(slice_tracks(tracks, start, end), end - start, fmt, quality, encoder)
+        if span is None:
+            encode(start, end)
+            continue
+        head, tail, copy_in, copy_out, src = span
+        if head > 0:
+            encode(start, start + head)
+        frames = round((tail - head) * EXPORT_FPS)
+        parts.append({'kind': 'copy', 'src': src, 'in': copy_in, 'frames': frames})
+        if end - (start + tail) > 0.5 / EXPORT_FPS:
+            encode(start + tail, end)
+    return parts
+
+
+def part_frames(part: Dict[str, Any]) -> int:
+    if part['kind'] == 'copy':
+        return part['frames']
+    return round((part['end'] - part['start']) * EXPORT_FPS)
+
+
+def concat_list(parts: List[Dict[str, Any]], paths: List[Path]) -> str:
+    """Concat demuxer script that places each part at its exact frame count.
+
+    Without `duration` the demuxer takes each file's container duration,
+    which with B-frames and edit lists can run past the last frame and make
+    the next part's timestamps overlap it.
+    """
+    return ''.join(
+        f"file '{path}'\nduration {part_frames(part) / EXPORT_FPS:.6f}\n"
+        for part, path in zip(parts, paths)
+    )
+
+
+def encoder_signature(fmt: str, quality: str, output: str) -> Optional[Dict[str, Any]]:
+    """Codec parameters of what the export encoder writes for fmt/quality. Runs in a pool worker.
+
+    Encodes a few black frames with the export settings and probes them.
+    """
+    width, height = frame_size(quality)
+    run_ffmpeg([
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"color=c=black:s={width}x{height}:r={EXPORT_FPS}",
+        '-frames:v', '3', *encoder_args(fmt, quality), '-an', output,
+    ])
+    return probe_media(output)['video']
+
+
+def build_copy_command(src: str, start: float, frames: int, output: str) -> List[str]:
+    """Stream-copy `frames` frames of video from a source keyframe.
+
+    Counted in packets rather than cut with -t, which on a source with
+    B-frames also keeps frames that display past the end.
+    """
+    return [
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-y',
+        '-ss', f"{start:.6f}", '-i', src, '-frames:v', str(frames),
+        '-map', '0:v:0', '-c:v', 'copy', '-an', '-sn', '-dn',
+        '-avoid_negative_ts', 'make_zero', output,
+    ]
+
+
+# drawtext colors: a name or hex RGB(A), optionally with @alpha
+TEXT_COLOR = re.compile(r'(?:[A-Za-z]+|(?:#|0x)?[0-9A-Fa-f]{6}(?:[0-9A-Fa-f]{2})?)(?:@(?:0|1|0?\.\d+))?')
+
+
+def _quote(value: str) -> str:
+    """One level of ffmpeg quoting: literal inside '...', with ' written as '\\''."""
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def drawtext_filter(clip: Dict[str, Any], height: int) -> str:
+    """drawtext for a text clip, centred near the bottom of the frame.
+
+    The text is quoted once for the filtergraph and once for the option
+    parser, and drawn without %{...} expansion, so any string is literal.
+    """
+    color = str(clip.get('color') or 'white')
+    if not TEXT_COLOR.fullmatch(color):
+        raise RenderError(f"Invalid text color: {color!r}")
+    text = str(clip.get('text') or clip.get('name') or '')
+    return (
+        f"drawtext=text={_quote(_quote(text))}:expansion=none:fontcolor={color}:"
+        f"fontsize={height // 12}:x=(w-text_w)/2:y=h-2*text_h"
+    )
+
+
+def encoder_args(fmt: str, quality: str, threads: int = 0) -> List[str]:
+    """Video encoder arguments for a format/quality pair.
+
+    Keyframes are forced every GOP so that segments cut on GOP boundaries
+    can be joined without re-encoding.
+    """
+    preset = QUALITY_PRESETS[quality]
+    args = list(FORMAT_OPTIONS[fmt]['video'])
+    if fmt == 'gif':
+        return args
+    gop = str(GOP_SECONDS * EXPORT_FPS)
+    if fmt == 'mp4':
+        args += ['-preset', preset['preset']]
+    args += [
+        '-g', gop, '-keyint_min', gop,
+        '-b:v', preset['bitrate'], '-maxrate', preset['maxrate'], '-bufsize', preset['bufsize'],
+    ]
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+
+def check_audio(tracks: List[Dict[str, Any]]) -> None:
+    """Reject audio clip settings the mix can't use, whatever the export format."""
+    for clip in track_clips(tracks, 'audio'):
+        try:
+            clip_envelope(clip)
+        except AudioError as e:
+            raise RenderError(f"Clip {clip.get('id')}: {e}")
+
+
+def _audio_inputs(tracks: List[Dict[str, Any]], first_index: int):
+    """Input arguments and mix filters for every audio clip."""
+    cmd: List[str] = []
+    filters: List[str] = []
+    audio_clips = track_clips(tracks, 'audio')
+    for n, clip in enumerate(audio_clips):
+        cmd += ['-ss', f"{clip.get('trimStart', 0):.3f}", '-t', f"{clip['duration']:.3f}", '-i', clip['src']]
+        delay = int(clip['start'] * 1000)
+        filters.append(f"[{first_index + n}:a]asetpts=PTS-STARTPTS,{audio_filter(clip)},adelay={delay}:all=1[a{n}]")
+    if audio_clips:
+        inputs = ''.join(f"[a{n}]" for n in range(len(audio_clips)))
+        filters.append(f"{inputs}amix=inputs={len(audio_clips)}:duration=longest:normalize=0[aout]")
+    return cmd, filters
+
+
+def _video_graph(tracks: List[Dict[str, Any]], width: int, height: int, duration: float, pix_fmt: str = 'yuv420p'):
+    """Input arguments and filters that composite the timeline into [vout]."""
+    cmd: List[str] = []
+    filters = [f"color=c=black:s={width}x{height}:r={EXPORT_FPS}:d={duration:.3f}[base0]"]
+
+    # Video: overlay each clip onto the canvas, shifted to its timeline position
+    last = 'base0'
+    for n, clip in enumerate(track_clips(tracks, 'video')):
+        cmd += ['-ss', f"{clip.get('trimStart', 0):.3f}", '-t', f"{clip['duration']:.3f}", '-i', clip['src']]
+        try:
+            matrix = compile_stack(clip)
+        except EffectError as e:
+            raise RenderError(str(e))
+        # The whole effect stack is one filter, applied after scaling down to the export size
+        effect = f"{ffmpeg_filter(matrix)}," if matrix is not None else ''
+        filters.append(
+            f"[{n}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={EXPORT_FPS},{effect}"
+            f"setpts=PTS-STARTPTS+{clip['start']:.3f}/TB[v{n}]"
+        )
+        filters.append(f"[{last}][v{n}]overlay=eof_action=pass[base{n + 1}]")
+        last = f"base{n + 1}"
+
+    # Text: drawn for the duration of each clip
+    for clip in track_clips(tracks, 'text'):
+        end = clip['start'] + clip['duration']
+        filters.append(
+            f"[{last}]{drawtext_filter(clip, height)}:"
+            f"enable='between(t,{clip['start']:.3f},{end:.3f})'[{last}t]"
+        )
+        last = f"{last}t"
+    filters.append(f"[{last}]format={pix_fmt}[vout]")
+    return cmd, filters
+
+
+def build_render_command(
+    tracks: List[Dict[str, Any]],
+    fmt: str,
+    quality: str,
+    output: str,
+    duration: Optional[float] = None,
+    audio: bool = True,
+    threads: int = 0,
+) -> List[str]:
+    """Build a single ffmpeg invocation that renders a timeline.
+
+    Video clips, each with its effect stack, are overlaid onto a black canvas
+    at their timeline position, audio clips are delayed to their start and
+    mixed, and text clips are drawn on top for the span they cover.
+    """
+    if fmt not in FORMAT_OPTIONS:
+        raise RenderError(f"Unsupported format: {fmt}")
+    if quality not in QUALITY_PRESETS:
+        raise RenderError(f"Unsupported quality: {quality}")
+
+    if duration is None:
+        duration = timeline_duration(tracks)
+    if duration <= 0:
+        raise RenderError("Timeline is empty")
+
+    width, height = frame_size(quality)
+    options = FORMAT_OPTIONS[fmt]
+    cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-y']
+    video_cmd, filters = _video_graph(tracks, width, height, duration)
+    cmd += video_cmd
+    index = len(track_clips(tracks, 'video'))
+
+    # Audio: delay each clip to its start and mix
+    has_audio = False
+    if audio and options['audio']:
+        audio_cmd, audio_filters = _audio_inputs(tracks, index)
+        cmd += audio_cmd
+        filters += audio_filters
+        has_audio = bool(audio_filters)
+
+    cmd += ['-filter_complex', ';'.join(filters), '-map', '[vout]']
+    if has_audio:
+        cmd += ['-map', '[aout]'] + options['audio']
+    cmd += encoder_args(fmt, quality, threads)
+    cmd += options['extra'] + ['-t', f"{duration:.3f}", output]
+    return cmd
+
+
+def ladder_renditions(renditions: Optional[List[str]], quality: str = 'ultra') -> List[str]:
+    """The rungs of an adaptive export, lowest first; by default every preset up to `quality`."""
+    if renditions is None:
+        top = QUALITY_PRESETS[quality]['height']
+        renditions = [name for name, preset in QUALITY_PRESETS.items() if preset['height'] <= top]
+    unknown = [name for name in renditions if name not in QUALITY_PRESETS]
+    if unknown:
+        raise RenderError(f"Unsupported quality: {', '.join(unknown)}")
+    if not renditions:
+        raise RenderError("No renditions selected")
+    return sorted(set(renditions), key=lambda name: QUALITY_PRESETS[name]['height'])
+
+
+def build_ladder_command(
+    tracks: List[Dict[str, Any]],
+    renditions: List[str],
+    out_dir: str,
+    duration: Optional[float] = None,
+    threads: int = 0,
+) -> List[str]:
+    """Build one ffmpeg invocation that writes a video-only HLS stream per rendition.
+
+    The timeline is composited once at the largest rung, split, and scaled
+    down for the others; each rung gets its own encoder with the preset's
+    rate control, sharing the export GOP so that all rungs switch on the same
+    segment boundaries. Rung `name` is written to `out_dir/name/index.m3u8`.
+    """
+    renditions = ladder_renditions(renditions)
+    if duration is None:
+        duration = timeline_duration(tracks)
+    if duration <= 0:
+        raise RenderError("Timeline is empty")
+
+    width, height = frame_size(renditions[-1])
+    cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-y']
+    video_cmd, filters = _video_graph(tracks, width, height, duration)
+    cmd += video_cmd
+    filters.append(f"[vout]split={len(renditions)}" + ''.join(f"[s{n}]" for n in range(len(renditions))))
+    for n, name in enumerate(renditions):
+        w, h = frame_size(name)
+        filters.append(f"[s{n}]scale={w}:{h}[r{n}]")
+    cmd += ['-filter_complex', ';'.join(filters)]
+    for n in range(len(renditions)):
+        cmd += ['-map', f"[r{n}]"]
+
+    gop = str(GOP_SECONDS * EXPORT_FPS)
+    cmd += FORMAT_OPTIONS['hls']['video'] + ['-g', gop, '-keyint_min', gop]
+    for n, name in enumerate(renditions):
+        preset = QUALITY_PRESETS[name]
+        cmd += [
+            f'-preset:v:{n}', preset['preset'], f'-b:v:{n}', preset['bitrate'],
+            f'-maxrate:v:{n}', preset['maxrate'], f'-bufsize:v:{n}', preset['bufsize'],
+        ]
+    if threads:
+        cmd += ['-threads', str(threads)]
+    cmd += [
+        '-t', f"{duration:.3f}",
+        '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', f"{out_dir}/%v/seg_%05d.ts",
+        '-var_stream_map', ' '.join(f"v:{n},name:{name}" for n, name in enumerate(renditions)),
+        f"{out_dir}/%v/index.m3u8",
+    ]
+    return cmd
+
+
+def build_hls_audio_command(audio_path: str, out_dir: str) -> List[str]:
+    """Segment an already encoded AAC mix into the shared audio rendition."""
+    return [
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-y', '-v', 'error', '-i', audio_path,
+        '-map', '0:a', '-c:a', 'copy',
+        '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', f"{out_dir}/audio/seg_%05d.ts", f"{out_dir}/audio/index.m3u8",
+    ]
+
+
+def _bits(rate: str) -> int:
+    units = {'k': 1000, 'M': 1000000}
+    if rate[-1] in units:
+        return int(float(rate[:-1]) * units[rate[-1]])
+    return int(rate)
+
+
+def master_playlist(renditions: List[str], audio: bool) -> str:
+    """HLS master playlist over the rung playlists written by build_ladder_command."""
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+    if audio:
+        lines.append('#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="main",DEFAULT=YES,AUTOSELECT=YES,URI="audio/index.m3u8"')
+    for name in renditions:
+        preset = QUALITY_PRESETS[name]
+        width, height = frame_size(name)
+        bandwidth = _bits(preset['maxrate']) + (HLS_AUDIO_BANDWIDTH if audio else 0)
+        attributes = f"BANDWIDTH={bandwidth},RESOLUTION={width}x{height},FRAME-RATE={EXPORT_FPS:.3f}"
+        if audio:
+            attributes += ',AUDIO="aud"'
+        lines += [f"#EXT-X-STREAM-INF:{attributes}", f"{name}/index.m3u8"]
+    return '\n'.join(lines) + '\n'
+
+
+def build_palette_sample_command(tracks: List[Dict[str, Any]], quality: str, duration: float):
+    """(command, width, height) for a small, low-rate rgb24 render to sample a GIF palette from."""
+    width, height = frame_size(quality)
+    width = max(2, width // PALETTE_SAMPLE_SCALE // 2 * 2)
+    height = max(2, height // PALETTE_SAMPLE_SCALE // 2 * 2)
+    cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error']
+    video_cmd, filters = _video_graph(tracks, width, height, duration, pix_fmt='rgb24')
+    filters.append(f"[vout]fps={PALETTE_SAMPLE_FPS}[sample]")
+    cmd += video_cmd + [
+        '-filter_complex', ';'.join(filters), '-map', '[sample]',
+        '-t', f"{duration:.3f}", '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1',
+    ]
+    return cmd, width, height
+
+
+def build_gif_command(
+    tracks: List[Dict[str, Any]],
+    quality: str,
+    palettes_path: str,
+    output: str,
+    duration: Optional[float] = None,
+    threads: int = 0,
+) -> List[str]:
+    """Build one ffmpeg invocation that renders a GIF against precomputed palettes.
+
+    `palettes_path` holds one 16x16 rgb24 palette image per output frame
+    (see `palette.palette_frames`); `paletteuse` switches palettes as they
+    change and ffmpeg's GIF encoder writes them as local colour tables.
+    """
+    if duration is None:
+        duration = timeline_duration(tracks)
+    if duration <= 0:
+        raise RenderError("Timeline is empty")
+
+    width, height = frame_size(quality)
+    cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-y']
+    video_cmd, filters = _video_graph(tracks, width, height, duration, pix_fmt='rgb24')
+    cmd += video_cmd
+    cmd += ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-video_size', '16x16', '-framerate', str(GIF_FPS), '-i', palettes_path]
+    index = len(track_clips(tracks, 'video'))
+    filters.append(f"[vout]fps={GIF_FPS}[gif]")
+    filters.append(f"[gif][{index}:v]paletteuse=new=1:dither=bayer:bayer_scale=3[gout]")
+    cmd += ['-filter_complex', ';'.join(filters), '-map', '[gout]']
+    cmd += encoder_args('gif', quality, threads)
+    cmd += FORMAT_OPTIONS['gif']['extra'] + ['-t', f"{duration:.3f}", output]
+    return cmd
+
+
+def build_concat_command(tracks: List[Dict[str, Any]], fmt: str, list_path: str, output: str, audio_path: Optional[str] = None) -> List[str]:
+    """Join encoded segments, and the separately mixed audio if any, without re-encoding."""
+    cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-y', '-f', 'concat', '-safe', '0', '-i', list_path]
+    if audio_path:
+        cmd += ['-i', audio_path, '-map', '0:v', '-map', '1:a', '-c:a', 'copy']
+    else:
+        cmd += ['-map', '0:v']
+    cmd += ['-c:v', 'copy'] + FORMAT_OPTIONS[fmt]['extra'] + ['-t', f"{timeline_duration(tracks):.3f}", output]
+    return cmd
+
+
+def run_ffmpeg(cmd: List[str]) -> None:
+    """Run one ffmpeg command. Executed inside a pool worker process."""
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        tail = proc.stderr.decode('utf-8', 'replace')[-2000:]
+        raise RenderError(f"ffmpeg exited with {proc.returncode}: {tail}")
+
+
+def with_progress(cmd: List[str], path: Path) -> List[str]:
+    """Have ffmpeg write key=value progress blocks to `path` as it encodes."""
+    return [cmd[0], '-progress', str(path), '-nostats'] + cmd[1:]
+
+
+def _read_frames(path: Path) -> int:
+    """The last `frame=` count in an ffmpeg progress file."""
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return 0
+    at = data.rfind(b'\nframe=')
+    if at < 0:
+        at = -1 if data.startswith(b'frame=') else None
+    if at is None:
+        return 0
+    line = data[at + 1:].split(b'\n', 1)[0]
+    try:
+        return int(line[len(b'frame='):])
+    except ValueError:
+        return 0
+
+
+class JobProgress:
+    """Frame counts for one export, sampled from its encoders' progress files."""
+
+    # Weight of the newest sample in the smoothed encode rate
+    SMOOTHING = 0.3
+
+    def __init__(self, frames_total: int):
+        self.frames_total = frames_total
+        self.frames_done = 0
+        self.segment: Optional[int] = None
+        self.fps = 0.0
+        self._running: Dict[Path, int] = {}
+        self._last = (time.monotonic(), 0)
+
+    def started(self, segment: int, progress_path: Path) -> None:
+        self.segment = segment
+        self._running[progress_path] = 0
+
+    def finished(self, frames: int, progress_path: Optional[Path] = None) -> None:
+        if progress_path is not None:
+            self._running.pop(progress_path, None)
+        self.frames_done += frames
+
+    def frames(self) -> int:
+        return min(self.frames_total, self.frames_done + sum(self._running.values()))
+
+    def sample(self) -> None:
+        for path in self._running:
+            self._running[path] = _read_frames(path)
+        now, frames = time.monotonic(), self.frames()
+        last_time, last_frames = self._last
+        if now > last_time and frames >= last_frames:
+            rate = (frames - last_frames) / (now - last_time)
+            self.fps = self.SMOOTHING * rate + (1 - self.SMOOTHING) * self.fps
+        self._last = (now, frames)
+
+    def snapshot(self) -> Dict[str, Any]:
+        frames = self.frames()
+        eta = (self.frames_total - frames) / self.fps if self.fps > 0 else None
+        return {
+            'frames': frames,
+            'frames_total': self.frames_total,
+            'fps': round(self.fps, 1),
+            'eta': round(eta, 1) if eta is not None else None,
+            'segment': self.segment,
+        }
+
+
+def _link(source: Path, target: Path) -> bool:
+    """Hard-link a cached segment into a job's work dir so eviction can't pull it mid-job.
+
+    False if the source is gone (another worker process evicted it).
+    """
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            shutil.copyfile(source, target)
+        except FileNotFoundError:
+            return False
+    return True
+
+
+class PrioritySlots:
+    """A semaphore whose waiters are woken in priority order, then FIFO."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._free = slots
+        self._waiters: List = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled just after being handed a slot: pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def in_use(self) -> int:
+        return self.slots - self._free
+
+
+class FairQueue:
+    """Per-owner FIFO queues served round-robin."""
+
+    def __init__(self):
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._not_empty = asyncio.Condition()
+
+    async def put(self, owner: str, item: Any) -> None:
+        async with self._not_empty:
+            self._queues.setdefault(owner, deque()).append(item)
+            self._not_empty.notify()
+
+    async def get(self) -> Any:
+        async with self._not_empty:
+            while not self._queues:
+                await self._not_empty.wait()
+            # Take from the owner at the front, then move it to the back
+            owner, queue = self._queues.popitem(last=False)
+            item = queue.popleft()
+            if queue:
+                self._queues[owner] = queue
+            return item
+
+    def qsize(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+
+class RenderEngine:
+    """Owns the ffmpeg process pool and the export job queue."""
+
+    def __init__(
+        self,
+        output_dir: Path,
+        cache: Optional[SegmentCache] = None,
+        on_update: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        progress=None,
+        cpus: Optional[int] = None,
+    ):
+        self.output_dir = output_dir
+        self.cache = cache
+        # Cores this engine may use; less than the machine when several server processes share it
+        cpus = cpus or os.cpu_count() or 1
+        self.workers = int(os.environ.get('RENDER_WORKERS', cpus))
+        self.concurrent_jobs = int(os.environ.get('RENDER_CONCURRENT_JOBS', self.workers))
+        # Encoder threads per segment encode, so parallel segments don't oversubscribe the cores.
+        # Unsegmented renders (HLS ladders, GIFs) are one process doing the whole job and keep
+        # ffmpeg's own thread count, or they would encode on a single core
+        self.threads = max(1, cpus // self.workers)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.queue = FairQueue()
+        self._on_update = on_update
+        # ProgressBroker that live job progress is published to, if any
+        self.progress = progress
+        self._job_progress: Dict[str, JobProgress] = {}
+        # (format, quality) -> encoder_signature(), for smart-cut eligibility
+        self._signatures: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = PrioritySlots(self.workers)
+        self._dispatchers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.cache is not None:
+            self.cache.load()
+        # Forking this process would copy in whatever locks Motor's and the thread pools' threads hold;
+        # pool workers are forked from a clean single-threaded server with the render modules preloaded
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['render', 'timeline', 'thumbnails', 'waveform', 'scenes', 'probe'])
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        if self.progress is not None:
+            self.progress.add_sampler(self._sample_progress)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.concurrent_jobs)]
+
+    @property
+    def started(self) -> bool:
+        return self._pool is not None
+
+    async def shutdown(self) -> None:
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, job: Dict[str, Any]) -> None:
+        self.jobs[job['id']] = job
+        self._publish(job)
+        await self.queue.put(job['owner'], job)
+
+    async def _update(self, job: Dict[str, Any], **fields) -> None:
+        job.update(fields)
+        self._publish(job)
+        if self._on_update is not None:
+            await self._on_update(job)
+
+    def stats(self) -> Dict[str, Any]:
+        busy = self._slots.in_use()
+        return {
+            'workers': self.workers,
+            'busy_workers': busy,
+            'utilization': busy / self.workers,
+            'waiting_tasks': self._slots.waiting(),
+            'queued_jobs': self.queue.qsize(),
+            'running_jobs': sum(1 for job in self.jobs.values() if job['status'] == 'running'),
+            'encode_fps': sum(progress.fps for progress in self._job_progress.values()),
+        }
+
+    def progress_snapshot(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        snapshot = {
+            'id': job['id'],
+            'status': job['status'],
+            'segments': job.get('segments'),
+            'segments_done': job.get('segments_done', 0),
+            'cached_segments': job.get('cached_segments', 0),
+            'copied_segments': job.get('copied_segments', 0),
+            'error': job.get('error'),
+        }
+        progress = self._job_progress.get(job['id'])
+        if progress is not None:
+            snapshot.update(progress.snapshot())
+            if job['status'] == 'completed':
+                snapshot.update(frames=progress.frames_total, eta=0)
+        return snapshot
+
+    def _publish(self, job: Dict[str, Any]) -> None:
+        if self.progress is not None:
+            final = job['status'] in ('completed', 'failed')
+            self.progress.publish(f"export:{job['id']}", self.progress_snapshot(job), final=final)
+
+    def _sample_progress(self) -> None:
+        # Runs on the broker's tick, so progress files are read at the publish rate and no faster
+        for job_id, progress in self._job_progress.items():
+            job = self.jobs.get(job_id)
+            if job is not None:
+                progress.sample()
+                self._publish(job)
+
+    async def run_in_pool(self, fn, *args, priority: int = PRIORITY_INTERACTIVE, on_start: Optional[Callable[[], None]] = None):
+        """Run `fn(*args)` on a pool worker once one is free for this priority."""
+        await self._slots.acquire(priority)
+        try:
+            if on_start is not None:
+                on_start()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, fn, *args)
+        finally:
+            self._slots.release()
+
+    async def render(self, job: Dict[str, Any]) -> None:
+        tracks, fmt, quality = job['tracks'], job['format'], job['quality']
+        progress = self._job_progress[job['id']] = JobProgress(round(timeline_duration(tracks) * EXPORT_FPS))
+        if FORMAT_OPTIONS[fmt].get('ladder'):
+            await self._render_ladder(job, progress)
+            return
+        if fmt == 'gif':
+            await self._render_gif(job, progress)
+            return
+        work_dir = self.output_dir / f"{job['id']}.parts"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            encoder = await self._encoder_signature(tracks, fmt, quality, work_dir)
+            parts = plan_parts(tracks, fmt, quality, encoder)
+            paths = [work_dir / f"{n:05d}.{fmt}" for n in range(len(parts))]
+            pending = []
+            # The audio mix is one streaming pass, queued first so it runs alongside the
+            # segment encodes; a single mix also avoids encoder-priming gaps at segment joins
+            audio_path = None
+            if track_clips(tracks, 'audio'):
+                audio_path = str(work_dir / 'audio.mka')
+                codec = FORMAT_OPTIONS[fmt]['audio']
+                pending.append(self.run_in_pool(mix_audio, tracks, timeline_duration(tracks), codec, audio_path))
+            for n, (part, path) in enumerate(zip(parts, paths)):
+                if part['kind'] == 'copy':
+                    copy = self.run_in_pool(run_ffmpeg, build_copy_command(part['src'], part['in'], part['frames'], str(path)))
+                    pending.append(self._part_done(job, copy, part['frames']))
+                    job['copied_segments'] = job.get('copied_segments', 0) + 1
+                    continue
+                start, end = part['start'], part['end']
+                frames = round((end - start) * EXPORT_FPS)
+                sliced = slice_tracks(tracks, start, end)
+                # Segments carry no audio (it is mixed separately), so audio edits don't invalidate them
+                key = segment_key([t for t in sliced if t.get('type') != 'audio'], fmt, quality, end - start)
+                cached = self.cache.get(key, fmt) if self.cache else None
+                if cached is not None and _link(cached, path):
+                    job['cached_segments'] = job.get('cached_segments', 0) + 1
+                    job['segments_done'] = job.get('segments_done', 0) + 1
+                    progress.finished(frames)
+                else:
+                    encode = self._encode_segment(sliced, fmt, quality, end - start, key, path, n, progress)
+                    pending.append(self._part_done(job, encode))
+            job['segments'] = len(parts)
+            await asyncio.gather(*pending)
+
+            list_path = work_dir / 'segments.txt'
+            list_path.write_text(concat_list(parts, paths))
+            concat = build_concat_command(tracks, fmt, str(list_path), job['output'], audio_path)
+            await self.run_in_pool(run_ffmpeg, concat)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def _encoder_signature(self, tracks, fmt: str, quality: str, work_dir: Path) -> Optional[Dict[str, Any]]:
+        """The export encoder's codec parameters, worked out once per format and quality if any clip could be copied."""
+        copyable = any(
+            clip.get('keyframes') and (clip.get('video') or {}).get('codec') == COPY_CODECS.get(fmt)
+            for clip in track_clips(tracks, 'video')
+        )
+        if not copyable:
+            return None
+        key = (fmt, quality)
+        if key not in self._signatures:
+            try:
+                self._signatures[key] = await self.run_in_pool(encoder_signature, fmt, quality, str(work_dir / f"signature.{fmt}"))
+            except Exception as e:
+                # Exports still work; they just re-encode everything
+                logger.warning("Encoder signature for %s/%s failed: %s", fmt, quality, e)
+                self._signatures[key] = None
+        return self._signatures[key]
+
+    async def _render_ladder(self, job: Dict[str, Any], progress: JobProgress) -> None:
+        tracks = job['tracks']
+        renditions = ladder_renditions(job.get('renditions'), job['quality'])
+        duration = timeline_duration(tracks)
+        out_dir = Path(job['output'])
+        shutil.rmtree(out_dir, ignore_errors=True)
+        for name in renditions:
+            (out_dir / name).mkdir(parents=True)
+        progress_path = out_dir / 'video.progress'
+        audio = bool(track_clips(tracks, 'audio'))
+        try:
+            pending = []
+            if audio:
+                (out_dir / 'audio').mkdir()
+                pending.append(self._render_hls_audio(tracks, duration, out_dir))
+            cmd = build_ladder_command(tracks, renditions, str(out_dir), duration)
+            pending.append(self.run_in_pool(
+                run_ffmpeg, with_progress(cmd, progress_path),
+                on_start=lambda: progress.started(0, progress_path),
+            ))
+            await asyncio.gather(*pending)
+            progress.finished(progress.frames_total, progress_path)
+            (out_dir / 'master.m3u8').write_text(master_playlist(renditions, audio))
+        except BaseException:
+            shutil.rmtree(out_dir, ignore_errors=True)
+            raise
+        finally:
+            progress_path.unlink(missing_ok=True)
+
+    async def _render_hls_audio(self, tracks, duration, out_dir: Path) -> None:
+        mix_path = out_dir / 'audio.mka'
+        try:
+            await self.run_in_pool(mix_audio, tracks, duration, FORMAT_OPTIONS['hls']['audio'], str(mix_path))
+            await self.run_in_pool(run_ffmpeg, build_hls_audio_command(str(mix_path), str(out_dir)))
+        finally:
+            mix_path.unlink(missing_ok=True)
+
+    async def _render_gif(self, job: Dict[str, Any], progress: JobProgress) -> None:
+        tracks, quality = job['tracks'], job['quality']
+        duration = timeline_duration(tracks)
+        spans = plan_segments(tracks)
+        progress.frames_total = round(duration * GIF_FPS)
+        work_dir = self.output_dir / f"{job['id']}.parts"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            palettes = await asyncio.gather(*(
+                self._segment_palette(tracks, quality, start, end, work_dir / f"{n:05d}.palette")
+                for n, (start, end) in enumerate(spans)
+            ))
+            palettes_path = work_dir / 'palettes.rgb'
+            palettes_path.write_bytes(palette_frames(palettes, [start for start, _ in spans], progress.frames_total, GIF_FPS))
+            progress_path = work_dir / 'gif.progress'
+            cmd = build_gif_command(tracks, quality, str(palettes_path), job['output'], duration)
+            await self.run_in_pool(
+                run_ffmpeg, with_progress(cmd, progress_path),
+                on_start=lambda: progress.started(0, progress_path),
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def _segment_palette(self, tracks, quality, start, end, path: Path) -> bytes:
+        sliced = slice_tracks(tracks, start, end)
+        key = segment_key([t for t in sliced if t.get('type') != 'audio'], 'gif', quality, end - start)
+        cached = self.cache.get(key, 'palette') if self.cache else None
+        if cached is not None:
+            try:
+                return cached.read_bytes()
+            except FileNotFoundError:
+                # Evicted by another worker process since the lookup
+                pass
+        cmd, width, height = build_palette_sample_command(sliced, quality, end - start)
+        palette = await self.run_in_pool(sample_palette, cmd, width, height)
+        if self.cache is not None:
+            path.write_bytes(palette)
+            self.cache.put(key, 'palette', path)
+        return palette
+
+    async def _part_done(self, job: Dict[str, Any], work: Awaitable[None], frames: int = 0) -> None:
+        await work
+        job['segments_done'] = job.get('segments_done', 0) + 1
+        if frames:
+            self._job_progress[job['id']].finished(frames)
+
+    async def _encode_segment(self, tracks, fmt, quality, duration, key, path, segment, progress) -> None:
+        tmp = path.with_suffix(f".tmp.{fmt}")
+        progress_path = path.with_suffix('.progress')
+        cmd = build_render_command(tracks, fmt, quality, str(tmp), duration=duration, audio=False, threads=self.threads)
+        await self.run_in_pool(
+            run_ffmpeg, with_progress(cmd, progress_path),
+            on_start=lambda: progress.started(segment, progress_path),
+        )
+        progress.finished(round(duration * EXPORT_FPS), progress_path)
+        if self.cache is None:
+            tmp.rename(path)
+        else:
+            # Linked before it enters the cache, where another process's eviction may take it at once
+            _link(tmp, path)
+            self.cache.put(key, fmt, tmp)
+
+    async def _dispatch(self) -> None:
+        while True:
+            job = await self.queue.get()
+            await self._update(job, status='running', started_at=datetime.utcnow())
+            try:
+                await self.render(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Export %s failed: %s", job['id'], e)
+                await self._update(job, status='failed', error=str(e), finished_at=datetime.utcnow())
+            else:
+                await self._update(job, status='completed', finished_at=datetime.utcnow())
+            finally:
+                # Finished jobs live on in Mongo; keep only live ones here
+                if job['status'] in ('completed', 'failed'):
+                    self.jobs.pop(job['id'], None)
+                    self._job_progress.pop(job['id'], None)
@@ -0,0 +1,122 @@
+"""Content-addressed cache of rendered export segments.
+
+A segment is keyed by a hash of everything that affects its pixels: the
+source media, trims, effects, text and the export preset. Re-exporting after
+a small edit only re-encodes the segments whose key changed.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Clip fields that change the rendered output; ids and UI state do not. A text
+# clip without `text` is drawn with its `name` (see render.drawtext_filter)
+RENDER_FIELDS = (
+    'type', 'start', 'duration', 'trimStart',
+    'filter', 'adjustments', 'effects', 'audioEffects',
+    'text', 'name', 'color',
+)
+
+
+def source_digest(clip: Dict[str, Any]) -> Optional[str]:
+    """Content digest of the clip's source, falling back to its URL."""
+    return clip.get('digest') or clip.get('src')
+
+
+def segment_key(tracks: List[Dict[str, Any]], fmt: str, quality: str, duration: float) -> str:
+    """Hash the inputs of one (already sliced) segment."""
+    clips = [
+        {
+            'track': track.get('type'),
+            'source': source_digest(clip),
+            **{field: clip[field] for field in RENDER_FIELDS if field in clip},
+        }
+        for track in tracks
+        for clip in track.get('clips', [])
+    ]
+    clips.sort(key=lambda clip: json.dumps(clip, sort_keys=True, default=str))
+    payload = {'clips': clips, 'format': fmt, 'quality': quality, 'duration': round(duration, 3)}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SegmentCache:
+    """On-disk segment store with size-bounded LRU eviction.
+
+    Every server worker process shares the directory. File mtimes are the
+    LRU order (a hit touches its file) and eviction rescans the directory
+    under an flock, so the size bound holds for the whole host, and a
+    segment another process evicted is simply a miss.
+    """
+
+    LOCK_NAME = '.lock'
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # As of the last scan; other processes add and evict in between
+        self._entries = 0
+        self._bytes = 0
+
+    def load(self) -> None:
+        """Apply the size bound to whatever previous runs left behind."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._evict()
+
+    def path_for(self, key: str, fmt: str) -> Path:
+        return self.root / f"{key}.{fmt}"
+
+    def get(self, key: str, fmt: str) -> Optional[Path]:
+        path = self.path_for(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key: str, fmt: str, source: Path) -> Path:
+        path = self.path_for(key, fmt)
+        shutil.move(str(source), path)
+        self._evict()
+        return path
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        return entries
+
+    def _evict(self) -> None:
+        with open(self.root / self.LOCK_NAME, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = sorted(self._scan(), reverse=True)
+            total = sum(size for _, _, size in entries)
+            while total > self.max_bytes and len(entries) > 1:
+                _, name, size = entries.pop()
+                (self.root / name).unlink(missing_ok=True)
+                total -= size
+        self._entries, self._bytes = len(entries), total
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': self._entries,
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+        }
@@ -0,0 +1,95 @@
+"""Shot boundary detection from streamed colour histograms.
+
+Frames are sampled at a low rate, downscaled to a thumbnail and read from an
+ffmpeg pipe in batches. Each batch becomes a set of per-channel histograms in
+one `bincount`, consecutive histograms are compared with an L1 distance, and
+a cut is reported where that distance jumps. Only one batch is held at a
+time. The scan normally rides along on the proxy transcode as a second
+output, so the source is decoded once for both.
+"""
+import subprocess
+import tempfile
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+from render import FFMPEG_BIN, RenderError
+
+SCAN_FPS = 10
+SCAN_WIDTH = 64
+SCAN_HEIGHT = 36
+# Histogram bins per channel
+BINS = 16
+# Frames per NumPy batch
+BATCH_FRAMES = 256
+# Histogram distance (0..1) above which consecutive frames are a cut
+CUT_THRESHOLD = 0.3
+# Flashes and fast pans can trip several cuts in a row; keep the first
+MIN_SCENE_SECONDS = 1.0
+
+SCAN_FILTER = f"fps={SCAN_FPS},scale={SCAN_WIDTH}:{SCAN_HEIGHT},format=rgb24"
+
+
+def scan_command(src: str) -> List[str]:
+    """Scan without transcoding, e.g. from an existing proxy."""
+    return [
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error', '-an', '-sn', '-dn', '-i', src,
+        '-vf', SCAN_FILTER, '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1',
+    ]
+
+
+def frame_batches(stream, batch: int = BATCH_FRAMES) -> Iterator[np.ndarray]:
+    frame_bytes = SCAN_WIDTH * SCAN_HEIGHT * 3
+    while True:
+        data = stream.read(frame_bytes * batch)
+        count = len(data) // frame_bytes
+        if not count:
+            return
+        yield np.frombuffer(data[:count * frame_bytes], dtype=np.uint8).reshape(count, SCAN_HEIGHT, SCAN_WIDTH, 3)
+
+
+def histograms(frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+    """(frames, 3 * BINS) normalized per-channel histograms for each batch."""
+    shift = 8 - int(np.log2(BINS))
+    channel_offsets = np.arange(3) * BINS
+    for batch in frames:
+        count = len(batch)
+        bins = (batch >> shift).astype(np.intp) + channel_offsets
+        bins += (np.arange(count) * 3 * BINS)[:, None, None, None]
+        counts = np.bincount(bins.ravel(), minlength=count * 3 * BINS)
+        yield counts.reshape(count, 3 * BINS) / (SCAN_WIDTH * SCAN_HEIGHT)
+
+
+def cut_times(hists: Iterable[np.ndarray], fps: float = SCAN_FPS) -> Iterator[float]:
+    previous = None
+    frame = 0  # index of the first frame of the current batch
+    last_cut = 0.0
+    for batch in hists:
+        if previous is None:
+            joined, first = batch, frame + 1
+        else:
+            joined, first = np.concatenate([previous, batch]), frame
+        # Each channel's histogram sums to 1, so this is in [0, 1]
+        distance = np.abs(np.diff(joined, axis=0)).sum(axis=1) / 6
+        for index in np.flatnonzero(distance > CUT_THRESHOLD):
+            time = (first + index) / fps
+            if time - last_cut >= MIN_SCENE_SECONDS:
+                last_cut = time
+                yield round(float(time), 3)
+        frame += len(batch)
+        previous = batch[-1:]
+
+
+def run_scan(cmd: List[str]) -> List[float]:
+    """Run a command that writes SCAN_FILTER frames to stdout; returns cut times. Runs in a pool worker."""
+    with tempfile.TemporaryFile() as log:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log)
+        try:
+            cuts = list(cut_times(histograms(frame_batches(proc.stdout))))
+        finally:
+            proc.stdout.close()
+        if proc.wait() != 0:
+            log.seek(0)
+            tail = log.read().decode('utf-8', 'replace')[-2000:]
+            raise RenderError(f"ffmpeg exited with {proc.returncode}: {tail}")
+    return cuts
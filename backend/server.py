@@ -1,24 +1,127 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import base64
+import copy
+import fcntl
+import ipaddress
+import json
 import logging
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Any, Dict, List, Optional
 import uuid
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import urlsplit
+
+from render import (
+    RenderEngine, EXPORT_FPS, FORMAT_OPTIONS, PRIORITY_BACKGROUND, QUALITY_PRESETS, RenderError,
+    build_ladder_command, build_render_command, check_audio, ladder_renditions,
+)
+from render_cache import SegmentCache
+from media_store import MediaStore, UploadError
+from media_response import RangeFileResponse, parse_range
+from thumbnails import SpriteCache, render_sprite
+from waveform import WaveformError, WaveformStore, build_peaks
+from proxy import build_proxy_command
+from scenes import SCAN_FILTER, run_scan, scan_command
+from probe import ProbeError, index_media, keyframe_after, keyframe_before
+from probe_cache import ProbeCache
+from write_batcher import WriteCoalescer
+from projects import PatchError, ProjectStore, VersionConflict
+from progress import ProgressBroker
+from timeline import FrameCache, TimelineIndex, frame_key, render_frame
+from metrics import MetricsMiddleware, MongoCommandTimer, StatsCollector, latest_metrics, register_collector
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection. The pool keeps MONGO_MIN_POOL_SIZE connections open, and
+# startup opens them before the worker reports ready
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+# Seconds /api/readyz waits for a Mongo ping
+READY_TIMEOUT = 2
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, minPoolSize=MONGO_MIN_POOL_SIZE, event_listeners=[MongoCommandTimer()])
 db = client[os.environ['DB_NAME']]
 
+# GET /api/status paging
+STATUS_PAGE_SIZE = 100
+STATUS_PAGE_MAX = 1000
+STATUS_STREAM_BATCH = 500
+
+# When > 0, single POST /api/status writes arriving within this many ms are
+# grouped into one insert_many (up to STATUS_COALESCE_MAX documents)
+STATUS_COALESCE_MS = float(os.environ.get('STATUS_COALESCE_MS', 0))
+STATUS_COALESCE_MAX = int(os.environ.get('STATUS_COALESCE_MAX', 500))
+STATUS_BATCH_MAX = 1000
+
+# Seconds between sweeps that fold project op logs into snapshots
+PROJECT_COMPACT_INTERVAL = float(os.environ.get('PROJECT_COMPACT_INTERVAL', 60))
+
+# Live progress pushed over Server-Sent Events: updates per second, and idle seconds between keepalives
+PROGRESS_RATE = float(os.environ.get('PROGRESS_RATE', 4))
+PROGRESS_KEEPALIVE = 15
+# Workers on this host relay the progress they publish to each other through small files here
+PROGRESS_DIR = Path(os.environ.get('PROGRESS_DIR', ROOT_DIR / 'progress_relay'))
+# Jobs with nothing on the relay (run on another host, or finished long ago) are followed through Mongo at this interval
+PROGRESS_FALLBACK_INTERVAL = 2
+
+# Rendered exports are written here and served from /api/exports/{id}/download
+EXPORT_DIR = Path(os.environ.get('EXPORT_DIR', ROOT_DIR / 'exports'))
+
+# Encoded export segments, reused across re-exports
+RENDER_CACHE_DIR = Path(os.environ.get('RENDER_CACHE_DIR', ROOT_DIR / 'render_cache'))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+
+# Uploaded media, stored by content hash
+MEDIA_DIR = Path(os.environ.get('MEDIA_DIR', ROOT_DIR / 'media'))
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 ** 3))
+
+# Concurrent ffprobe processes for metadata probes
+PROBE_WORKERS = int(os.environ.get('PROBE_WORKERS', 16))
+PROBE_BATCH_MAX = 1000
+
+# Filmstrip sprites: disk cache plus an in-memory LRU in front of it
+THUMBNAIL_DIR = Path(os.environ.get('THUMBNAIL_DIR', ROOT_DIR / 'thumbnails'))
+THUMBNAIL_MEMORY_BYTES = int(os.environ.get('THUMBNAIL_MEMORY_BYTES', 64 * 1024 ** 2))
+
+# Composited preview stills from GET /api/projects/{id}/frame
+FRAME_CACHE_BYTES = int(os.environ.get('FRAME_CACHE_BYTES', 64 * 1024 ** 2))
+FRAME_MAX_WIDTH = 1920
+
+# Memory-mappable waveform peak pyramids
+WAVEFORM_DIR = Path(os.environ.get('WAVEFORM_DIR', ROOT_DIR / 'waveforms'))
+
+# 360p editing proxies used by the preview player
+PROXY_DIR = Path(os.environ.get('PROXY_DIR', ROOT_DIR / 'proxies'))
+
+# Hosts clips may reference by http(s) URL (the sample library); every other source must be uploaded media
+MEDIA_SOURCE_HOSTS = {
+    host.strip().lower()
+    for host in os.environ.get('MEDIA_SOURCE_HOSTS', 'cdn.coverr.co,www.soundhelix.com').split(',')
+    if host.strip()
+}
+
+# Peers whose X-Forwarded-For is believed: the nginx in front of us (plus any load balancer in front of it)
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip(), strict=False)
+    for net in os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1').split(',')
+    if net.strip()
+]
+
+# When set (e.g. "/internal-media/"), media bytes are handed to nginx via X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT')
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -35,7 +138,332 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class Clip(BaseModel, extra='allow'):
+    id: str
+    type: str
+    start: float
+    duration: float
+    src: Optional[str] = None
+    mediaId: Optional[str] = None
+    name: Optional[str] = None
+    trimStart: float = 0
+
+class Track(BaseModel):
+    id: str
+    type: str
+    clips: List[Clip] = []
+
+class ExportCreate(BaseModel):
+    tracks: List[Track]
+    format: str = 'mp4'
+    quality: str = 'medium'
+    # HLS only: the rungs to encode (defaults to every preset up to `quality`)
+    renditions: Optional[List[str]] = None
+    name: str = 'Untitled Project'
+
+class ExportJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    format: str
+    quality: str
+    renditions: Optional[List[str]] = None
+    owner: str
+    status: str = 'queued'
+    error: Optional[str] = None
+    segments: int = 0
+    cached_segments: int = 0
+    copied_segments: int = 0
+    segments_done: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+async def persist_export_job(job: dict):
+    fields = {key: job[key] for key in ExportJob.model_fields if key in job}
+    await db.export_jobs.update_one({"id": job["id"]}, {"$set": fields})
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    content_type: str
+
+class UploadSession(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    size: int
+    content_type: str
+    offset: int = 0
+    chunk_size: int = UPLOAD_CHUNK_BYTES
+    status: str = 'uploading'
+    media_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class MediaItem(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    type: str
+    content_type: str
+    size: int
+    digest: str
+    proxy_status: Optional[str] = None
+    # Detected shot boundaries in seconds, for "split at scenes"
+    scenes: Optional[List[float]] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+def media_type(content_type: str) -> str:
+    for kind in ('video', 'audio', 'image'):
+        if content_type.startswith(kind + '/'):
+            return kind
+    return 'other'
+
+async def resolve_media_sources(tracks: List[dict]):
+    # Point clips of uploaded media at the stored blob and record its digest
+    media_ids = {clip["mediaId"] for track in tracks for clip in track["clips"] if clip.get("mediaId")}
+    docs = {doc["id"]: doc async for doc in db.media.find({"id": {"$in": list(media_ids)}})} if media_ids else {}
+    for track in tracks:
+        for clip in track["clips"]:
+            doc = docs.get(clip.get("mediaId"))
+            if doc is not None:
+                clip["src"] = str(media_store.blob_path(doc["digest"]))
+                clip["digest"] = doc["digest"]
+                # Lets the render engine stream-copy plain cuts between keyframes
+                clip["video"] = doc.get("video")
+                clip["keyframes"] = doc.get("keyframes")
+            else:
+                # Cache keys and smart cuts trust these, so they only ever come from the media collection
+                for field in ("digest", "video", "keyframes"):
+                    clip.pop(field, None)
+
+def source_error(clip: dict) -> Optional[str]:
+    """Why ffmpeg must not read this clip's source, or None if it may."""
+    src = clip.get("src")
+    if not src:
+        return "has no source"
+    url = urlsplit(src)
+    if url.scheme in ("http", "https"):
+        if (url.hostname or "").lower() in MEDIA_SOURCE_HOSTS:
+            return None
+        return f"source host {url.hostname} is not allowed"
+    # Anything else is handed to ffmpeg as a path or protocol, so it has to be one of our blobs
+    if media_store.is_blob(src):
+        return None
+    return "source is not uploaded media"
+
+def _trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in net for net in TRUSTED_PROXIES)
+
+def client_address(request: Request) -> str:
+    """The address of whoever sent the request, looking through trusted proxies only.
+
+    X-Forwarded-For is read right to left, since every hop appends to it and
+    only the entries our own proxies added can be believed.
+    """
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    hops.append(request.client.host if request.client else "anonymous")
+    for hop in reversed(hops):
+        if not _trusted_proxy(hop):
+            return hop
+    return hops[0]
+
+def source_errors(clips: List[dict]) -> List[str]:
+    errors = []
+    for clip in clips:
+        error = source_error(clip)
+        if error is not None:
+            errors.append(f"Clip {clip.get('id')} {error}")
+    return errors
+
+# Settled media documents, so scrubbing can skip Mongo. Only documents that will never be written
+# again are kept: background processing may finish in any worker process, and this one would not hear of it
+_media_docs: "OrderedDict[str, dict]" = OrderedDict()
+MEDIA_DOC_CACHE_SIZE = 4096
+
+def media_settled(media: dict) -> bool:
+    if media.get("type") != "video":
+        return True
+    return media.get("keyframes") is not None and media.get("proxy_status") == "ready" and media.get("scenes") is not None
+
+async def get_media_doc(media_id: str) -> dict:
+    media = _media_docs.get(media_id)
+    if media is not None:
+        _media_docs.move_to_end(media_id)
+        return media
+    media = await db.media.find_one({"id": media_id}, {"_id": 0})
+    if media is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    if media_settled(media):
+        _media_docs[media_id] = media
+        if len(_media_docs) > MEDIA_DOC_CACHE_SIZE:
+            _media_docs.popitem(last=False)
+    return media
+
+def proxy_path(digest: str) -> Path:
+    return PROXY_DIR / f"{digest}.mp4"
+
+async def create_proxy(media: dict):
+    # Background transcode that also streams frames to scene detection, so the source is decoded once;
+    # waits behind any interactive work on the shared pool
+    digest = media["digest"]
+    path = proxy_path(digest)
+    topic = f"media:{media['id']}"
+    progress_broker.publish(topic, {"id": media["id"], "status": "processing"})
+    update = {}
+    if not path.exists():
+        tmp = path.with_suffix(".tmp.mp4")
+        try:
+            cmd = build_proxy_command(str(media_store.blob_path(digest)), str(tmp), scan_filter=SCAN_FILTER)
+            scenes = await render_engine.run_in_pool(run_scan, cmd, priority=PRIORITY_BACKGROUND)
+            tmp.replace(path)
+            update = {"proxy_status": "ready", "scenes": scenes}
+        except Exception as e:
+            logger.warning("Proxy for %s failed: %s", digest, e)
+            tmp.unlink(missing_ok=True)
+            update = {"proxy_status": "failed"}
+    else:
+        update["proxy_status"] = "ready"
+        if media.get("scenes") is None:
+            # Proxies made before scene detection existed; scanning the 360p proxy is cheap
+            try:
+                update["scenes"] = await render_engine.run_in_pool(run_scan, scan_command(str(path)), priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                logger.warning("Scene detection for %s failed: %s", digest, e)
+    await db.media.update_many({"digest": digest}, {"$set": update})
+    progress_broker.publish(topic, media_progress({**media, **update}), final=True)
+
+def media_progress(media: dict) -> dict:
+    scenes = media.get("scenes")
+    return {
+        "id": media["id"],
+        "status": media.get("proxy_status") or ("processing" if media.get("type") == "video" else "ready"),
+        "proxy_status": media.get("proxy_status"),
+        "scenes": len(scenes) if scenes is not None else None,
+    }
+
+async def index_keyframes(media: dict):
+    # One probe pass per file; stored with the media so seeks and exports never re-probe
+    digest = media["digest"]
+    src = str(media_store.blob_path(digest))
+    try:
+        # Stream parameters come from the cached metadata probe; only the keyframe scan is new work
+        probe = await probe_cache.get(digest, src)
+        index = await render_engine.run_in_pool(index_media, src, probe, priority=PRIORITY_BACKGROUND)
+        await db.media.update_many({"digest": digest}, {"$set": index})
+    except Exception as e:
+        logger.warning("Keyframe index for %s failed: %s", digest, e)
+
+async def probe_media_item(media: dict):
+    try:
+        await probe_cache.get(media["digest"], str(media_store.blob_path(media["digest"])))
+    except Exception as e:
+        logger.warning("Probe for %s failed: %s", media["digest"], e)
+
+# The event loop only holds weak references to tasks, so fire-and-forget work is kept here until it ends
+background_tasks = set()
+
+def _background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_name(), exc_info=task.exception())
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=coro.__qualname__)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+def schedule_media_processing(media: dict):
+    if media["type"] in ("audio", "video"):
+        # Metadata is ready by the time the client asks for it
+        spawn(probe_media_item(media))
+    if media["type"] != "video":
+        return
+    if media.get("keyframes") is None:
+        spawn(index_keyframes(media))
+    if media.get("proxy_status") != "ready" or media.get("scenes") is None:
+        spawn(create_proxy(media))
+
+class ProjectCreate(BaseModel):
+    name: str = 'Untitled Project'
+    state: Optional[Dict[str, Any]] = None
+
+class ProjectPatch(BaseModel):
+    base_version: int
+    ops: List[Dict[str, Any]]
+
+project_store = ProjectStore(db)
+
+# (project id, version) -> TimelineIndex with media sources resolved; a version never changes
+_timelines: "OrderedDict[tuple, TimelineIndex]" = OrderedDict()
+TIMELINE_CACHE_SIZE = 64
+
+async def get_timeline(project_id: str) -> TimelineIndex:
+    version, state = await project_store.load(project_id)
+    key = (project_id, version)
+    timeline = _timelines.get(key)
+    if timeline is not None:
+        _timelines.move_to_end(key)
+        return timeline
+    # The store hands out its cached state, so resolve sources on a copy
+    tracks = copy.deepcopy(state["tracks"])
+    await resolve_media_sources(tracks)
+    timeline = TimelineIndex(tracks)
+    _timelines[key] = timeline
+    if len(_timelines) > TIMELINE_CACHE_SIZE:
+        _timelines.popitem(last=False)
+    return timeline
+
+async def compact_projects_periodically():
+    while True:
+        await asyncio.sleep(PROJECT_COMPACT_INTERVAL)
+        await project_store.compact_all()
+
+media_store = MediaStore(MEDIA_DIR)
+sprite_cache = SpriteCache(THUMBNAIL_DIR, THUMBNAIL_MEMORY_BYTES)
+probe_cache = ProbeCache(db, PROBE_WORKERS)
+frame_cache = FrameCache(FRAME_CACHE_BYTES)
+waveform_store = WaveformStore(WAVEFORM_DIR)
+render_cache = SegmentCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES)
+progress_broker = ProgressBroker(PROGRESS_RATE, PROGRESS_DIR)
+# Sized to the whole machine: an export runs in whichever worker took the POST, and splitting
+# the cores between workers would leave it one ffmpeg process (so keep WEB_CONCURRENCY small)
+render_engine = RenderEngine(EXPORT_DIR, cache=render_cache, on_update=persist_export_job, progress=progress_broker)
+register_collector(StatsCollector(render_engine, {'segments': render_cache, 'probes': probe_cache, 'frames': frame_cache}))
+
+status_writer = WriteCoalescer(
+    lambda docs: db.status_checks.insert_many(docs, ordered=False),
+    max_delay=STATUS_COALESCE_MS / 1000,
+    max_batch=STATUS_COALESCE_MAX,
+) if STATUS_COALESCE_MS > 0 else None
+
 # Add your routes to the router instead of directly to app
+@api_router.get("/healthz")
+async def healthz():
+    # Liveness: the event loop is answering
+    return {"status": "ok"}
+
+@api_router.get("/readyz")
+async def readyz():
+    checks: Dict[str, Any] = {
+        "started": ready,
+        "primary": _primary_lock is not None,
+        "render_workers": render_engine.workers if render_engine.started else 0,
+        "probe_workers": probe_cache.workers,
+        "progress": progress_broker.running,
+    }
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READY_TIMEOUT)
+        checks["mongo"] = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        checks["mongo"] = {"ok": False, "error": str(e) or type(e).__name__}
+    ok = ready and checks["mongo"]["ok"] and render_engine.started and progress_broker.running
+    body = {"status": "ready" if ok else "unavailable", **checks}
+    return Response(json.dumps(body), status_code=200 if ok else 503, media_type="application/json")
+
 @api_router.get("/")
 async def root():
     return {"message": "Hello World"}
@@ -44,13 +472,485 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    if status_writer is not None:
+        await status_writer.insert(status_obj.dict())
+    else:
+        _ = await db.status_checks.insert_one(status_obj.dict())
     return status_obj
 
+@api_router.post("/status/batch", response_model=List[StatusCheck])
+async def create_status_checks(input: List[StatusCheckCreate]):
+    if not input:
+        return []
+    if len(input) > STATUS_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {STATUS_BATCH_MAX} status checks per batch")
+    status_objs = [StatusCheck(**item.dict()) for item in input]
+    _ = await db.status_checks.insert_many([status_obj.dict() for status_obj in status_objs], ordered=False)
+    return status_objs
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def encode_status_cursor(doc: dict) -> str:
+    return base64.urlsafe_b64encode(f"{doc['timestamp'].isoformat()}|{doc['id']}".encode()).decode()
+
+def status_cursor_query(cursor: Optional[str]) -> dict:
+    # Keyset on (timestamp, id): everything strictly after the cursor's row
+    if not cursor:
+        return {}
+    try:
+        timestamp, _, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        timestamp = datetime.fromisoformat(timestamp)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [{"timestamp": {"$gt": timestamp}}, {"timestamp": timestamp, "id": {"$gt": last_id}}]}
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    limit: int = Query(STATUS_PAGE_SIZE, ge=1, le=STATUS_PAGE_MAX),
+    after: Optional[str] = None,
+    stream: bool = False,
+):
+    query = status_cursor_query(after)
+    cursor = db.status_checks.find(query, {"_id": 0}).sort([("timestamp", 1), ("id", 1)])
+
+    if stream:
+        # NDJSON straight off the Motor cursor, a batch at a time, with no limit on total rows
+        async def ndjson():
+            lines = []
+            async for doc in cursor.batch_size(STATUS_STREAM_BATCH):
+                lines.append(json.dumps(doc, default=_json_default))
+                if len(lines) >= STATUS_STREAM_BATCH:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    # Documents are already in StatusCheck shape, so they are serialized as-is
+    docs = await cursor.limit(limit).to_list(limit)
+    headers = {"X-Next-Cursor": encode_status_cursor(docs[-1])} if len(docs) == limit else {}
+    return Response(json.dumps(docs, default=_json_default), media_type="application/json", headers=headers)
+
+@api_router.post("/projects", status_code=201)
+async def create_project(input: ProjectCreate):
+    try:
+        return await project_store.create(str(uuid.uuid4()), input.name, input.state)
+    except (PatchError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid project state: {e}")
+
+@api_router.get("/projects/{project_id}")
+async def get_project(project_id: str):
+    try:
+        version, state = await project_store.load(project_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return {"id": project_id, "version": version, "state": state}
+
+@api_router.patch("/projects/{project_id}")
+async def patch_project(project_id: str, input: ProjectPatch):
+    # Only the new version is returned; the client already holds the state it patched
+    try:
+        version, _ = await project_store.patch(project_id, input.base_version, input.ops)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Project not found")
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.version})
+    except PatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": project_id, "version": version}
+
+@api_router.get("/projects/{project_id}/ops")
+async def get_project_ops(project_id: str, since: int = Query(..., ge=0)):
+    try:
+        ops = await project_store.ops_since(project_id, since)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if ops is None:
+        raise HTTPException(status_code=410, detail="Ops were compacted; reload the project")
+    return {"id": project_id, "ops": ops}
+
+@api_router.get("/projects/{project_id}/frame")
+async def get_project_frame(
+    project_id: str,
+    t: float = Query(..., ge=0),
+    width: int = Query(640, ge=16, le=FRAME_MAX_WIDTH),
+):
+    try:
+        timeline = await get_timeline(project_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Project not found")
+    # Snap to the export frame grid so nearby scrub positions share a cached frame
+    t = round(t * EXPORT_FPS) / EXPORT_FPS
+    width -= width % 2
+    active = timeline.active_at(t)
+    errors = source_errors([clip for track, clip in active if track["type"] == "video"])
+    if errors:
+        raise HTTPException(status_code=422, detail="; ".join(errors))
+    try:
+        image = await frame_cache.get(
+            frame_key(active, t, width),
+            lambda: render_engine.run_in_pool(render_frame, active, t, width),
+        )
+    except RenderError as e:
+        logger.warning("Frame at %.3fs of project %s failed: %s", t, project_id, e)
+        raise HTTPException(status_code=422, detail="Could not render frame")
+    return Response(image, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=60"})
+
+@api_router.post("/exports", response_model=ExportJob, status_code=202)
+async def create_export(input: ExportCreate, request: Request):
+    if input.format not in FORMAT_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {input.format}")
+    if input.quality not in QUALITY_PRESETS:
+        raise HTTPException(status_code=400, detail=f"Unsupported quality: {input.quality}")
+
+    # Exports are queued round-robin per owner; the client has no say in which owner it is
+    owner = client_address(request)
+    ladder = FORMAT_OPTIONS[input.format].get('ladder')
+    try:
+        renditions = ladder_renditions(input.renditions, input.quality) if ladder else None
+    except RenderError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job_obj = ExportJob(name=input.name, format=input.format, quality=input.quality, renditions=renditions, owner=owner)
+    tracks = [track.dict() for track in input.tracks]
+    await resolve_media_sources(tracks)
+    errors = source_errors([clip for track in tracks if track["type"] in ("video", "audio") for clip in track["clips"]])
+    if errors:
+        raise HTTPException(status_code=400, detail="; ".join(errors))
+    # HLS exports are a directory of playlists and segments
+    output = EXPORT_DIR / f"{job_obj.id}.{input.format}"
+    try:
+        # Validate the timeline up front so bad requests fail fast
+        check_audio(tracks)
+        if ladder:
+            build_ladder_command(tracks, renditions, str(output))
+        else:
+            build_render_command(tracks, input.format, input.quality, str(output))
+    except RenderError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await db.export_jobs.insert_one(job_obj.dict())
+    await render_engine.submit({**job_obj.dict(), "tracks": tracks, "output": str(output)})
+    return job_obj
+
+@api_router.post("/uploads", response_model=UploadSession, status_code=201)
+async def create_upload(input: UploadCreate):
+    if not 0 < input.size <= MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=400, detail="Invalid upload size")
+    if media_type(input.content_type) == 'other':
+        raise HTTPException(status_code=400, detail=f"Unsupported media type: {input.content_type}")
+    session = UploadSession(**input.dict())
+    media_store.create(session.id)
+    await db.uploads.insert_one(session.dict())
+    return session
+
+async def get_upload_session(upload_id: str) -> UploadSession:
+    session = await db.uploads.find_one({"id": upload_id})
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    session = UploadSession(**session)
+    if session.status == 'uploading':
+        session.offset = media_store.offset(upload_id)
+    return session
+
+@api_router.get("/uploads/{upload_id}", response_model=UploadSession)
+async def get_upload(upload_id: str):
+    return await get_upload_session(upload_id)
+
+@api_router.head("/uploads/{upload_id}")
+async def head_upload(upload_id: str):
+    session = await get_upload_session(upload_id)
+    return Response(headers={"Upload-Offset": str(session.offset), "Upload-Length": str(session.size)})
+
+@api_router.put("/uploads/{upload_id}", response_model=UploadSession)
+async def upload_chunk(upload_id: str, request: Request):
+    session = await get_upload_session(upload_id)
+    if session.status != 'uploading':
+        return session
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Missing or invalid Upload-Offset header")
+
+    try:
+        session.offset = await media_store.append(upload_id, offset, session.size, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(media_store.offset(upload_id))})
+    except ClientDisconnect:
+        # Whatever reached the disk is kept; the client resumes from HEAD
+        session.offset = media_store.offset(upload_id)
+
+    if session.offset == session.size:
+        digest, _ = await media_store.finalize(upload_id)
+        media = await db.media.find_one({"digest": digest})
+        if media is None:
+            media = MediaItem(
+                name=session.filename,
+                type=media_type(session.content_type),
+                content_type=session.content_type,
+                size=session.size,
+                digest=digest,
+            ).dict()
+            await db.media.insert_one(media)
+            schedule_media_processing(media)
+        session.status = 'completed'
+        session.media_id = media["id"]
+    await db.uploads.update_one(
+        {"id": upload_id},
+        {"$set": {"offset": session.offset, "status": session.status, "media_id": session.media_id}},
+    )
+    return session
+
+@api_router.delete("/uploads/{upload_id}", status_code=204)
+async def abort_upload(upload_id: str):
+    session = await get_upload_session(upload_id)
+    if session.status == 'uploading':
+        media_store.discard(upload_id)
+        await db.uploads.delete_one({"id": upload_id})
+    return Response(status_code=204)
+
+@api_router.get("/media/{media_id}/info", response_model=MediaItem)
+async def get_media_info(media_id: str):
+    return MediaItem(**await get_media_doc(media_id))
+
+class ProbeBatch(BaseModel):
+    ids: List[str]
+
+@api_router.get("/media/{media_id}/events")
+async def media_events(media_id: str):
+    # Proxy transcode and scene detection progress
+    topic = f"media:{media_id}"
+    if progress_broker.latest(topic) is not None:
+        return event_stream(progress_broker.subscribe(topic, keepalive=PROGRESS_KEEPALIVE))
+    media = await get_media_doc(media_id)
+
+    async def current():
+        yield media_progress(media)
+
+    return event_stream(current())
+
+@api_router.get("/media/{media_id}/probe")
+async def get_media_probe(media_id: str):
+    media = await get_media_doc(media_id)
+    try:
+        return await probe_cache.get(media["digest"], str(media_store.blob_path(media["digest"])))
+    except ProbeError as e:
+        raise HTTPException(status_code=422, detail=f"Could not probe media: {e}")
+
+@api_router.post("/media/probe")
+async def probe_media_batch(input: ProbeBatch):
+    # Bulk import: known files come from one query, the rest are probed in parallel
+    if len(input.ids) > PROBE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {PROBE_BATCH_MAX} ids per request")
+    docs = [doc async for doc in db.media.find({"id": {"$in": input.ids}}, {"_id": 0, "id": 1, "digest": 1})]
+    results = await probe_cache.get_many((doc["digest"], str(media_store.blob_path(doc["digest"]))) for doc in docs)
+    probes, errors = {}, {}
+    for doc in docs:
+        result = results[doc["digest"]]
+        if isinstance(result, Exception):
+            errors[doc["id"]] = str(result)
+        else:
+            probes[doc["id"]] = result
+    missing = [media_id for media_id in input.ids if media_id not in probes and media_id not in errors]
+    return {"probes": probes, "errors": errors, "missing": missing}
+
+def serve_file(request: Request, path: Path, size: int, content_type: str, etag: str, cache_control: str, accel_path: str):
+    if MEDIA_ACCEL_REDIRECT:
+        # nginx serves the file itself with sendfile, including Range and conditional requests
+        return Response(headers={
+            "X-Accel-Redirect": f"{MEDIA_ACCEL_REDIRECT}{accel_path}",
+            "Content-Type": content_type,
+            "Cache-Control": cache_control,
+        })
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    return RangeFileResponse(str(path), size, byte_range, headers, content_type, send_body=request.method != "HEAD")
+
+@api_router.api_route("/media/{media_id}", methods=["GET", "HEAD"])
+async def stream_media(media_id: str, request: Request):
+    media = await get_media_doc(media_id)
+    digest = media["digest"]
+    # Blobs are content-addressed, so the digest is a strong validator and the bytes never change
+    return serve_file(
+        request, media_store.blob_path(digest), media["size"], media["content_type"],
+        etag=f'"{digest}"', cache_control="public, max-age=31536000, immutable",
+        accel_path=f"blobs/{digest[:2]}/{digest}",
+    )
+
+@api_router.api_route("/media/{media_id}/preview", methods=["GET", "HEAD"])
+async def stream_media_preview(media_id: str, request: Request):
+    # The proxy once it exists, the original until then; revalidated so players pick up the switch
+    media = await get_media_doc(media_id)
+    digest = media["digest"]
+    proxy = proxy_path(digest)
+    if media["type"] == "video" and proxy.exists():
+        return serve_file(
+            request, proxy, proxy.stat().st_size, "video/mp4",
+            etag=f'"{digest}-proxy"', cache_control="no-cache", accel_path=f"proxies/{digest}.mp4",
+        )
+    return serve_file(
+        request, media_store.blob_path(digest), media["size"], media["content_type"],
+        etag=f'"{digest}"', cache_control="no-cache", accel_path=f"blobs/{digest[:2]}/{digest}",
+    )
+
+@api_router.get("/media/{media_id}/keyframes")
+async def get_keyframes(media_id: str, t: Optional[float] = Query(None, ge=0)):
+    # With `t`, the keyframes around it, so the player can land on a cheap seek point
+    media = await get_media_doc(media_id)
+    keyframes = media.get("keyframes")
+    if keyframes is None:
+        raise HTTPException(status_code=404, detail="Keyframe index not built yet")
+    if t is None:
+        return {"keyframes": keyframes}
+    return {"time": t, "before": keyframe_before(keyframes, t), "after": keyframe_after(keyframes, t)}
+
+async def get_filmstrip(media_id: str, count: int, width: int):
+    media = await get_media_doc(media_id)
+    if media["type"] != "video":
+        raise HTTPException(status_code=400, detail="Filmstrips are only available for video")
+    # The proxy is plenty for tiles and far cheaper to decode than the original
+    path = proxy_path(media["digest"])
+    src = str(path if media.get("proxy_status") == "ready" else media_store.blob_path(media["digest"]))
+    key = f"{media['digest']}-{count}-{width}"
+    try:
+        return await sprite_cache.get(key, lambda output: render_engine.run_in_pool(render_sprite, src, count, width, output))
+    except (RenderError, ProbeError) as e:
+        logger.warning("Filmstrip for %s failed: %s", media["digest"], e)
+        raise HTTPException(status_code=422, detail="Could not render filmstrip")
+
+@api_router.get("/media/{media_id}/filmstrip")
+async def get_filmstrip_index(media_id: str, count: int = Query(10, ge=1, le=100), width: int = Query(160, ge=40, le=480)):
+    _, index = await get_filmstrip(media_id, count, width)
+    return {**index, "image": f"/api/media/{media_id}/filmstrip.jpg?count={count}&width={width}"}
+
+@api_router.get("/media/{media_id}/filmstrip.jpg")
+async def get_filmstrip_image(media_id: str, count: int = Query(10, ge=1, le=100), width: int = Query(160, ge=40, le=480)):
+    image, _ = await get_filmstrip(media_id, count, width)
+    return Response(image, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@api_router.get("/media/{media_id}/waveform")
+async def get_waveform(
+    media_id: str,
+    start: float = Query(0, ge=0),
+    end: Optional[float] = Query(None, ge=0),
+    pixels_per_second: float = Query(100, gt=0),
+):
+    # Returns int8 (min, max) pairs for the visible window at the level matching the Timeline zoom
+    media = await get_media_doc(media_id)
+    if media["type"] not in ("audio", "video"):
+        raise HTTPException(status_code=400, detail="Waveforms are only available for audio and video")
+    src = str(media_store.blob_path(media["digest"]))
+    # The probe is cached by digest, so a video without sound is turned away without decoding it again
+    try:
+        probe = await probe_cache.get(media["digest"], src)
+    except ProbeError as e:
+        raise HTTPException(status_code=422, detail=f"Could not probe media: {e}")
+    if probe.get("audio") is None:
+        raise HTTPException(status_code=422, detail="Media has no audio track")
+    try:
+        pyramid = await waveform_store.get(media["digest"], lambda output: render_engine.run_in_pool(build_peaks, src, output))
+    except WaveformError as e:
+        logger.warning("Waveform for %s failed: %s", media["digest"], e)
+        raise HTTPException(status_code=422, detail="Could not decode audio")
+    if end is None:
+        end = start + 1000 / pixels_per_second
+    level, first, peaks = pyramid.window(start, end, pixels_per_second)
+    return Response(peaks, media_type="application/octet-stream", headers={
+        "X-Waveform-Level": str(level),
+        "X-Waveform-First-Bucket": str(first),
+        "X-Waveform-Bucket-Seconds": repr(pyramid.bucket_seconds(level)),
+        "Cache-Control": "public, max-age=31536000, immutable",
+    })
+
+@api_router.get("/render-cache/stats")
+async def get_render_cache_stats():
+    return render_cache.stats()
+
+@api_router.get("/probe-cache/stats")
+async def get_probe_cache_stats():
+    return probe_cache.stats()
+
+@api_router.get("/exports/{job_id}", response_model=ExportJob)
+async def get_export(job_id: str):
+    job = render_engine.jobs.get(job_id) or await db.export_jobs.find_one({"id": job_id})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return ExportJob(**job)
+
+def event_stream(events) -> StreamingResponse:
+    async def encode():
+        async for snapshot in events:
+            # Comment lines keep idle connections open through proxies
+            yield ": keepalive\n\n" if snapshot is None else f"data: {json.dumps(snapshot, default=_json_default)}\n\n"
+    return StreamingResponse(encode(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@api_router.get("/exports/{job_id}/events")
+async def export_events(job_id: str):
+    topic = f"export:{job_id}"
+    if job_id in render_engine.jobs or progress_broker.latest(topic) is not None:
+        return event_stream(progress_broker.subscribe(topic, keepalive=PROGRESS_KEEPALIVE))
+
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+
+    async def from_mongo(job):
+        # Finished before the relay was swept, or rendering on another host
+        while True:
+            snapshot = {key: job.get(key) for key in ("id", "status", "segments", "segments_done", "cached_segments", "copied_segments", "error")}
+            yield snapshot
+            if job["status"] in ("completed", "failed"):
+                return
+            await asyncio.sleep(PROGRESS_FALLBACK_INTERVAL)
+            job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+
+    return event_stream(from_mongo(job))
+
+@api_router.get("/exports/{job_id}/download")
+async def download_export(job_id: str):
+    job = await db.export_jobs.find_one({"id": job_id})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    if FORMAT_OPTIONS.get(job['format'], {}).get('ladder'):
+        return RedirectResponse("hls/master.m3u8")
+    return FileResponse(EXPORT_DIR / f"{job_id}.{job['format']}", filename=f"{job['name']}.{job['format']}")
+
+HLS_CONTENT_TYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.ts': 'video/mp2t'}
+
+@api_router.get("/exports/{job_id}/hls/{path:path}")
+async def get_export_hls(job_id: str, path: str):
+    # The master playlist is written last, so players only find finished ladders;
+    # segments are served straight off disk without a job lookup per request
+    root = (EXPORT_DIR / f"{job_id}.hls").resolve()
+    target = (root / path).resolve()
+    if root not in target.parents or target.suffix not in HLS_CONTENT_TYPES or not target.is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(target, media_type=HLS_CONTENT_TYPES[target.suffix])
+
+# Scraped directly from the backend port, outside /api
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = latest_metrics()
+    return Response(body, media_type=content_type)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -61,7 +961,9 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Upload-Offset", "Upload-Length"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -70,6 +972,67 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Set once startup has finished; /api/readyz reports unavailable until then
+ready = False
+
+# Held for the life of the process by the one worker that runs the once-per-host background work
+PRIMARY_LOCK_PATH = Path(os.environ.get('PRIMARY_LOCK_PATH', ROOT_DIR / '.primary.lock'))
+_primary_lock = None
+
+def claim_primary() -> bool:
+    global _primary_lock
+    handle = open(PRIMARY_LOCK_PATH, 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return False
+    # The kernel releases the lock when this process exits, however it exits
+    _primary_lock = handle
+    return True
+
+async def resume_media_processing():
+    # Pick up indexing, proxies and scene detection that were never done or were interrupted by a restart
+    query = {"type": "video", "$or": [{"keyframes": None}, {"proxy_status": {"$ne": "ready"}}, {"scenes": None}]}
+    async for media in db.media.find(query, {"_id": 0}):
+        schedule_media_processing(media)
+
+async def warm_mongo_pool():
+    # Concurrent pings each need their own connection, so this opens the pool up front
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+
+@app.on_event("startup")
+async def start_render_engine():
+    global ready
+    started = time.perf_counter()
+    # Every worker process runs this; index creation is idempotent, so they can race
+    await warm_mongo_pool()
+    await asyncio.gather(
+        db.status_checks.create_index([("timestamp", 1), ("id", 1)]),
+        project_store.create_indexes(),
+        db.media.create_index("id", unique=True),
+        db.media.create_index("digest"),
+        db.uploads.create_index("id", unique=True),
+        probe_cache.create_indexes(),
+    )
+    media_store.start()
+    sprite_cache.start()
+    waveform_store.start()
+    progress_broker.start()
+    render_engine.start()
+    PROXY_DIR.mkdir(parents=True, exist_ok=True)
+    # Sweeps and restart recovery would be duplicated by every worker; one does them
+    if claim_primary():
+        spawn(compact_projects_periodically())
+        spawn(resume_media_processing())
+    ready = True
+    logger.info("Worker %d ready in %.2fs%s", os.getpid(), time.perf_counter() - started, " (primary)" if _primary_lock else "")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if status_writer is not None:
+        await status_writer.drain()
+    await render_engine.shutdown()
+    await progress_broker.stop()
+    probe_cache.shutdown()
     client.close()
@@ -0,0 +1,115 @@
+"""Filmstrip sprites for media tiles and timeline clips.
+
+N evenly spaced frames are pulled from a media item in a single decode pass
+and tiled into one JPEG, with a JSON index giving each frame's time and
+position in the sprite. Sprites are cached in an in-memory LRU backed by a
+disk cache, both keyed by media digest and sprite layout.
+"""
+import asyncio
+import json
+import math
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from probe import probe_duration
+from render import FFMPEG_BIN, run_ffmpeg
+
+SPRITE_COLUMNS = 10
+
+
+def sprite_layout(count: int, tile_width: int) -> Dict[str, int]:
+    tile_height = int(round(tile_width * 9 / 16 / 2)) * 2
+    columns = min(count, SPRITE_COLUMNS)
+    return {
+        'count': count,
+        'columns': columns,
+        'rows': math.ceil(count / columns),
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+    }
+
+
+def render_sprite(src: str, count: int, tile_width: int, output: str) -> Dict[str, Any]:
+    """Decode `src` once and write the sprite; returns its index. Runs in a pool worker."""
+    layout = sprite_layout(count, tile_width)
+    duration = probe_duration(src)
+    interval = duration / count if duration > 0 else 1.0
+    w, h = layout['tile_width'], layout['tile_height']
+    vf = (
+        f"fps=1/{interval:.6f},"
+        f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,"
+        f"tile={layout['columns']}x{layout['rows']}"
+    )
+    run_ffmpeg([
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-y',
+        # Start half an interval in so each tile is the middle of its span, not a fade-in frame
+        '-ss', f"{interval / 2:.3f}", '-an', '-sn', '-dn', '-i', src,
+        '-vf', vf, '-frames:v', '1', '-q:v', '5', output,
+    ])
+    frames = [
+        {
+            'time': round(interval * (n + 0.5), 3),
+            'x': (n % layout['columns']) * w,
+            'y': (n // layout['columns']) * h,
+        }
+        for n in range(count)
+    ]
+    return {**layout, 'duration': duration, 'interval': interval, 'frames': frames}
+
+
+class SpriteCache:
+    """In-memory LRU of sprites in front of a disk cache."""
+
+    def __init__(self, root: Path, max_memory_bytes: int):
+        self.root = root
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: "OrderedDict[str, Tuple[bytes, Dict[str, Any]]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def start(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _remember(self, key: str, entry: Tuple[bytes, Dict[str, Any]]) -> None:
+        self._memory[key] = entry
+        self._memory_bytes += len(entry[0])
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, (image, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(image)
+
+    def _read_disk(self, key: str):
+        image_path, index_path = self.root / f"{key}.jpg", self.root / f"{key}.json"
+        if not index_path.exists():
+            return None
+        return image_path.read_bytes(), json.loads(index_path.read_text())
+
+    async def get(self, key: str, create: Callable[[str], Awaitable[Dict[str, Any]]]) -> Tuple[bytes, Dict[str, Any]]:
+        """Return (jpeg, index) for `key`, calling `create(image_path)` on a full miss."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+
+        # Concurrent requests for the same sprite share one generation, run as its own
+        # task so that a request going away doesn't cancel it for the others
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._generate(key, create))
+        return await asyncio.shield(pending)
+
+    async def _generate(self, key: str, create: Callable[[str], Awaitable[Dict[str, Any]]]):
+        try:
+            entry = await run_in_threadpool(self._read_disk, key)
+            if entry is None:
+                image_path = self.root / f"{key}.jpg"
+                index = await create(str(image_path))
+                # The index is written last; its presence marks a complete entry
+                await run_in_threadpool((self.root / f"{key}.json").write_text, json.dumps(index))
+                entry = (await run_in_threadpool(image_path.read_bytes), index)
+            self._remember(key, entry)
+            return entry
+        finally:
+            del self._pending[key]
@@ -0,0 +1,218 @@
+"""Timeline model with per-track interval indexes, and a still-frame compositor.
+
+`TimelineIndex` answers "which clips are active at time t" with one interval
+tree per track instead of scanning every clip. The compositor renders the
+active video and text clips at t into a single JPEG, applying clip effects
+with the NumPy path of `effects`, and `FrameCache` keeps recently requested
+frames keyed by what is actually on screen, so edits elsewhere on the
+timeline don't invalidate them.
+"""
+import asyncio
+import hashlib
+import json
+import subprocess
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from effects import EffectError, apply_stack, compile_stack
+from render import FFMPEG_BIN, RenderError, drawtext_filter
+
+Interval = Tuple[float, float, Any]
+
+
+class IntervalTree:
+    """Static centered interval tree over half-open [start, end) intervals."""
+
+    def __init__(self, intervals: List[Interval]):
+        self.center: Optional[float] = None
+        self.left: Optional['IntervalTree'] = None
+        self.right: Optional['IntervalTree'] = None
+        self.by_start: List[Interval] = []
+        self.by_end: List[Interval] = []
+        intervals = [iv for iv in intervals if iv[0] < iv[1]]
+        if not intervals:
+            return
+
+        # The lower median endpoint always splits off at least one interval, so this terminates
+        points = sorted(p for start, end, _ in intervals for p in (start, end))
+        self.center = points[(len(points) - 1) // 2]
+        left = [iv for iv in intervals if iv[1] <= self.center]
+        right = [iv for iv in intervals if iv[0] > self.center]
+        here = [iv for iv in intervals if iv[0] <= self.center < iv[1]]
+        self.by_start = sorted(here, key=lambda iv: iv[0])
+        self.by_end = sorted(here, key=lambda iv: iv[1], reverse=True)
+        if left:
+            self.left = IntervalTree(left)
+        if right:
+            self.right = IntervalTree(right)
+
+    def at(self, t: float) -> List[Any]:
+        found: List[Any] = []
+        node = self
+        while node is not None and node.center is not None:
+            if t < node.center:
+                # Every interval here ends after the center, so only the start matters
+                for start, _, value in node.by_start:
+                    if start > t:
+                        break
+                    found.append(value)
+                node = node.left
+            else:
+                for _, end, value in node.by_end:
+                    if end <= t:
+                        break
+                    found.append(value)
+                node = node.right
+        return found
+
+
+class TimelineIndex:
+    def __init__(self, tracks: List[Dict[str, Any]]):
+        self.tracks = tracks
+        self._trees = [
+            IntervalTree([(clip['start'], clip['start'] + clip['duration'], clip) for clip in track.get('clips', [])])
+            for track in tracks
+        ]
+
+    def active_at(self, t: float, kinds=('video', 'text')) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """(track, clip) pairs active at t, bottom track first, then clips in start order as listed."""
+        active = []
+        for track, tree in zip(self.tracks, self._trees):
+            if track.get('type') in kinds:
+                position = {id(clip): n for n, clip in enumerate(track.get('clips', []))}
+                clips = sorted(tree.at(t), key=lambda clip: (clip['start'], position[id(clip)]))
+                active.extend((track, clip) for clip in clips)
+        return active
+
+
+def frame_key(active: List[Tuple[Dict[str, Any], Dict[str, Any]]], t: float, width: int) -> str:
+    """Identify a frame by what is on screen, not by project or version."""
+    layers = []
+    for track, clip in active:
+        layer = {'type': track['type'], 'source': clip.get('digest') or clip.get('src')}
+        if track['type'] == 'video':
+            layer['at'] = round(clip.get('trimStart', 0) + t - clip['start'], 3)
+        for field in ('filter', 'adjustments', 'effects', 'text', 'name', 'color'):
+            if field in clip:
+                layer[field] = clip[field]
+        layers.append(layer)
+    payload = json.dumps({'layers': layers, 'width': width}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def frame_height(width: int) -> int:
+    return int(round(width * 9 / 16 / 2)) * 2
+
+
+def build_decode_command(clip: Dict[str, Any], t: float, width: int) -> List[str]:
+    """Decode the clip's frame at timeline time t as raw RGB, scaled like an export."""
+    height = frame_height(width)
+    offset = clip.get('trimStart', 0) + t - clip['start']
+    return [
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error',
+        '-ss', f"{offset:.3f}", '-an', '-sn', '-dn', '-i', clip['src'],
+        '-vf', f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1",
+        '-frames:v', '1', '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1',
+    ]
+
+
+def build_encode_command(texts: List[Dict[str, Any]], width: int) -> List[str]:
+    """Draw text clips over a raw RGB frame read from stdin and write a JPEG to stdout."""
+    height = frame_height(width)
+    filters = [drawtext_filter(clip, height) for clip in texts]
+    return [
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{width}x{height}", '-i', 'pipe:0',
+        '-vf', ','.join(filters + ['format=yuvj420p']),
+        '-frames:v', '1', '-q:v', '3', '-f', 'image2pipe', '-c:v', 'mjpeg', 'pipe:1',
+    ]
+
+
+def _run(cmd: List[str], stdin: Optional[bytes] = None) -> bytes:
+    proc = subprocess.run(cmd, input=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        tail = proc.stderr.decode('utf-8', 'replace')[-2000:]
+        raise RenderError(f"ffmpeg exited with {proc.returncode}: {tail}")
+    return proc.stdout
+
+
+def render_frame(active: List[Tuple[Dict[str, Any], Dict[str, Any]]], t: float, width: int) -> bytes:
+    """Composite the frame at t and return the JPEG. Runs in a pool worker.
+
+    Video clips are padded to the full frame, so the one the export overlays
+    last covers the rest. Export stacks clips of every video track in start
+    order (see `render.track_clips`), so the latest-starting active clip is
+    shown, ties going to the later track. Its effect stack is applied in
+    NumPy, which matches the export filtergraph pixel for pixel.
+    """
+    height = frame_height(width)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    # Stable, so equal starts keep track order as in track_clips
+    video = sorted((clip for track, clip in active if track['type'] == 'video'), key=lambda clip: clip['start'])
+    if video:
+        clip = video[-1]
+        try:
+            matrix = compile_stack(clip)
+        except EffectError as e:
+            raise RenderError(str(e))
+        raw = _run(build_decode_command(clip, t, width))
+        # Past the end of the source there is no frame; leave the canvas black
+        if len(raw) >= frame.nbytes:
+            decoded = np.frombuffer(raw[:frame.nbytes], dtype=np.uint8).reshape(height, width, 3)
+            frame = apply_stack(decoded, matrix)
+    texts = [clip for track, clip in active if track['type'] == 'text']
+    image = _run(build_encode_command(texts, width), stdin=frame.tobytes())
+    if not image:
+        raise RenderError("ffmpeg produced no frame")
+    return image
+
+
+class FrameCache:
+    """LRU of rendered JPEG frames; concurrent requests for one frame share a render."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._frames: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, create: Callable[[], Awaitable[bytes]]) -> bytes:
+        image = self._frames.get(key)
+        if image is not None:
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return image
+        self.misses += 1
+
+        # The render runs as its own task, so a request that goes away doesn't cancel it for the others
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._render(key, create))
+        return await asyncio.shield(pending)
+
+    async def _render(self, key: str, create: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            image = await create()
+            self._frames[key] = image
+            self._bytes += len(image)
+            while self._bytes > self.max_bytes and len(self._frames) > 1:
+                _, old = self._frames.popitem(last=False)
+                self._bytes -= len(old)
+            return image
+        finally:
+            del self._pending[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._frames),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+        }
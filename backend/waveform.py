@@ -0,0 +1,180 @@
+"""Audio waveform peak pyramids.
+
+Audio is decoded once as a stream of mono float samples and reduced to
+min/max peaks per bucket with NumPy. Coarser levels are built by merging
+pairs of buckets, giving one level per power-of-two timeline zoom. The
+pyramid is stored as int8 pairs in a flat file that is memory-mapped when
+served, so a request only touches the pages for the visible window.
+
+File layout (little endian):
+    header  magic b'WPK1', sample_rate u32, base_bucket u32, levels u32, level 0 buckets u64
+    levels  int8[buckets, 2] (min, max) for each level, finest first
+"""
+import asyncio
+import math
+import struct
+import subprocess
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from render import FFMPEG_BIN
+
+SAMPLE_RATE = 22050
+# Samples per level-0 bucket: ~344 buckets/s, enough for one per pixel up to zoom 3.4
+BASE_BUCKET = 64
+# Samples read from the decoder per block; a multiple of BASE_BUCKET
+DECODE_BLOCK = BASE_BUCKET * 4096
+
+HEADER = struct.Struct('<4sIIIQ')
+MAGIC = b'WPK1'
+
+
+def _merge(peaks: np.ndarray) -> np.ndarray:
+    """Halve the resolution of a (buckets, 2) min/max array."""
+    if len(peaks) % 2:
+        peaks = np.concatenate([peaks, peaks[-1:]])
+    pairs = peaks.reshape(-1, 2, 2)
+    return np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+
+
+def level_sizes(buckets: int) -> List[int]:
+    sizes = [buckets]
+    while sizes[-1] > 1:
+        sizes.append(math.ceil(sizes[-1] / 2))
+    return sizes
+
+
+class WaveformError(Exception):
+    pass
+
+
+def build_peaks(src: str, output: str) -> int:
+    """Decode `src` and write its peak pyramid; returns the number of levels. Runs in a pool worker."""
+    with tempfile.TemporaryFile() as log:
+        proc = subprocess.Popen(
+            [FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error', '-i', src,
+             '-map', '0:a:0', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 'f32le', '-'],
+            stdout=subprocess.PIPE, stderr=log,
+        )
+        blocks = []
+        carry = np.empty(0, dtype=np.float32)
+        try:
+            while True:
+                data = proc.stdout.read(DECODE_BLOCK * 4)
+                if not data:
+                    break
+                samples = np.frombuffer(data, dtype=np.float32)
+                if len(carry):
+                    samples = np.concatenate([carry, samples])
+                whole = len(samples) - len(samples) % BASE_BUCKET
+                buckets = samples[:whole].reshape(-1, BASE_BUCKET)
+                blocks.append(np.stack([buckets.min(axis=1), buckets.max(axis=1)], axis=1))
+                carry = samples[whole:].copy()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        if proc.wait() != 0:
+            log.seek(0)
+            tail = log.read().decode('utf-8', 'replace')[-2000:]
+            raise WaveformError(f"ffmpeg failed to decode audio from {src}: {tail}")
+    if len(carry):
+        blocks.append(np.array([[carry.min(), carry.max()]], dtype=np.float32))
+
+    level = np.concatenate(blocks) if blocks else np.zeros((1, 2), dtype=np.float32)
+    level = np.clip(np.round(level * 127), -127, 127).astype(np.int8)
+    levels = [level]
+    while len(levels[-1]) > 1:
+        levels.append(_merge(levels[-1]))
+
+    tmp = Path(output).with_suffix('.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, SAMPLE_RATE, BASE_BUCKET, len(levels), len(levels[0])))
+            for peaks in levels:
+                f.write(peaks.tobytes())
+        tmp.replace(output)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return len(levels)
+
+
+class PeakPyramid:
+    """A memory-mapped peak file."""
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            magic, self.sample_rate, self.base_bucket, count, buckets = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a peak file: {path}")
+        data = np.memmap(path, dtype=np.int8, mode='r', offset=HEADER.size)
+        self.levels: List[np.ndarray] = []
+        offset = 0
+        for size in level_sizes(buckets)[:count]:
+            self.levels.append(data[offset:offset + size * 2].reshape(size, 2))
+            offset += size * 2
+
+    def bucket_seconds(self, level: int) -> float:
+        return self.base_bucket * (2 ** level) / self.sample_rate
+
+    def level_for(self, pixels_per_second: float) -> int:
+        """The coarsest level that still has at least one bucket per pixel."""
+        if pixels_per_second <= 0:
+            return len(self.levels) - 1
+        level = math.floor(math.log2(self.sample_rate / self.base_bucket / pixels_per_second))
+        return max(0, min(level, len(self.levels) - 1))
+
+    def window(self, start: float, end: float, pixels_per_second: float) -> Tuple[int, int, bytes]:
+        """Peaks covering [start, end) at the level for this zoom: (level, first bucket, int8 pairs)."""
+        level = self.level_for(pixels_per_second)
+        seconds = self.bucket_seconds(level)
+        peaks = self.levels[level]
+        first = max(0, int(start / seconds))
+        last = min(len(peaks), math.ceil(end / seconds))
+        return level, first, peaks[first:max(first, last)].tobytes()
+
+
+class WaveformStore:
+    """Peak files on disk, generated on first use, with recently used files kept mapped."""
+
+    def __init__(self, root: Path, max_open: int = 256):
+        self.root = root
+        self.max_open = max_open
+        self._open: "OrderedDict[str, PeakPyramid]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def start(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        return self.root / f"{digest}.peaks"
+
+    async def get(self, digest: str, create: Callable[[str], Awaitable[int]]) -> PeakPyramid:
+        pyramid = self._open.get(digest)
+        if pyramid is not None:
+            self._open.move_to_end(digest)
+            return pyramid
+
+        # Shared by concurrent requests, and not cancelled when one of them goes away
+        pending = self._pending.get(digest)
+        if pending is None:
+            pending = self._pending[digest] = asyncio.ensure_future(self._load(digest, create))
+        return await asyncio.shield(pending)
+
+    async def _load(self, digest: str, create: Callable[[str], Awaitable[int]]) -> PeakPyramid:
+        try:
+            path = self.path(digest)
+            if not path.exists():
+                await create(str(path))
+            pyramid = PeakPyramid(path)
+            self._open[digest] = pyramid
+            if len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+            return pyramid
+        finally:
+            del self._pending[digest]
@@ -0,0 +1,63 @@
+"""Coalesce single-document inserts into insert_many calls.
+
+Callers await `insert(doc)` as if it were its own write; documents arriving
+within a short window (or until the batch is full) go to Mongo in one
+unordered insert_many, and each caller gets its own acknowledgement or error.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+
+class WriteCoalescer:
+    def __init__(self, insert_many: Callable[[List[Dict[str, Any]]], Awaitable[Any]], max_delay: float, max_batch: int):
+        self._insert_many = insert_many
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._buffer: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+
+    async def insert(self, doc: Dict[str, Any]) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((doc, future))
+        if len(self._buffer) >= self.max_batch:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush_soon)
+        await future
+
+    def _flush_soon(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        failed: Dict[int, Exception] = {}
+        try:
+            await self._insert_many([doc for doc, _ in batch])
+        except BulkWriteError as e:
+            # Unordered: everything not listed in writeErrors was written
+            for error in e.details.get('writeErrors', []):
+                failed[error['index']] = BulkWriteError({'writeErrors': [error]})
+        except Exception as e:
+            failed = {index: e for index in range(len(batch))}
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failed:
+                future.set_exception(failed[index])
+            else:
+                future.set_result(None)
+
+    async def drain(self) -> None:
+        """Write out anything buffered; used on shutdown."""
+        self._flush_soon()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
@@ -0,0 +1,273 @@
+"""Load test for the backend API.
+
+Drives `GET /api/`, `POST /api/status` and `GET /api/status` from many
+concurrent asyncio clients and reports latency percentiles and throughput
+per endpoint, so backend changes can be compared run to run:
+
+    python backend_bench.py --in-process --concurrency 64 --duration 20 --output before.json
+    python backend_bench.py --url http://localhost:8001 --rate 500 --output after.json
+
+Without `--rate` every client sends its next request as soon as the last
+one returns (closed loop, measures capacity). With `--rate` requests are
+started on a fixed schedule and latency is measured from the scheduled
+start, so time spent queued behind a slow server counts against it.
+
+`--in-process` serves backend/server.py in this process over an ASGI
+transport against mongomock-motor instead of a real MongoDB. It measures
+the application code (routing, validation, serialization) without network
+or database latency. mongomock runs its queries on the event loop, so
+requests that touch the database are effectively serialized; point `--url`
+at a deployment for end-to-end and concurrency numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _root(n: int) -> Dict[str, Any]:
+    return {'method': 'GET', 'url': '/api/'}
+
+
+def _status_post(n: int) -> Dict[str, Any]:
+    return {'method': 'POST', 'url': '/api/status', 'json': {'client_name': f"bench_{n}"}}
+
+
+def _status_get(n: int) -> Dict[str, Any]:
+    return {'method': 'GET', 'url': '/api/status'}
+
+
+SCENARIOS = {
+    'root': _root,
+    'status-post': _status_post,
+    'status-get': _status_get,
+}
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(-(-p * len(sorted_values) // 100)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(values) + errors,
+        'errors': errors,
+        'throughput': round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else None,
+    }
+
+
+class Recorder:
+    def __init__(self, scenarios: List[str]):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in scenarios}
+        self.errors: Dict[str, int] = {name: 0 for name in scenarios}
+        self.error_samples: List[str] = []
+
+    def record(self, name: str, latency: float, error: Optional[str]) -> None:
+        if error is None:
+            self.latencies[name].append(latency)
+            return
+        self.errors[name] += 1
+        if len(self.error_samples) < 10:
+            self.error_samples.append(f"{name}: {error}")
+
+
+async def send(client: httpx.AsyncClient, recorder: Recorder, name: str, n: int, started: float) -> None:
+    request = SCENARIOS[name](n)
+    error = None
+    try:
+        response = await client.request(request['method'], request['url'], json=request.get('json'))
+        await response.aread()
+        if response.status_code >= 400:
+            error = f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        error = f"{type(e).__name__}: {e}"
+    recorder.record(name, time.perf_counter() - started, error)
+
+
+async def closed_loop(client, recorder, scenarios, concurrency, deadline) -> None:
+    counter = iter(range(sys.maxsize))
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            n = next(counter)
+            await send(client, recorder, scenarios[n % len(scenarios)], n, time.perf_counter())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(client, recorder, scenarios, concurrency, rate, deadline) -> None:
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def scheduled(n, started):
+        async with slots:
+            await send(client, recorder, scenarios[n % len(scenarios)], n, started)
+
+    start = time.perf_counter()
+    for n in range(sys.maxsize):
+        at = start + n / rate
+        if at >= deadline:
+            break
+        delay = at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(scheduled(n, at))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+
+async def seed(client: httpx.AsyncClient, count: int) -> None:
+    """Give GET /api/status a full first page to read."""
+    batch = 500
+    for first in range(0, count, batch):
+        items = [{'client_name': f"seed_{n}"} for n in range(first, min(count, first + batch))]
+        response = await client.post('/api/status/batch', json=items)
+        response.raise_for_status()
+
+
+def in_process_app():
+    """Import backend/server.py with mongomock-motor standing in for MongoDB."""
+    try:
+        import mongomock_motor
+    except ImportError:
+        sys.exit("--in-process needs mongomock-motor (pip install mongomock-motor)")
+    import motor.motor_asyncio
+
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    scratch = tempfile.mkdtemp(prefix='bench-')
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost')
+    os.environ['DB_NAME'] = f"bench_{uuid.uuid4().hex[:8]}"
+    for name in ('EXPORT_DIR', 'RENDER_CACHE_DIR', 'MEDIA_DIR', 'THUMBNAIL_DIR', 'WAVEFORM_DIR', 'PROXY_DIR', 'PROGRESS_DIR'):
+        os.environ[name] = os.path.join(scratch, name.lower())
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'backend'))
+    import server
+    return server.app
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    scenarios = args.scenarios.split(',')
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    app = None
+    if args.in_process:
+        app = in_process_app()
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench', timeout=args.timeout)
+    else:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout)
+
+    try:
+        if args.seed:
+            await seed(client, args.seed)
+        if args.warmup > 0:
+            await closed_loop(client, Recorder(scenarios), scenarios, args.concurrency, time.perf_counter() + args.warmup)
+
+        recorder = Recorder(scenarios)
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        if args.rate:
+            await open_loop(client, recorder, scenarios, args.concurrency, args.rate, deadline)
+        else:
+            await closed_loop(client, recorder, scenarios, args.concurrency, deadline)
+        elapsed = time.perf_counter() - start
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    every = [latency for values in recorder.latencies.values() for latency in values]
+    return {
+        'started_at': started_at.isoformat(),
+        'revision': git_revision(),
+        'target': 'in-process' if args.in_process else args.url,
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'duration': round(elapsed, 3),
+        'scenarios': {
+            name: summarize(recorder.latencies[name], recorder.errors[name], elapsed) for name in scenarios
+        },
+        'total': summarize(every, sum(recorder.errors.values()), elapsed),
+        'error_samples': recorder.error_samples,
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"\n📊 {result['target']} - concurrency {result['concurrency']}, "
+          f"{'rate ' + str(result['rate']) + '/s' if result['rate'] else 'closed loop'}, {result['duration']}s")
+    header = f"{'scenario':<14}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print('-' * len(header))
+    rows = list(result['scenarios'].items()) + [('total', result['total'])]
+    for name, stats in rows:
+        cells = [stats[key] if stats[key] is not None else '-' for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{name:<14}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>10}"
+              f"{cells[0]:>10}{cells[1]:>10}{cells[2]:>10}")
+    for sample in result['error_samples']:
+        print(f"❌ {sample}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default=os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001'),
+                        help="Backend base URL (default: $REACT_APP_BACKEND_URL)")
+    parser.add_argument('--in-process', action='store_true', help="Serve the app in-process against mongomock-motor")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma-separated, sent in rotation")
+    parser.add_argument('--concurrency', type=int, default=32, help="Requests in flight at most")
+    parser.add_argument('--rate', type=float, default=None, help="Requests per second (default: closed loop)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds before the run")
+    parser.add_argument('--seed', type=int, default=1000, help="Status checks created before the run")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0 if result['total']['errors'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
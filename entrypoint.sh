@@ -5,17 +5,37 @@ set -e
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
 echo "Starting FastAPI backend"
+# nginx serves media bytes itself (see /internal-media/ in nginx.conf)
+export MEDIA_ACCEL_REDIRECT=/internal-media/
+# A couple of worker processes by default. Each one's render pool spans every core, so an
+# export scales with the machine; more workers only oversubscribe the CPUs under load
+export WEB_CONCURRENCY="${WEB_CONCURRENCY:-2}"
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+    # Request metrics are summed over the workers through this directory
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
 # Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+uvicorn server:app --host 0.0.0.0 --port 8001 --workers "$WEB_CONCURRENCY" &
 BACKEND_PID=$!
 
-echo "Waiting for backend to start..."
-sleep 30
-
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
-    exit 1
-fi
+echo "Waiting for backend to become ready..."
+BACKEND_READY_TIMEOUT="${BACKEND_READY_TIMEOUT:-120}"
+START=$(date +%s)
+until wget -q -O /dev/null http://127.0.0.1:8001/api/readyz 2>/dev/null; do
+    if ! kill -0 $BACKEND_PID 2>/dev/null; then
+        echo "Backend failed to start at initialization, exiting"
+        exit 1
+    fi
+    if [ $(( $(date +%s) - START )) -ge "$BACKEND_READY_TIMEOUT" ]; then
+        echo "Backend not ready after ${BACKEND_READY_TIMEOUT}s, exiting"
+        kill $BACKEND_PID
+        exit 1
+    fi
+    sleep 0.2
+done
+echo "Backend ready after $(( $(date +%s) - START ))s"
 
 # Start Nginx
 nginx -g 'daemon off;' &
@@ -1,7 +1,6 @@
 import { useState, useRef, useEffect } from "react";
 import { BrowserRouter, Routes, Route } from "react-router-dom";
-import { FFmpeg } from "@ffmpeg/ffmpeg";
-import { fetchFile } from "@ffmpeg/util";
+import axios from "axios";
 import { motion, AnimatePresence } from "framer-motion";
 import Header from "./components/Layout/Header";
 import Sidebar from "./components/Layout/Sidebar";
@@ -13,6 +12,38 @@ import EffectsPanel from "./components/Effects/EffectsPanel";
 import ExportPanel from "./components/Export/ExportPanel";
 import "./App.css";
 
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+// Upload a file in resumable chunks; resolves with the completed upload session
+const uploadMediaFile = async (file) => {
+  const { data: session } = await axios.post(`${API}/uploads`, {
+    filename: file.name,
+    size: file.size,
+    content_type: file.type
+  });
+  
+  let upload = session;
+  let failures = 0;
+  while (upload.status !== "completed") {
+    const chunk = file.slice(upload.offset, upload.offset + session.chunk_size);
+    try {
+      const { data } = await axios.put(`${API}/uploads/${session.id}`, chunk, {
+        headers: { "Upload-Offset": upload.offset, "Content-Type": "application/octet-stream" }
+      });
+      upload = data;
+      failures = 0;
+    } catch (error) {
+      // Dropped connection or offset mismatch: ask the server where to resume
+      if (++failures > 5) throw error;
+      await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+      const { data } = await axios.get(`${API}/uploads/${session.id}`);
+      upload = data;
+    }
+  }
+  return upload;
+};
+
 // Initial project state
 const initialProject = {
   name: "Untitled Project",
@@ -75,8 +106,8 @@ const VideoEditor = () => {
   const [project, setProject] = useState(initialProject);
   const [activeTab, setActiveTab] = useState("media"); // media, effects, export
   const [isPlaying, setIsPlaying] = useState(false);
-  const [isLoaded, setIsLoaded] = useState(false);
   const [isExporting, setIsExporting] = useState(false);
+  const [exportProgress, setExportProgress] = useState(null);
   // State for media library - initialize from localStorage if available
   const [mediaLibrary, setMediaLibrary] = useState(() => {
     try {
@@ -89,7 +120,7 @@ const VideoEditor = () => {
         // (these would be uploaded videos from previous sessions)
         const validMedia = parsedMedia.filter(item => {
           // Keep only sample media items with src or items without src (they'll need re-upload)
-          return (item.src && item.id.startsWith('sample-')) || !item.src;
+          return (item.src && item.id.startsWith('sample-')) || item.serverId || !item.src;
         });
         
         return validMedia;
@@ -102,7 +133,6 @@ const VideoEditor = () => {
   });
   const videoRef = useRef(null);
   const timelineRef = useRef(null);
-  const ffmpegRef = useRef(new FFmpeg());
 
   // Save media library to localStorage whenever it changes
   useEffect(() => {
@@ -115,6 +145,12 @@ const VideoEditor = () => {
           return item;
         }
         
+        // Uploaded media that reached the server keeps its server URLs
+        if (item.serverId) {
+          const { file, ...rest } = item;
+          return rest;
+        }
+        
         // For uploaded media, exclude the File object and blob URLs
         // We'll recreate the blob URLs when the file is uploaded again
         const { file, src, thumbnail, ...rest } = item;
@@ -144,7 +180,7 @@ const VideoEditor = () => {
       // Create a new clip
       const newClip = {
         id: `clip-${Date.now()}`,
-        mediaId: mediaItem.id,
+        mediaId: mediaItem.serverId || mediaItem.id,
         type: mediaItem.type,
         name: mediaItem.name,
         start: lastClipEnd,
@@ -318,33 +354,62 @@ const VideoEditor = () => {
   };
 
   // Export video
-  const exportVideo = async (format, quality) => {
-    if (!isLoaded) return;
-    
+  const exportVideo = async (format, quality, renditions) => {
     try {
       setIsExporting(true);
       
-      // In a real implementation, this would process the timeline
-      // and generate the final video file using FFmpeg
-      // For this demo, we'll simulate a delay
-      await new Promise(resolve => setTimeout(resolve, 3000));
+      // Render on the server; the timeline is sent as-is and queued as a job
+      const { data: job } = await axios.post(`${API}/exports`, {
+        tracks: project.tracks,
+        format,
+        quality,
+        renditions,
+        name: project.name
+      });
+      
+      // Progress is pushed over Server-Sent Events until the render finishes
+      await new Promise((resolve, reject) => {
+        const events = new EventSource(`${API}/exports/${job.id}/events`);
+        events.onmessage = (event) => {
+          const progress = JSON.parse(event.data);
+          setExportProgress(progress);
+          if (progress.status === "completed") {
+            events.close();
+            resolve();
+          } else if (progress.status === "failed") {
+            events.close();
+            reject(new Error(progress.error));
+          }
+        };
+        events.onerror = () => {
+          // EventSource reconnects on its own unless the stream is gone for good
+          if (events.readyState === EventSource.CLOSED) {
+            reject(new Error("Lost connection to export progress"));
+          }
+        };
+      });
+      
+      if (format === "hls") {
+        // A rendition ladder is streamed from the server, not downloaded
+        window.open(`${API}/exports/${job.id}/hls/master.m3u8`, "_blank");
+        setIsExporting(false);
+        setExportProgress(null);
+        return;
+      }
       
-      // Sample download code (not actually functional in this demo)
-      const url = URL.createObjectURL(new Blob(["video data"], { type: "video/mp4" }));
       const a = document.createElement("a");
-      a.href = url;
+      a.href = `${API}/exports/${job.id}/download`;
       a.download = `${project.name}.${format}`;
       document.body.appendChild(a);
       a.click();
-      setTimeout(() => {
-        document.body.removeChild(a);
-        URL.revokeObjectURL(url);
-      }, 0);
+      document.body.removeChild(a);
       
       setIsExporting(false);
+      setExportProgress(null);
     } catch (error) {
       console.error("Export failed:", error);
       setIsExporting(false);
+      setExportProgress(null);
     }
   };
 
@@ -406,6 +471,30 @@ const VideoEditor = () => {
             
             // Add to media library
             newMediaLibrary.push(mediaItem);
+            
+            // Upload in the background; once stored, play from the server instead of the blob
+            uploadMediaFile(file)
+              .then(upload => {
+                // Preview plays the proxy once it is ready; exports always read the original
+                const serverSrc = `${API}/media/${upload.media_id}/preview`;
+                setMediaLibrary(prev => prev.map(item => item.id === id ? {
+                  ...item,
+                  serverId: upload.media_id,
+                  src: serverSrc,
+                  thumbnail: type === 'video' ? serverSrc : item.thumbnail
+                } : item));
+                // The server's probe is cached by content hash, so this never re-probes a known file
+                if (type !== 'image') {
+                  axios.get(`${API}/media/${upload.media_id}/probe`)
+                    .then(({ data }) => {
+                      if (data.duration > 0) {
+                        setMediaLibrary(prev => prev.map(item => item.id === id ? { ...item, duration: data.duration, probe: data } : item));
+                      }
+                    })
+                    .catch(error => console.warn(`Probe failed for ${file.name}:`, error));
+                }
+              })
+              .catch(error => console.error(`Upload failed for ${file.name}:`, error));
             console.log(`Added ${file.name} to media library`);
           } catch (error) {
             console.error(`Error processing file ${file.name}:`, error);
@@ -559,6 +648,7 @@ const VideoEditor = () => {
                 <ExportPanel 
                   projectName={project.name}
                   isExporting={isExporting}
+                  progress={exportProgress}
                   onExport={exportVideo}
                 />
               </motion.div>
@@ -1,16 +1,18 @@
 import React, { useState } from 'react';
 import { motion } from 'framer-motion';
 
-const ExportPanel = ({ projectName, isExporting, onExport }) => {
+const ExportPanel = ({ projectName, isExporting, progress, onExport }) => {
   const [format, setFormat] = useState('mp4');
   const [quality, setQuality] = useState('medium');
   const [fileName, setFileName] = useState(projectName);
+  const [renditions, setRenditions] = useState(['low', 'medium', 'high']);
   
   // Format options
   const formatOptions = [
     { value: 'mp4', label: 'MP4', icon: 'M' },
     { value: 'webm', label: 'WebM', icon: 'W' },
-    { value: 'gif', label: 'GIF', icon: 'G' }
+    { value: 'gif', label: 'GIF', icon: 'G' },
+    { value: 'hls', label: 'HLS', icon: 'H' }
   ];
   
   // Quality presets
@@ -23,7 +25,21 @@ const ExportPanel = ({ projectName, isExporting, onExport }) => {
   
   // Handle export button click
   const handleExport = () => {
-    onExport(format, quality);
+    if (format === 'hls') {
+      onExport(format, quality, renditions);
+    } else {
+      onExport(format, quality);
+    }
+  };
+  
+  // Toggle a rung of the HLS ladder, keeping at least one selected
+  const toggleRendition = (value) => {
+    setRenditions(current => {
+      if (current.includes(value)) {
+        return current.length > 1 ? current.filter(v => v !== value) : current;
+      }
+      return qualityPresets.map(p => p.value).filter(v => v === value || current.includes(v));
+    });
   };
   
   return (
@@ -44,7 +60,7 @@ const ExportPanel = ({ projectName, isExporting, onExport }) => {
       {/* Format selection */}
       <div className="export-option">
         <label className="block text-sm font-medium mb-2">Format</label>
-        <div className="grid grid-cols-3 gap-2">
+        <div className="grid grid-cols-4 gap-2">
           {formatOptions.map(option => (
             <button
               key={option.value}
@@ -62,19 +78,19 @@ const ExportPanel = ({ projectName, isExporting, onExport }) => {
         </div>
       </div>
       
-      {/* Quality selection */}
+      {/* Quality selection; HLS encodes every selected rung from a single render */}
       <div className="export-option">
-        <label className="block text-sm font-medium mb-2">Quality</label>
+        <label className="block text-sm font-medium mb-2">{format === 'hls' ? 'Renditions' : 'Quality'}</label>
         <div className="space-y-2">
           {qualityPresets.map(preset => (
             <button
               key={preset.value}
               className={`w-full p-2 rounded border text-left transition-colors ${
-                quality === preset.value
+                (format === 'hls' ? renditions.includes(preset.value) : quality === preset.value)
                   ? 'bg-editor-primary bg-opacity-20 border-editor-primary'
                   : 'bg-editor-surface-light border-editor-border hover:border-editor-primary'
               }`}
-              onClick={() => setQuality(preset.value)}
+              onClick={() => (format === 'hls' ? toggleRendition(preset.value) : setQuality(preset.value))}
             >
               <div className="flex justify-between items-center">
                 <span className="font-medium text-sm">{preset.label}</span>
@@ -100,7 +116,11 @@ const ExportPanel = ({ projectName, isExporting, onExport }) => {
           {isExporting ? (
             <>
               <div className="loading-spinner w-5 h-5 mr-2"></div>
-              <span>Exporting...</span>
+              <span>
+                {progress && progress.frames_total
+                  ? `Exporting... ${Math.floor(100 * progress.frames / progress.frames_total)}%`
+                  : 'Exporting...'}
+              </span>
             </>
           ) : (
             <>
@@ -112,6 +132,27 @@ const ExportPanel = ({ projectName, isExporting, onExport }) => {
             </>
           )}
         </motion.button>
+        
+        {isExporting && progress && progress.frames_total > 0 && (
+          <div className="mt-2 text-xs text-editor-text-muted">
+            <div className="w-full h-1 rounded bg-editor-surface-light mb-1">
+              <div
+                className="h-1 rounded bg-editor-primary"
+                style={{ width: `${Math.min(100, 100 * progress.frames / progress.frames_total)}%` }}
+              ></div>
+            </div>
+            <div className="flex justify-between">
+              <span>{progress.frames} / {progress.frames_total} frames{progress.fps ? ` at ${progress.fps} fps` : ''}</span>
+              <span>{progress.eta != null ? `${Math.ceil(progress.eta)}s left` : ''}</span>
+            </div>
+            {progress.segments > 0 && (
+              <div>
+                Segment {progress.segments_done} of {progress.segments}
+                {progress.cached_segments > 0 ? ` (${progress.cached_segments} from cache)` : ''}
+              </div>
+            )}
+          </div>
+        )}
       </div>
       
       {/* Format tips */}
@@ -122,9 +163,12 @@ const ExportPanel = ({ projectName, isExporting, onExport }) => {
         <p className="mb-1">
           <strong>WebM</strong> - Optimized for web playback, smaller file size
         </p>
-        <p>
+        <p className="mb-1">
           <strong>GIF</strong> - For short, looping animations (no audio)
         </p>
+        <p>
+          <strong>HLS</strong> - Adaptive streaming at several resolutions from one render
+        </p>
       </div>
     </div>
   );
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import httpx
+import pytest
+
+# The backend modules import each other by bare name, as they do when uvicorn runs from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """backend/server.py imported against mongomock-motor, its data dirs in a scratch dir."""
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    import motor.motor_asyncio
+
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    scratch = tmp_path_factory.mktemp('server')
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost')
+    os.environ['DB_NAME'] = f"test_{uuid.uuid4().hex[:8]}"
+    for name in ('EXPORT_DIR', 'RENDER_CACHE_DIR', 'MEDIA_DIR', 'THUMBNAIL_DIR', 'WAVEFORM_DIR', 'PROXY_DIR', 'PROGRESS_DIR'):
+        os.environ[name] = str(scratch / name.lower())
+    os.environ['PRIMARY_LOCK_PATH'] = str(scratch / 'primary.lock')
+    import server
+    return server
+
+
+@pytest.fixture
+def call(server):
+    """Send one request to the app, each on its own event loop."""
+    def send(method, url, **kwargs):
+        async def request():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await client.request(method, url, **kwargs)
+        return asyncio.run(request())
+    return send
@@ -0,0 +1,85 @@
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+from audio import CHANNELS, FFMPEG_BIN, SAMPLE_RATE, AudioError, _envelope, audio_filter, clip_envelope, mix_audio
+from render import RenderError, check_audio
+
+
+def audio_clip(clip_id, start, duration, **fields):
+    return {'id': clip_id, 'type': 'audio', 'start': start, 'duration': duration, **fields}
+
+
+def test_envelope_defaults_to_full_volume():
+    assert clip_envelope(audio_clip('a', 0, 10)) == (1.0, 0.0, 0.0)
+    assert audio_filter(audio_clip('a', 0, 10)) == 'volume=1.0000'
+
+
+def test_envelope_is_a_share_of_the_clip():
+    clip = audio_clip('a', 0, 10, audioEffects={'volume': 50, 'fadeIn': 10, 'fadeOut': 150})
+    assert clip_envelope(clip) == (0.5, 1.0, 10.0)
+    assert audio_filter(clip) == 'volume=0.5000,afade=t=in:st=0:d=1.000,afade=t=out:st=0.000:d=10.000'
+
+
+@pytest.mark.parametrize('effects', [
+    5,
+    ['volume'],
+    {'volume': 'loud'},
+    {'volume': None},
+    {'fadeIn': True},
+    {'fadeOut': float('nan')},
+    {'fadeOut': [10]},
+])
+def test_bad_settings_are_rejected(effects):
+    clip = audio_clip('a', 0, 10, audioEffects=effects)
+    with pytest.raises(AudioError):
+        clip_envelope(clip)
+    with pytest.raises(RenderError):
+        check_audio([{'id': 'audio-track-1', 'type': 'audio', 'clips': [clip]}])
+
+
+def test_envelope_ramps():
+    envelope = _envelope(0.5, 4, 2, 10, 0, 10)
+    np.testing.assert_allclose(envelope, [0, 0.125, 0.25, 0.375, 0.5, 0.5, 0.5, 0.5, 0.5, 0.25])
+    # A block from the middle of the clip lines up with the whole-clip envelope
+    np.testing.assert_array_equal(_envelope(0.5, 4, 2, 10, 3, 4), envelope[3:7])
+
+
+def write_wav(path, samples):
+    with wave.open(str(path), 'wb') as out:
+        out.setnchannels(CHANNELS)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        out.writeframes(samples.astype('<i2').tobytes())
+    return samples.astype(np.float32) / 32768
+
+
+def read_mix(path):
+    raw = subprocess.run(
+        [FFMPEG_BIN, '-v', 'error', '-i', str(path), '-f', 'f32le', '-'], capture_output=True, check=True,
+    ).stdout
+    return np.frombuffer(raw, np.float32).reshape(-1, CHANNELS)
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BIN) is None, reason="ffmpeg is not installed")
+def test_mix_matches_the_envelopes(tmp_path):
+    rng = np.random.default_rng(0)
+    first = write_wav(tmp_path / 'first.wav', rng.integers(-8000, 8000, (SAMPLE_RATE * 2, CHANNELS)))
+    second = write_wav(tmp_path / 'second.wav', rng.integers(-8000, 8000, (SAMPLE_RATE * 2, CHANNELS)))
+    tracks = [{'id': 'audio-track-1', 'type': 'audio', 'clips': [
+        audio_clip('a', 0, 1.5, src=str(tmp_path / 'first.wav'), audioEffects={'fadeOut': 20}),
+        audio_clip('b', 1, 1, src=str(tmp_path / 'second.wav'), trimStart=0.5, audioEffects={'volume': 50, 'fadeIn': 50}),
+    ]}]
+    mix_audio(tracks, 2.5, ['-c:a', 'pcm_f32le'], str(tmp_path / 'mix.mkv'))
+
+    expected = np.zeros((int(SAMPLE_RATE * 2.5), CHANNELS), np.float32)
+    a = int(SAMPLE_RATE * 1.5)
+    expected[:a] += first[:a] * _envelope(1.0, 0, int(0.3 * SAMPLE_RATE), a, 0, a)[:, None]
+    b = SAMPLE_RATE
+    expected[SAMPLE_RATE:2 * SAMPLE_RATE] += (
+        second[SAMPLE_RATE // 2:SAMPLE_RATE // 2 + b] * _envelope(0.5, b // 2, 0, b, 0, b)[:, None]
+    )
+    np.testing.assert_allclose(read_mix(tmp_path / 'mix.mkv'), expected, atol=1e-6)
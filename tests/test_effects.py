@@ -0,0 +1,67 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from effects import FILTERS, EffectError, apply_stack, compile_stack, ffmpeg_filter
+from render import FFMPEG_BIN
+
+WIDTH, HEIGHT = 64, 48
+
+STACKS = [
+    {'filter': name} for name in FILTERS
+] + [
+    {'adjustments': {'brightness': 40}},
+    {'adjustments': {'contrast': -60, 'saturation': 80}},
+    {'adjustments': {'hue': 35}},
+    {'filter': 'vintage', 'adjustments': {'brightness': -20, 'hue': -70}, 'effects': [{'type': 'warm'}]},
+    {'effects': [{'type': 'contrast', 'value': 100}, {'type': 'saturation', 'value': 100}]},
+]
+
+
+def test_no_effects_compile_to_nothing():
+    assert compile_stack({}) is None
+    assert compile_stack({'filter': 'none', 'adjustments': {'brightness': 0}}) is None
+
+
+@pytest.mark.parametrize('clip', [
+    {'filter': 'neon'},
+    {'adjustments': {'blur': 5}},
+    {'adjustments': {'brightness': 'high'}},
+    {'effects': [{'value': 5}]},
+    {'filter': ['sepia']},
+    {'adjustments': 5},
+    {'adjustments': ['brightness']},
+    {'effects': 5},
+    {'effects': {'type': 'sepia'}},
+    {'effects': ['sepia']},
+    {'effects': [{'type': ['sepia']}]},
+])
+def test_unknown_effects_are_rejected(clip):
+    with pytest.raises(EffectError):
+        compile_stack(clip)
+
+
+def test_stacks_compose_in_order():
+    one = compile_stack({'filter': 'sepia', 'adjustments': {'brightness': 30}})
+    two = compile_stack({'effects': [{'type': 'sepia'}, {'type': 'brightness', 'value': 30}]})
+    np.testing.assert_array_equal(one, two)
+
+
+def ffmpeg_frame(frame, matrix):
+    command = [
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{WIDTH}x{HEIGHT}', '-i', '-',
+        '-vf', f'{ffmpeg_filter(matrix)},format=rgb24', '-f', 'rawvideo', '-',
+    ]
+    out = subprocess.run(command, input=frame.tobytes(), capture_output=True, check=True).stdout
+    return np.frombuffer(out, np.uint8).reshape(frame.shape)
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BIN) is None, reason="ffmpeg is not installed")
+@pytest.mark.parametrize('clip', STACKS)
+def test_apply_stack_matches_the_export_filter(clip):
+    matrix = compile_stack(clip)
+    frame = np.random.default_rng(0).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    np.testing.assert_array_equal(apply_stack(frame, matrix), ffmpeg_frame(frame, matrix))
@@ -0,0 +1,32 @@
+import pytest
+
+from media_response import parse_range
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=990-5000', (990, 999)),
+    ('bytes=999-999', (999, 999)),
+    (' bytes = 10-20', (10, 20)),
+])
+def test_single_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', [None, '', 'items=0-10', 'bytes=0-10,20-30'])
+def test_whole_file(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=500-100', 'bytes=-0', 'bytes=x-1'])
+def test_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_empty_file_has_no_satisfiable_range():
+    with pytest.raises(ValueError):
+        parse_range('bytes=0-', 0)
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from media_store import MediaStore, UploadError
+
+
+async def chunks(data, size=7):
+    for at in range(0, len(data), size):
+        yield data[at:at + size]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def new_store(tmp_path):
+    store = MediaStore(tmp_path / 'media')
+    store.start()
+    return store
+
+
+def test_upload_in_chunks(tmp_path):
+    store = new_store(tmp_path)
+    data = bytes(range(256)) * 40
+    store.create('u1')
+
+    async def upload():
+        offset = 0
+        for at in range(0, len(data), 3000):
+            offset = await store.append('u1', offset, len(data), chunks(data[at:at + 3000]))
+        assert offset == len(data)
+        return await store.finalize('u1')
+
+    digest, deduplicated = run(upload())
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert not deduplicated
+    assert store.blob_path(digest).read_bytes() == data
+    assert not store.partial_path('u1').exists()
+    assert store.is_blob(str(store.blob_path(digest)))
+
+
+def test_wrong_offset_is_rejected(tmp_path):
+    store = new_store(tmp_path)
+    store.create('u1')
+    run(store.append('u1', 0, 10, chunks(b'abcde')))
+    with pytest.raises(UploadError):
+        run(store.append('u1', 3, 10, chunks(b'xyz')))
+    assert store.offset('u1') == 5
+
+
+def test_chunk_past_declared_size_keeps_what_fit(tmp_path):
+    store = new_store(tmp_path)
+    store.create('u1')
+    with pytest.raises(UploadError):
+        run(store.append('u1', 0, 10, chunks(b'0123456789abc', size=4)))
+    assert store.offset('u1') == 8
+
+
+def test_resume_after_dropped_connection(tmp_path):
+    store = new_store(tmp_path)
+    data = b'resumable upload ' * 100
+    store.create('u1')
+
+    async def dropped():
+        yield data[:500]
+        raise ConnectionError
+
+    with pytest.raises(ConnectionError):
+        run(store.append('u1', 0, len(data), dropped()))
+    offset = store.offset('u1')
+    assert offset == 500
+
+    # A restarted worker has no running hash and rebuilds it from the partial file
+    store = new_store(tmp_path)
+    run(store.append('u1', offset, len(data), chunks(data[offset:])))
+    assert run(store.finalize('u1'))[0] == hashlib.sha256(data).hexdigest()
+
+
+def test_workers_take_turns_appending(tmp_path):
+    first, second = new_store(tmp_path), new_store(tmp_path)
+    data = b'0123456789' * 300
+    first.create('u1')
+    parts = [data[:1000], data[1000:1500], data[1500:2500], data[2500:]]
+
+    async def upload():
+        offset = 0
+        for n, part in enumerate(parts):
+            store = (first, second)[n % 2]
+            offset = await store.append('u1', offset, len(data), chunks(part, size=64))
+        return await second.finalize('u1')
+
+    assert run(upload())[0] == hashlib.sha256(data).hexdigest()
+
+
+def test_identical_uploads_share_a_blob(tmp_path):
+    store = new_store(tmp_path)
+    data = b'same bytes'
+    digests = []
+    for upload_id in ('u1', 'u2'):
+        store.create(upload_id)
+        run(store.append(upload_id, 0, len(data), chunks(data)))
+        digests.append(run(store.finalize(upload_id)))
+    assert digests[0] == (hashlib.sha256(data).hexdigest(), False)
+    assert digests[1] == (digests[0][0], True)
+    assert not store.partial_path('u2').exists()
+
+
+def test_idle_hashes_are_swept(tmp_path):
+    store = new_store(tmp_path)
+    store.create('u1')
+    run(store.append('u1', 0, 10, chunks(b'abc')))
+    store.sweep(max_idle=3600)
+    assert 'u1' in store._hashers
+    store.sweep(max_idle=-1)
+    assert 'u1' not in store._hashers and store.partial_path('u1').exists()
+
+
+def test_discard_removes_the_partial(tmp_path):
+    store = new_store(tmp_path)
+    store.create('u1')
+    run(store.append('u1', 0, 10, chunks(b'abc')))
+    store.discard('u1')
+    assert not store.partial_path('u1').exists()
+    assert store.offset('u1') == 0
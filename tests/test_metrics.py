@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from fastapi import APIRouter, FastAPI
+from prometheus_client import REGISTRY
+
+from metrics import MetricsMiddleware, MongoCommandTimer, StatsCollector
+
+
+def make_app():
+    app = FastAPI()
+    router = APIRouter(prefix='/api')
+
+    @router.get('/items/{item_id}')
+    async def get_item(item_id: str):
+        return {'id': item_id}
+
+    @router.get('/broken')
+    async def broken():
+        raise RuntimeError('boom')
+
+    app.include_router(router)
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+
+def request_count(method, route, status):
+    labels = {'method': method, 'route': route, 'status': status}
+    return REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) or 0
+
+
+def send(app, *paths):
+    async def requests():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return [(await client.get(path)).status_code for path in paths]
+    return asyncio.run(requests())
+
+
+def test_requests_are_labelled_by_route_template():
+    before = request_count('GET', '/api/items/{item_id}', '200')
+    assert send(make_app(), '/api/items/1', '/api/items/2', '/api/items/3') == [200, 200, 200]
+    assert request_count('GET', '/api/items/{item_id}', '200') == before + 3
+    # No series per id
+    assert REGISTRY.get_sample_value(
+        'http_request_duration_seconds_count', {'method': 'GET', 'route': '/api/items/1', 'status': '200'},
+    ) is None
+
+
+def test_unrouted_paths_share_one_label():
+    before = request_count('GET', 'unmatched', '404')
+    assert send(make_app(), '/nope', '/api/nope/deeper') == [404, 404]
+    assert request_count('GET', 'unmatched', '404') == before + 2
+
+
+def test_handler_errors_are_recorded_as_500():
+    before = request_count('GET', '/api/broken', '500')
+    assert send(make_app(), '/api/broken') == [500]
+    assert request_count('GET', '/api/broken', '500') == before + 1
+    assert REGISTRY.get_sample_value('http_requests_in_flight') == 0
+
+
+def test_mongo_commands_are_timed_by_name():
+    def count(command):
+        return REGISTRY.get_sample_value('mongo_command_duration_seconds_count', {'command': command}) or 0
+
+    def failures(command):
+        return REGISTRY.get_sample_value('mongo_command_failures_total', {'command': command}) or 0
+
+    before_count, before_failures = count('getMore'), failures('getMore')
+    timer = MongoCommandTimer()
+    event = SimpleNamespace(command_name='getMore', duration_micros=1500)
+    timer.succeeded(event)
+    timer.failed(event)
+    assert count('getMore') == before_count + 2
+    assert failures('getMore') == before_failures + 1
+
+
+def test_stats_collector_reads_live_objects():
+    engine = SimpleNamespace(stats=lambda: {
+        'queued_jobs': 3, 'running_jobs': 1, 'waiting_tasks': 5, 'workers': 8,
+        'busy_workers': 6, 'utilization': 0.75, 'encode_fps': 240.0,
+    })
+    cache = SimpleNamespace(stats=lambda: {'hit_ratio': 0.5, 'entries': 12})
+    families = {family.name: family for family in StatsCollector(engine, {'frames': cache}).collect()}
+    assert families['render_queue_depth'].samples[0].value == 3
+    assert families['render_worker_utilization'].samples[0].value == 0.75
+    assert [(s.labels, s.value) for s in families['cache_hit_ratio'].samples] == [({'cache': 'frames'}, 0.5)]
+    assert [(s.labels, s.value) for s in families['cache_entries'].samples] == [({'cache': 'frames'}, 12)]
@@ -0,0 +1,86 @@
+import io
+import shutil
+
+import numpy as np
+import pytest
+
+from palette import (
+    HIST_BITS, PALETTE_COLORS, PaletteError, color_histogram, frame_batches, median_cut, palette_frames, quantize,
+    sample_palette,
+)
+from render import FFMPEG_BIN
+
+
+def histogram_of(pixels):
+    return color_histogram([np.asarray(pixels, dtype=np.uint8).reshape(-1, 3)])
+
+
+def test_histogram_cells_keep_exact_means():
+    counts, sums = histogram_of([[10, 20, 30], [11, 21, 31], [200, 0, 0]])
+    assert counts.sum() == 3
+    cells = np.flatnonzero(counts)
+    assert len(cells) == 2
+    means = sums[cells] / counts[cells, None]
+    assert means.tolist() == [[10.5, 20.5, 30.5], [200.0, 0.0, 0.0]]
+
+
+def test_few_colours_are_kept_exactly():
+    colors = [[255, 0, 0], [0, 255, 0], [0, 0, 255]]
+    palette = quantize(*histogram_of(colors * 10))
+    assert palette.shape == (PALETTE_COLORS, 3) and palette.dtype == np.uint8
+    assert sorted(map(tuple, palette[:3])) == sorted(map(tuple, colors))
+    # Padded with the last colour, so no stray black entry appears
+    assert len({tuple(c) for c in palette}) == 3
+
+
+def test_empty_histogram_is_black():
+    counts, sums = color_histogram([])
+    assert not quantize(counts, sums).any()
+
+
+def test_many_colours_are_reduced_to_a_close_palette():
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (20000, 3), dtype=np.uint8)
+    palette = quantize(*histogram_of(pixels)).astype(np.float64)
+    assert len({tuple(c) for c in palette}) > 200
+    distances = np.sqrt(((pixels[:, None, :].astype(np.float64) - palette[None]) ** 2).sum(axis=2)).min(axis=1)
+    # 256 colours over a uniform cube leave every pixel within a few cube-cells of one
+    assert distances.mean() < 30
+
+
+def test_median_cut_splits_by_weight():
+    colors = np.array([[0, 0, 0], [10, 0, 0], [250, 0, 0]], dtype=np.float64)
+    weights = np.array([1.0, 1.0, 100.0])
+    boxes = median_cut(colors, weights, 2)
+    assert sorted(boxes[:, 0].tolist()) == [5.0, 250.0]
+
+
+def test_frame_batches_drop_a_partial_frame():
+    stream = io.BytesIO(bytes(4 * 2 * 3 * 3 + 5))
+    batches = list(frame_batches(stream, 4, 2, batch=2))
+    assert [len(batch) for batch in batches] == [16, 8]
+
+
+def test_palette_frames_switch_at_segment_starts():
+    palettes = [bytes([n]) * (PALETTE_COLORS * 3) for n in (1, 2)]
+    data = palette_frames(palettes, [0.0, 1.0], frames=4, fps=2)
+    per_frame = PALETTE_COLORS * 3
+    assert [data[n * per_frame] for n in range(4)] == [1, 1, 2, 2]
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BIN) is None, reason="ffmpeg is not installed")
+def test_sample_palette_from_ffmpeg():
+    cmd = [
+        FFMPEG_BIN, '-v', 'error', '-f', 'lavfi', '-i', 'color=c=red:s=32x18:d=0.5',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1',
+    ]
+    palette = np.frombuffer(sample_palette(cmd, 32, 18), dtype=np.uint8).reshape(-1, 3)
+    assert len(palette) == PALETTE_COLORS
+    red = palette[0].astype(int)
+    assert red[0] > 240 and red[1] < 1 << (8 - HIST_BITS) and red[2] < 1 << (8 - HIST_BITS)
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BIN) is None, reason="ffmpeg is not installed")
+def test_sample_palette_reports_ffmpeg_failures():
+    with pytest.raises(PaletteError):
+        sample_palette([FFMPEG_BIN, '-v', 'error', '-i', '/nonexistent.mp4', '-f', 'rawvideo', 'pipe:1'], 32, 18)
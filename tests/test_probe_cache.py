@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+import probe_cache
+from probe import ProbeError
+from probe_cache import ProbeCache
+
+mongomock_motor = pytest.importorskip('mongomock_motor')
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Stand-in for ffprobe: records the sources it is asked for; `gate` holds probes until set."""
+    calls = []
+    gate = threading.Event()
+    gate.set()
+
+    def fake_probe(src):
+        calls.append(src)
+        gate.wait(5)
+        if 'broken' in src:
+            raise ProbeError('moov atom not found')
+        return {'duration': 4.0, 'format': 'mov,mp4', 'video': None, 'audio': None, 'src': src}
+
+    monkeypatch.setattr(probe_cache, 'probe_media', fake_probe)
+    return calls, gate
+
+
+def database():
+    return mongomock_motor.AsyncMongoMockClient()[f"probe_{uuid.uuid4().hex[:8]}"]
+
+
+def test_a_file_is_probed_once_ever(probes):
+    calls, _ = probes
+    db = database()
+
+    async def scenario():
+        cache = ProbeCache(db, workers=2)
+        first = await cache.get('d1', '/media/a')
+        second = await cache.get('d1', '/media/a')
+        # Another worker process only has the collection to go on
+        other = ProbeCache(db, workers=2)
+        third = await other.get('d1', '/media/a')
+        return first, second, third, cache.stats(), other.stats()
+
+    first, second, third, stats, other_stats = asyncio.run(scenario())
+    assert first == second == third
+    assert calls == ['/media/a']
+    assert (stats['probes'], stats['memory_hits']) == (1, 1)
+    assert (other_stats['probes'], other_stats['db_hits']) == (0, 1)
+
+
+def test_concurrent_lookups_share_a_probe(probes):
+    calls, gate = probes
+    gate.clear()
+
+    async def scenario():
+        cache = ProbeCache(database(), workers=2)
+        lookups = [asyncio.ensure_future(cache.get('d1', '/media/a')) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        gate.set()
+        return await asyncio.gather(*lookups)
+
+    results = asyncio.run(scenario())
+    assert calls == ['/media/a']
+    assert results[0] == results[1] == results[2]
+
+
+def test_a_cancelled_lookup_does_not_cancel_the_shared_probe(probes):
+    calls, gate = probes
+    gate.clear()
+
+    async def scenario():
+        cache = ProbeCache(database(), workers=2)
+        first = asyncio.ensure_future(cache.get('d1', '/media/a'))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(cache.get('d1', '/media/a'))
+        await asyncio.sleep(0)
+        first.cancel()
+        gate.set()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return result, cache.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result['src'] == '/media/a'
+    assert calls == ['/media/a']
+    assert stats['entries'] == 1
+
+
+def test_get_many_reports_failures_per_file(probes):
+    calls, _ = probes
+    db = database()
+
+    async def scenario():
+        await ProbeCache(db, workers=2).get('known', '/media/known')
+        cache = ProbeCache(db, workers=2)
+        return await cache.get_many([('known', '/media/known'), ('new', '/media/new'), ('bad', '/media/broken')])
+
+    results = asyncio.run(scenario())
+    assert results['known']['src'] == '/media/known'
+    assert results['new']['src'] == '/media/new'
+    assert isinstance(results['bad'], ProbeError)
+    assert sorted(calls) == ['/media/broken', '/media/known', '/media/new']
+
+
+def test_a_failed_probe_is_retried(probes):
+    calls, _ = probes
+
+    async def scenario():
+        cache = ProbeCache(database(), workers=2)
+        for _ in range(2):
+            with pytest.raises(ProbeError):
+                await cache.get('bad', '/media/broken')
+
+    asyncio.run(scenario())
+    assert calls == ['/media/broken', '/media/broken']
+
+
+def test_memory_is_bounded(probes):
+    async def scenario():
+        cache = ProbeCache(database(), workers=2, max_entries=2)
+        for n in range(3):
+            await cache.get(f"d{n}", f"/media/{n}")
+        await cache.get('d0', '/media/0')
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['entries'] == 2
+    # d0 was evicted from memory but is still in the collection
+    assert (stats['probes'], stats['db_hits']) == (3, 1)
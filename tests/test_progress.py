@@ -0,0 +1,95 @@
+import asyncio
+
+from progress import ProgressBroker
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def next_of(events):
+    return await asyncio.wait_for(events.__anext__(), 1)
+
+
+def test_subscribers_get_only_the_newest_snapshot():
+    async def scenario():
+        broker = ProgressBroker(rate=100)
+        events = broker.subscribe('export:1')
+        waiting = asyncio.ensure_future(next_of(events))
+        await asyncio.sleep(0)
+        for frames in range(5):
+            broker.publish('export:1', {'frames': frames})
+        assert not waiting.done()
+        broker._flush()
+        assert await waiting == {'frames': 4}
+        broker.publish('export:1', {'frames': 9}, final=True)
+        broker._flush()
+        assert await next_of(events) == {'frames': 9}
+        assert [snapshot async for snapshot in events] == []
+
+    run(scenario())
+
+
+def test_late_subscribers_learn_the_outcome():
+    async def scenario():
+        broker = ProgressBroker(rate=100)
+        broker.publish('export:1', {'status': 'completed'}, final=True)
+        assert broker.latest('export:1') == {'status': 'completed'}
+        assert [snapshot async for snapshot in broker.subscribe('export:1')] == [{'status': 'completed'}]
+        assert broker.latest('export:2') is None
+
+    run(scenario())
+
+
+def test_keepalive_while_idle():
+    async def scenario():
+        broker = ProgressBroker(rate=100)
+        broker.publish('media:1', {'status': 'processing'})
+        events = broker.subscribe('media:1', keepalive=0.01)
+        assert await next_of(events) == {'status': 'processing'}
+        assert await next_of(events) is None
+        await events.aclose()
+        assert broker._subscribers == {}
+
+    run(scenario())
+
+
+def test_progress_is_relayed_between_processes(tmp_path):
+    async def scenario():
+        owner, other = ProgressBroker(rate=100, relay_dir=tmp_path), ProgressBroker(rate=100, relay_dir=tmp_path)
+        assert other.latest('export:1') is None
+
+        owner.publish('export:1', {'frames': 10, 'fps': 30.0})
+        owner._flush()
+        assert other.latest('export:1') == {'frames': 10, 'fps': 30.0}
+
+        events = other.subscribe('export:1')
+        assert await next_of(events) == {'frames': 10, 'fps': 30.0}
+        waiting = asyncio.ensure_future(next_of(events))
+        await asyncio.sleep(0)
+        # Unchanged relay files are not sent again
+        other._flush()
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        owner.publish('export:1', {'frames': 20, 'fps': 30.0})
+        owner._flush()
+        other._flush()
+        assert await waiting == {'frames': 20, 'fps': 30.0}
+
+        owner.publish('export:1', {'frames': 30, 'status': 'completed'}, final=True)
+        owner._flush()
+        other._flush()
+        assert await next_of(events) == {'frames': 30, 'status': 'completed'}
+        assert [snapshot async for snapshot in events] == []
+        assert other._subscribers == {} and other._relayed == {}
+        assert other.latest('export:1') == {'frames': 30, 'status': 'completed'}
+
+    run(scenario())
+
+
+def test_relay_file_names_come_from_a_hash(tmp_path):
+    broker = ProgressBroker(rate=100, relay_dir=tmp_path)
+    broker.publish('export:../../etc', {'frames': 1})
+    broker._flush()
+    assert [path.parent for path in tmp_path.iterdir()] == [tmp_path]
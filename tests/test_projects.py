@@ -0,0 +1,137 @@
+import asyncio
+import math
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from projects import PatchError, ProjectStore, VersionConflict, apply_ops, empty_state
+
+
+def state_with_clip():
+    return apply_ops(empty_state('Test'), [
+        {'op': 'add_clip', 'trackId': 'video-track-1', 'clip': {'id': 'c1', 'start': 0, 'duration': 5}},
+    ])
+
+
+def test_add_clip_takes_the_track_type_and_updates_duration():
+    state = state_with_clip()
+    assert state['tracks'][0]['clips'] == [{'type': 'video', 'id': 'c1', 'start': 0, 'duration': 5}]
+    assert state['duration'] == 5
+
+
+def test_apply_ops_leaves_the_input_alone():
+    state = state_with_clip()
+    moved = apply_ops(state, [{'op': 'move_clip', 'clipId': 'c1', 'start': 3}])
+    assert moved['tracks'][0]['clips'][0]['start'] == 3
+    assert moved['duration'] == 8
+    assert state['tracks'][0]['clips'][0]['start'] == 0
+
+
+def test_move_clip_clamps_to_zero_and_changes_track():
+    state = apply_ops(state_with_clip(), [
+        {'op': 'add_clip', 'trackId': 'audio-track-1', 'clip': {'id': 'a1', 'start': 0, 'duration': 2}},
+    ])
+    state['tracks'].append({'id': 'video-track-2', 'type': 'video', 'clips': []})
+    state = apply_ops(state, [{'op': 'move_clip', 'clipId': 'c1', 'start': -4, 'trackId': 'video-track-2'}])
+    assert state['tracks'][0]['clips'] == []
+    assert state['tracks'][-1]['clips'][0]['start'] == 0
+    with pytest.raises(PatchError):
+        apply_ops(state, [{'op': 'move_clip', 'clipId': 'a1', 'start': 0, 'trackId': 'video-track-2'}])
+
+
+def test_update_clip_and_set():
+    state = apply_ops(state_with_clip(), [
+        {'op': 'update_clip', 'clipId': 'c1', 'set': {'duration': 2, 'filter': 'sepia'}},
+        {'op': 'update_clip', 'clipId': 'c1', 'set': {'effects': [{'type': 'hue', 'value': 20}]}},
+        {'op': 'set', 'set': {'name': 'Renamed', 'zoom': 2}},
+        {'op': 'remove_clip', 'clipId': 'c1'},
+    ])
+    assert state['name'] == 'Renamed' and state['zoom'] == 2
+    assert state['duration'] == 0
+
+
+@pytest.mark.parametrize('op', [
+    {'op': 'rename'},
+    {'op': 'remove_clip', 'clipId': 'missing'},
+    {'op': 'remove_clip'},
+    {'op': 'add_clip', 'trackId': 'nope', 'clip': {'id': 'x', 'start': 0, 'duration': 1}},
+    {'op': 'add_clip', 'trackId': 'video-track-1', 'clip': {'id': 'x', 'start': 0}},
+    {'op': 'add_clip', 'trackId': 'video-track-1', 'clip': ['x']},
+    {'op': 'add_clip', 'trackId': 'video-track-1', 'clip': {'id': 'x', 'start': '0', 'duration': 1}},
+    {'op': 'move_clip', 'clipId': 'c1', 'start': None},
+    {'op': 'move_clip', 'clipId': 'c1', 'start': True},
+    {'op': 'move_clip', 'clipId': 'c1', 'start': math.nan},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'id': 'other'}},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'duration': 'long'}},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': [1, 2]},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'effects': 5}},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'adjustments': 5}},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'adjustments': {'brightness': 'bright'}}},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'filter': 'neon'}},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'audioEffects': {'volume': 'loud'}}},
+    {'op': 'update_clip', 'clipId': 'c1', 'set': {'audioEffects': [50]}},
+    {'op': 'add_clip', 'trackId': 'video-track-1', 'clip': {'id': 'x', 'start': 0, 'duration': 1, 'effects': [3]}},
+    {'op': 'set', 'set': {'zoom': math.inf}},
+    {'op': 'set', 'set': {'tracks': []}},
+])
+def test_bad_ops_are_patch_errors(op):
+    with pytest.raises(PatchError):
+        apply_ops(state_with_clip(), [op])
+
+
+def test_a_bad_op_rejects_the_whole_batch():
+    state = state_with_clip()
+    with pytest.raises(PatchError):
+        apply_ops(state, [{'op': 'move_clip', 'clipId': 'c1', 'start': 9}, {'op': 'rename'}])
+    assert state['tracks'][0]['clips'][0]['start'] == 0
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def new_db():
+    return AsyncMongoMockClient()['test']
+
+
+def test_patch_advances_the_version():
+    async def scenario():
+        store = ProjectStore(new_db())
+        await store.create_indexes()
+        await store.create('p1', 'Test')
+        version, state = await store.patch('p1', 0, [{'op': 'set', 'set': {'name': 'One'}}])
+        assert (version, state['name']) == (1, 'One')
+        assert await store.load('p1') == (1, state)
+
+    run(scenario())
+
+
+def test_stale_base_version_conflicts():
+    async def scenario():
+        store = ProjectStore(new_db())
+        await store.create_indexes()
+        await store.create('p1', 'Test')
+        await store.patch('p1', 0, [{'op': 'set', 'set': {'name': 'One'}}])
+        with pytest.raises(VersionConflict) as conflict:
+            await store.patch('p1', 0, [{'op': 'set', 'set': {'name': 'Two'}}])
+        assert conflict.value.version == 1
+
+    run(scenario())
+
+
+def test_concurrent_workers_conflict_on_the_op_log():
+    async def scenario():
+        db = new_db()
+        first, second = ProjectStore(db), ProjectStore(db)
+        await first.create_indexes()
+        await first.create('p1', 'Test')
+        await second.load('p1')
+        await first.patch('p1', 0, [{'op': 'set', 'set': {'name': 'First'}}])
+        # `second` still has version 0 cached, so only the unique op index catches the race
+        with pytest.raises(VersionConflict) as conflict:
+            await second.patch('p1', 0, [{'op': 'set', 'set': {'name': 'Second'}}])
+        assert conflict.value.version == 1
+        version, state = await second.load('p1')
+        assert (version, state['name']) == (1, 'First')
+
+    run(scenario())
@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+
+def lifecycle(server):
+    """readyz before startup, while serving, and after shutdown."""
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            answers = [await client.get('/api/readyz')]
+            await server.app.router.startup()
+            try:
+                answers.append(await client.get('/api/readyz'))
+                answers.append(await client.get('/api/healthz'))
+            finally:
+                await server.app.router.shutdown()
+            answers.append(await client.get('/api/readyz'))
+            return answers
+    return asyncio.run(scenario())
+
+
+def test_readyz_follows_the_worker_lifecycle(server):
+    before, serving, health, after = lifecycle(server)
+
+    assert before.status_code == 503
+    assert before.json()['status'] == 'unavailable' and before.json()['started'] is False
+
+    assert serving.status_code == 200
+    body = serving.json()
+    assert body['status'] == 'ready'
+    assert body['mongo']['ok'] is True
+    assert body['render_workers'] == server.render_engine.workers
+    assert body['progress'] is True
+    # The only worker in this process claims the once-per-host work
+    assert body['primary'] is True
+
+    assert health.status_code == 200
+
+    assert after.status_code == 503
+    assert after.json()['progress'] is False
+
+
+def test_readyz_reports_mongo_down(server, monkeypatch):
+    async def ping_fails(command):
+        raise ConnectionError('no primary')
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            await server.app.router.startup()
+            try:
+                with monkeypatch.context() as patch:
+                    patch.setattr(server, 'client', SimpleNamespace(admin=SimpleNamespace(command=ping_fails)))
+                    return await client.get('/api/readyz')
+            finally:
+                await server.app.router.shutdown()
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert response.json()['mongo'] == {'ok': False, 'error': 'no primary'}
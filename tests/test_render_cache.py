@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from render import drawtext_filter
+from render_cache import SegmentCache, segment_key
+
+
+def text_track(**fields):
+    return [{'id': 'text-track-1', 'type': 'text', 'clips': [{'id': 't', 'type': 'text', 'start': 0, 'duration': 4, **fields}]}]
+
+
+def video_track(**fields):
+    clip = {'id': 'v', 'type': 'video', 'start': 0, 'duration': 4, 'src': '/media/v', **fields}
+    return [{'id': 'video-track-1', 'type': 'video', 'clips': [clip]}]
+
+
+def key(tracks, fmt='mp4', quality='medium', duration=4):
+    return segment_key(tracks, fmt, quality, duration)
+
+
+@pytest.mark.parametrize('before, after', [
+    ({'text': 'Hello'}, {'text': 'Goodbye'}),
+    ({'name': 'Title'}, {'name': 'Renamed'}),
+    ({'text': 'Hello', 'color': 'white'}, {'text': 'Hello', 'color': 'yellow'}),
+])
+def test_every_drawn_text_field_changes_the_key(before, after):
+    # Only worth keying on if drawtext actually draws it differently
+    assert drawtext_filter(text_track(**before)[0]['clips'][0], 720) != drawtext_filter(text_track(**after)[0]['clips'][0], 720)
+    assert key(text_track(**before)) != key(text_track(**after))
+
+
+@pytest.mark.parametrize('field, before, after', [
+    ('trimStart', 0, 1),
+    ('start', 0, 0.5),
+    ('filter', 'none', 'sepia'),
+    ('adjustments', {'brightness': 10}, {'brightness': 20}),
+    ('effects', [], [{'type': 'hue', 'value': 30}]),
+    ('digest', 'a' * 64, 'b' * 64),
+])
+def test_render_fields_change_the_key(field, before, after):
+    assert key(video_track(**{field: before})) != key(video_track(**{field: after}))
+
+
+def test_ids_and_preset_choices():
+    assert key(video_track(id='one')) == key(video_track(id='two'))
+    assert key(video_track()) != key(video_track(), quality='high')
+    assert key(video_track()) != key(video_track(), fmt='webm')
+    assert key(video_track()) != key(video_track(), duration=3)
+
+
+def test_clip_order_does_not_matter():
+    tracks = video_track() + text_track(text='Hi')
+    assert key(tracks) == key(list(reversed(tracks)))
+
+
+def segment(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return path
+
+
+def test_get_after_put(tmp_path):
+    cache = SegmentCache(tmp_path / 'cache', max_bytes=1000)
+    cache.load()
+    assert cache.get('k', 'mp4') is None
+    path = cache.put('k', 'mp4', segment(tmp_path, 'k.part', 10))
+    assert cache.get('k', 'mp4') == path and path.read_bytes() == b'x' * 10
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (1, 1, 1, 10)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = SegmentCache(tmp_path / 'cache', max_bytes=300)
+    cache.load()
+    for n, name in enumerate(('a', 'b', 'c')):
+        cache.put(name, 'mp4', segment(tmp_path, name, 100))
+        os.utime(cache.path_for(name, 'mp4'), (1000 + n, 1000 + n))
+    # Touching `a` makes `b` the oldest
+    assert cache.get('a', 'mp4') is not None
+    cache.put('d', 'mp4', segment(tmp_path, 'd', 100))
+    assert cache.get('b', 'mp4') is None
+    assert {name for name in ('a', 'c', 'd') if cache.get(name, 'mp4')} == {'a', 'c', 'd'}
+
+
+def test_size_bound_covers_every_process(tmp_path):
+    root = tmp_path / 'cache'
+    first, second = SegmentCache(root, max_bytes=150), SegmentCache(root, max_bytes=150)
+    first.load()
+    second.load()
+    first.put('a', 'mp4', segment(tmp_path, 'a', 100))
+    os.utime(first.path_for('a', 'mp4'), (1000, 1000))
+    second.put('b', 'mp4', segment(tmp_path, 'b', 100))
+    assert first.get('a', 'mp4') is None
+    assert first.get('b', 'mp4') is not None
+
+
+def test_load_trims_what_earlier_runs_left(tmp_path):
+    root = tmp_path / 'cache'
+    root.mkdir()
+    for n in range(5):
+        segment(root, f'{n}.mp4', 100)
+    cache = SegmentCache(root, max_bytes=300)
+    cache.load()
+    assert cache.stats()['bytes'] <= 300
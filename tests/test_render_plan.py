@@ -0,0 +1,63 @@
+from render import GOP_SECONDS, plan_segments, split_span
+
+
+def video_clip(clip_id, start, duration, trim=0.0, **fields):
+    return {'id': clip_id, 'type': 'video', 'start': start, 'duration': duration, 'trimStart': trim, 'src': f'/media/{clip_id}', **fields}
+
+
+def tracks_of(*clips, kind='video'):
+    return [{'id': f'{kind}-track-1', 'type': kind, 'clips': list(clips)}]
+
+
+def covers(pieces, start, end):
+    assert pieces[0][0] == start and pieces[-1][1] == end
+    assert all(a[1] == b[0] for a, b in zip(pieces, pieces[1:]))
+
+
+def test_split_span_cuts_whole_gops():
+    pieces = split_span(0, 25, segment_seconds=10)
+    covers(pieces, 0, 25)
+    assert pieces == [(0, 10), (10, 20), (20, 25)]
+
+
+def test_split_span_merges_short_tail():
+    # 21s would leave a 1s piece; it joins the one before it
+    assert split_span(0, 21, segment_seconds=10) == [(0, 10), (10, 21)]
+
+
+def test_split_span_rounds_segment_length_to_gops():
+    pieces = split_span(0, 30, segment_seconds=7)
+    assert all((end - start) % GOP_SECONDS == 0 for start, end in pieces[:-1])
+    assert pieces[0] == (0, 8)
+
+
+def test_plan_segments_empty_timeline():
+    assert plan_segments([]) == []
+    assert plan_segments(tracks_of()) == []
+
+
+def test_plan_segments_cuts_on_clip_edges():
+    tracks = tracks_of(video_clip('a', 0, 5), video_clip('b', 5, 7))
+    assert plan_segments(tracks, segment_seconds=None) == [(0.0, 5.0), (5.0, 12.0)]
+
+
+def test_plan_segments_drops_edges_closer_than_a_gop():
+    tracks = tracks_of(video_clip('a', 0, 5), video_clip('b', 5, 1), video_clip('c', 6, 6))
+    spans = plan_segments(tracks, segment_seconds=None)
+    covers(spans, 0.0, 12.0)
+    assert all(end - start >= GOP_SECONDS for start, end in spans)
+    assert 6.0 not in [start for start, _ in spans]
+
+
+def test_plan_segments_ignores_audio_edges():
+    tracks = tracks_of(video_clip('a', 0, 12)) + [
+        {'id': 'audio-track-1', 'type': 'audio', 'clips': [{'id': 'm', 'type': 'audio', 'start': 4, 'duration': 3}]},
+    ]
+    assert plan_segments(tracks, segment_seconds=None) == [(0.0, 12.0)]
+
+
+def test_plan_segments_splits_long_spans_and_snaps_to_frames():
+    tracks = tracks_of(video_clip('a', 0, 31.01))
+    spans = plan_segments(tracks, segment_seconds=10)
+    covers(spans, 0.0, 31.0)
+    assert spans == [(0.0, 10.0), (10.0, 20.0), (20.0, 31.0)]
@@ -0,0 +1,67 @@
+import io
+import shutil
+
+import numpy as np
+import pytest
+
+from render import FFMPEG_BIN
+from scenes import (
+    BINS, SCAN_FILTER, SCAN_FPS, SCAN_HEIGHT, SCAN_WIDTH, cut_times, frame_batches, histograms, run_scan,
+)
+
+
+def frames(*shots):
+    """Solid frames: (value, count) per shot."""
+    return np.concatenate([
+        np.full((count, SCAN_HEIGHT, SCAN_WIDTH, 3), value, dtype=np.uint8) for value, count in shots
+    ])
+
+
+def batched(array, size):
+    return [array[n:n + size] for n in range(0, len(array), size)]
+
+
+def scan(array, batch=256):
+    return list(cut_times(histograms(batched(array, batch))))
+
+
+def test_histograms_sum_to_one_per_channel():
+    rng = np.random.default_rng(0)
+    batch = rng.integers(0, 256, (4, SCAN_HEIGHT, SCAN_WIDTH, 3), dtype=np.uint8)
+    hists = next(histograms([batch]))
+    assert hists.shape == (4, 3 * BINS)
+    np.testing.assert_allclose(hists.reshape(4, 3, BINS).sum(axis=2), 1.0)
+
+
+def test_cut_at_a_change_of_shot():
+    assert scan(frames((0, 30), (255, 30))) == [30 / SCAN_FPS]
+
+
+@pytest.mark.parametrize('batch', [1, 7, 30, 31])
+def test_cuts_across_batch_boundaries(batch):
+    assert scan(frames((0, 30), (255, 30), (0, 30)), batch) == [3.0, 6.0]
+
+
+def test_cuts_closer_than_a_scene_are_dropped():
+    # A two-frame flash reports one cut, not two
+    assert scan(frames((0, 30), (255, 2), (0, 30))) == [3.0]
+
+
+def test_no_cut_in_the_first_second():
+    assert scan(frames((0, 5), (255, 30))) == []
+
+
+def test_frame_batches_drop_a_partial_frame():
+    frame_bytes = SCAN_WIDTH * SCAN_HEIGHT * 3
+    stream = io.BytesIO(bytes(frame_bytes * 5 + 10))
+    assert [len(batch) for batch in frame_batches(stream, batch=2)] == [2, 2, 1]
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BIN) is None, reason="ffmpeg is not installed")
+def test_run_scan_finds_the_cut_in_a_video():
+    graph = 'color=c=black:s=320x180:r=30:d=2[a];color=c=white:s=320x180:r=30:d=2[b];[a][b]concat=n=2'
+    cmd = [
+        FFMPEG_BIN, '-hide_banner', '-nostdin', '-v', 'error', '-f', 'lavfi', '-i', graph,
+        '-vf', SCAN_FILTER, '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1',
+    ]
+    assert run_scan(cmd) == [pytest.approx(2.0, abs=1 / SCAN_FPS)]
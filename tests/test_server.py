@@ -0,0 +1,31 @@
+from starlette.requests import Request
+
+
+def _request(peer, forwarded=None):
+    headers = [(b'x-forwarded-for', forwarded.encode())] if forwarded is not None else []
+    return Request({'type': 'http', 'headers': headers, 'client': (peer, 4000)})
+
+
+def test_client_address_is_the_peer_without_a_proxy(server):
+    assert server.client_address(_request('203.0.113.7')) == '203.0.113.7'
+
+
+def test_client_address_looks_through_the_local_proxy(server):
+    assert server.client_address(_request('127.0.0.1', '198.51.100.4')) == '198.51.100.4'
+
+
+def test_client_address_ignores_hops_the_client_wrote(server):
+    # nginx appends the real peer; whatever the client sent sits to its left
+    assert server.client_address(_request('127.0.0.1', '10.9.9.9, 198.51.100.4')) == '198.51.100.4'
+
+
+def test_client_address_ignores_forwarded_for_from_untrusted_peers(server):
+    assert server.client_address(_request('203.0.113.7', '198.51.100.4')) == '203.0.113.7'
+
+
+def test_client_address_behind_proxy_without_forwarded_for(server):
+    assert server.client_address(_request('127.0.0.1')) == '127.0.0.1'
+
+
+def test_export_owner_is_not_client_input(server):
+    assert 'owner' not in server.ExportCreate.model_fields
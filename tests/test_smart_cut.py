@@ -0,0 +1,121 @@
+import shutil
+import subprocess
+
+import pytest
+
+from probe import FFPROBE_BIN, probe_keyframes, probe_media
+from render import EXPORT_FPS, FFMPEG_BIN, encoder_args, encoder_signature, frame_size, plan_parts
+
+ENCODER = {'profile': 'High', 'level': 31, 'extradata_hash': 'SHA256:encoder'}
+
+
+def video_clip(clip_id, start, duration, trim=0.0, **fields):
+    return {'id': clip_id, 'type': 'video', 'start': start, 'duration': duration, 'trimStart': trim, 'src': f'/media/{clip_id}', **fields}
+
+
+def tracks_of(*clips, kind='video'):
+    return [{'id': f'{kind}-track-1', 'type': kind, 'clips': list(clips)}]
+
+
+def copyable(clip_id, start, duration, trim, keyframes, **fields):
+    # A source that matches the 720p ('medium') mp4 encoder exactly
+    stream = {'codec': 'h264', 'width': 1280, 'height': 720, 'fps': 30.0, 'pix_fmt': 'yuv420p', **ENCODER}
+    return video_clip(clip_id, start, duration, trim, video=stream, keyframes=keyframes, **fields)
+
+
+def test_plan_parts_encodes_everything_without_an_encoder_signature():
+    tracks = tracks_of(copyable('a', 0, 20, 3.3, [2.0 * n for n in range(15)]))
+    parts = plan_parts(tracks, 'mp4', 'medium')
+    assert {part['kind'] for part in parts} == {'encode'}
+
+
+def test_plan_parts_copies_between_keyframes():
+    tracks = tracks_of(copyable('a', 0, 20, 3.3, [2.0 * n for n in range(15)]))
+    parts = plan_parts(tracks, 'mp4', 'medium', ENCODER)
+    head, copy, tail = parts
+    assert head == {'kind': 'encode', 'start': 0.0, 'end': pytest.approx(0.7)}
+    assert copy == {'kind': 'copy', 'src': '/media/a', 'in': 4.0, 'frames': 540}
+    assert tail['kind'] == 'encode' and tail['start'] == pytest.approx(18.7) and tail['end'] == 20.0
+    # The parts add up to the export, frame for frame
+    frames = round(head['end'] * EXPORT_FPS) + copy['frames'] + round((tail['end'] - tail['start']) * EXPORT_FPS)
+    assert frames == 20 * EXPORT_FPS
+
+
+def test_plan_parts_trim_on_a_keyframe_needs_no_head():
+    tracks = tracks_of(copyable('a', 0, 20, 4.0, [2.0 * n for n in range(15)]))
+    parts = plan_parts(tracks, 'mp4', 'medium', ENCODER)
+    assert parts == [{'kind': 'copy', 'src': '/media/a', 'in': 4.0, 'frames': 600}]
+
+
+def test_plan_parts_keyframes_off_the_frame_grid_are_encoded():
+    tracks = tracks_of(copyable('a', 0, 20, 3.31, [2.0 * n for n in range(15)]))
+    assert {part['kind'] for part in plan_parts(tracks, 'mp4', 'medium', ENCODER)} == {'encode'}
+
+
+@pytest.mark.parametrize('change', [
+    {'profile': 'Main'},
+    {'level': 40},
+    {'extradata_hash': 'SHA256:other'},
+    {'width': 1920, 'height': 1080},
+    {'fps': 25.0},
+    {'codec': 'hevc'},
+])
+def test_plan_parts_mismatched_sources_are_encoded(change):
+    clip = copyable('a', 0, 20, 4.0, [2.0 * n for n in range(15)])
+    clip['video'].update(change)
+    assert {part['kind'] for part in plan_parts(tracks_of(clip), 'mp4', 'medium', ENCODER)} == {'encode'}
+
+
+def test_plan_parts_effects_or_text_prevent_copying():
+    keyframes = [2.0 * n for n in range(15)]
+    graded = copyable('a', 0, 20, 4.0, keyframes, filter='sepia')
+    assert {part['kind'] for part in plan_parts(tracks_of(graded), 'mp4', 'medium', ENCODER)} == {'encode'}
+
+    titled = tracks_of(copyable('a', 0, 20, 4.0, keyframes)) + tracks_of(
+        {'id': 't', 'type': 'text', 'start': 0, 'duration': 20, 'text': 'Title'}, kind='text',
+    )
+    assert {part['kind'] for part in plan_parts(titled, 'mp4', 'medium', ENCODER)} == {'encode'}
+
+
+def test_plan_parts_copies_a_clip_that_shares_its_segment():
+    # The short clip is merged into the long one's segment; only the long one is copied
+    keyframes = [2.0 * n for n in range(15)]
+    tracks = tracks_of(video_clip('b', 0, 1.0), copyable('a', 1.0, 20, 3.0, keyframes))
+    parts = plan_parts(tracks, 'mp4', 'medium', ENCODER)
+    assert parts == [
+        {'kind': 'encode', 'start': 0.0, 'end': 2.0},
+        {'kind': 'copy', 'src': '/media/a', 'in': 4.0, 'frames': 540},
+        {'kind': 'encode', 'start': 20.0, 'end': 21.0},
+    ]
+
+
+def test_plan_parts_encodes_around_text_inside_a_segment():
+    keyframes = [2.0 * n for n in range(15)]
+    tracks = tracks_of(copyable('a', 0, 20, 4.0, keyframes)) + tracks_of(
+        {'id': 't', 'type': 'text', 'start': 5.0, 'duration': 1.0, 'text': 'Title'}, kind='text',
+    )
+    parts = plan_parts(tracks, 'mp4', 'medium', ENCODER)
+    assert [part['kind'] for part in parts] == ['copy', 'encode', 'encode', 'copy']
+    assert parts[1] == {'kind': 'encode', 'start': 4.0, 'end': 5.0}
+    assert parts[2] == {'kind': 'encode', 'start': 5.0, 'end': 6.0}
+    assert parts[3] == {'kind': 'copy', 'src': '/media/a', 'in': 10.0, 'frames': 420}
+
+
+@pytest.mark.skipif(
+    shutil.which(FFMPEG_BIN) is None or shutil.which(FFPROBE_BIN) is None, reason="ffmpeg is not installed",
+)
+def test_plan_parts_copies_a_source_from_the_export_encoder(tmp_path):
+    # e.g. an earlier export brought back into the timeline
+    width, height = frame_size('medium')
+    source = tmp_path / 'source.mp4'
+    subprocess.run([
+        FFMPEG_BIN, '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=s={width}x{height}:r={EXPORT_FPS}:d=8',
+        *encoder_args('mp4', 'medium'), str(source),
+    ], check=True)
+    clip = video_clip('a', 0, 7.0, 0.5, video=probe_media(str(source))['video'], keyframes=probe_keyframes(str(source)))
+    clip['src'] = str(source)
+    encoder = encoder_signature('mp4', 'medium', str(tmp_path / 'signature.mp4'))
+
+    parts = plan_parts(tracks_of(clip), 'mp4', 'medium', encoder)
+    assert [part['kind'] for part in parts] == ['encode', 'copy', 'encode']
+    assert parts[1] == {'kind': 'copy', 'src': str(source), 'in': 2.0, 'frames': 120}
@@ -0,0 +1,58 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def rows(server):
+    # Pairs share a timestamp, so paging has to break ties on id
+    base = datetime(2026, 1, 1)
+    docs = [
+        {'id': f"{n:04d}", 'client_name': f"client_{n}", 'timestamp': base + timedelta(seconds=n // 2)}
+        for n in reversed(range(250))
+    ]
+
+    async def seed():
+        await server.db.status_checks.delete_many({})
+        await server.db.status_checks.insert_many([dict(doc) for doc in docs])
+    asyncio.run(seed())
+    return sorted(doc['id'] for doc in docs)
+
+
+def test_status_pages_follow_the_cursor(call, rows):
+    seen, pages, after = [], 0, None
+    while True:
+        response = call('GET', '/api/status', params={'limit': 100, **({'after': after} if after else {})})
+        assert response.status_code == 200
+        pages += 1
+        seen += [doc['id'] for doc in response.json()]
+        after = response.headers.get('x-next-cursor')
+        if after is None:
+            break
+    assert pages == 3
+    assert seen == rows
+
+
+def test_status_full_last_page_ends_with_an_empty_one(call, rows):
+    first = call('GET', '/api/status', params={'limit': 125})
+    second = call('GET', '/api/status', params={'limit': 125, 'after': first.headers['x-next-cursor']})
+    third = call('GET', '/api/status', params={'limit': 125, 'after': second.headers['x-next-cursor']})
+    assert [doc['id'] for doc in first.json() + second.json()] == rows
+    assert third.json() == []
+    assert 'x-next-cursor' not in third.headers
+
+
+def test_status_stream_continues_from_a_cursor(call, rows):
+    first = call('GET', '/api/status', params={'limit': 10})
+    response = call('GET', '/api/status', params={'stream': 'true', 'after': first.headers['x-next-cursor']})
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    streamed = [json.loads(line)['id'] for line in response.text.splitlines()]
+    assert streamed == rows[10:]
+
+
+def test_status_rejects_bad_paging(call, server):
+    assert call('GET', '/api/status', params={'after': 'not a cursor'}).status_code == 400
+    assert call('GET', '/api/status', params={'limit': server.STATUS_PAGE_MAX + 1}).status_code == 422
+    assert call('GET', '/api/status', params={'limit': 0}).status_code == 422
@@ -0,0 +1,96 @@
+import asyncio
+import random
+
+import pytest
+
+from timeline import FrameCache, IntervalTree
+
+
+def brute_force(intervals, t):
+    return sorted(value for start, end, value in intervals if start <= t < end)
+
+
+def test_empty_tree():
+    assert IntervalTree([]).at(0) == []
+    assert IntervalTree([(3, 3, 'empty')]).at(3) == []
+
+
+def test_intervals_are_half_open():
+    tree = IntervalTree([(0, 5, 'a'), (5, 8, 'b')])
+    assert tree.at(0) == ['a']
+    assert tree.at(4.999) == ['a']
+    assert tree.at(5) == ['b']
+    assert tree.at(8) == []
+    assert tree.at(-1) == []
+
+
+def test_shared_endpoints_and_duplicates():
+    intervals = [(0, 10, 'a'), (0, 10, 'b'), (2, 10, 'c'), (10, 12, 'd')]
+    tree = IntervalTree(intervals)
+    for t in (0, 2, 9.5, 10, 11, 12):
+        assert sorted(tree.at(t)) == brute_force(intervals, t)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_brute_force(seed):
+    rng = random.Random(seed)
+    intervals = []
+    for n in range(rng.randint(1, 200)):
+        # Whole seconds make shared endpoints common
+        start = rng.randint(0, 100) if rng.random() < 0.5 else rng.uniform(0, 100)
+        intervals.append((start, start + rng.choice([0, 1, 2, rng.uniform(0, 30)]), n))
+    tree = IntervalTree(intervals)
+    probes = [p for start, end, _ in intervals for p in (start, end)] + [rng.uniform(-5, 135) for _ in range(100)]
+    for t in probes:
+        assert sorted(tree.at(t)) == brute_force(intervals, t)
+
+
+def test_frame_cache_render_outlives_the_request_that_started_it():
+    async def scenario():
+        cache = FrameCache(max_bytes=1024)
+        release = asyncio.Event()
+        renders = []
+
+        async def create():
+            renders.append(1)
+            await release.wait()
+            return b'jpeg'
+
+        first = asyncio.create_task(cache.get('k', create))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get('k', create))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        image = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return image, renders, await cache.get('k', create)
+
+    image, renders, cached = asyncio.run(scenario())
+    assert image == cached == b'jpeg'
+    assert renders == [1]
+
+
+def test_frame_cache_shares_failures_and_retries_after_them():
+    async def scenario():
+        cache = FrameCache(max_bytes=1024)
+        calls = []
+
+        async def broken():
+            calls.append(1)
+            await asyncio.sleep(0)
+            raise RuntimeError('decode failed')
+
+        results = await asyncio.gather(cache.get('k', broken), cache.get('k', broken), return_exceptions=True)
+
+        async def fixed():
+            return b'jpeg'
+
+        return results, calls, await cache.get('k', fixed)
+
+    results, calls, image = asyncio.run(scenario())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert calls == [1]
+    assert image == b'jpeg'
@@ -0,0 +1,84 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from render import FFMPEG_BIN
+from waveform import BASE_BUCKET, HEADER, MAGIC, PeakPyramid, _merge, build_peaks, level_sizes
+
+SAMPLE_RATE = 6400  # 100 level-0 buckets a second
+
+
+def write_peaks(path, level0):
+    levels = [np.asarray(level0, dtype=np.int8)]
+    while len(levels[-1]) > 1:
+        levels.append(_merge(levels[-1]))
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, SAMPLE_RATE, BASE_BUCKET, len(levels), len(levels[0])))
+        for peaks in levels:
+            f.write(peaks.tobytes())
+    return PeakPyramid(path)
+
+
+def ramp(buckets):
+    return [[-(n % 100), n % 100] for n in range(buckets)]
+
+
+def test_level_sizes_round_odd_levels_up():
+    assert level_sizes(5) == [5, 3, 2, 1]
+
+
+def test_merge_keeps_the_extremes_of_each_pair():
+    merged = _merge(np.array([(-1, 2), (-5, 1), (0, 9)], dtype=np.int8))
+    assert merged.tolist() == [[-5, 2], [0, 9]]
+
+
+def test_level_for_picks_the_coarsest_level_with_a_bucket_per_pixel(tmp_path):
+    pyramid = write_peaks(tmp_path / 'a.peaks', ramp(1000))
+    assert pyramid.level_for(100) == 0
+    assert pyramid.level_for(50) == 1
+    assert pyramid.level_for(49) == 1
+    assert pyramid.level_for(10_000) == 0
+    assert pyramid.level_for(0.001) == len(pyramid.levels) - 1
+    assert pyramid.level_for(0) == len(pyramid.levels) - 1
+
+
+def test_window_reads_only_the_visible_buckets(tmp_path):
+    pyramid = write_peaks(tmp_path / 'a.peaks', ramp(1000))
+    level, first, data = pyramid.window(2.0, 2.5, 100)
+    assert (level, first) == (0, 200)
+    assert np.frombuffer(data, dtype=np.int8).reshape(-1, 2).tolist() == ramp(1000)[200:250]
+
+    level, first, data = pyramid.window(2.0, 4.0, 25)
+    assert (level, first) == (2, 50)
+    assert len(data) == 50 * 2
+
+
+def test_window_is_clipped_to_the_audio(tmp_path):
+    pyramid = write_peaks(tmp_path / 'a.peaks', ramp(1000))
+    level, first, data = pyramid.window(9.5, 20.0, 100)
+    assert (level, first, len(data)) == (0, 950, 50 * 2)
+    assert pyramid.window(12.0, 13.0, 100) == (0, 1200, b'')
+    assert pyramid.window(5.0, 4.0, 100) == (0, 500, b'')
+
+
+def test_not_a_peak_file(tmp_path):
+    path = tmp_path / 'bad.peaks'
+    path.write_bytes(HEADER.pack(b'NOPE', SAMPLE_RATE, BASE_BUCKET, 1, 1) + b'\0\0')
+    with pytest.raises(ValueError):
+        PeakPyramid(path)
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BIN) is None, reason="ffmpeg is not installed")
+def test_build_peaks_from_a_tone(tmp_path):
+    source = tmp_path / 'tone.wav'
+    # lavfi's sine peaks at 1/8 of full scale
+    subprocess.run([FFMPEG_BIN, '-v', 'error', '-f', 'lavfi', '-i', 'sine=frequency=440:duration=2', str(source)], check=True)
+    output = tmp_path / 'tone.peaks'
+    levels = build_peaks(str(source), str(output))
+    pyramid = PeakPyramid(output)
+    assert len(pyramid.levels) == levels
+    assert len(pyramid.levels[-1]) == 1
+    low, high = pyramid.levels[-1][0]
+    assert low == pytest.approx(-16, abs=1) and high == pytest.approx(16, abs=1)
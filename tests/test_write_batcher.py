@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from write_batcher import WriteCoalescer
+
+
+class Collection:
+    def __init__(self, fail_indexes=(), error=None):
+        self.batches = []
+        self.fail_indexes = set(fail_indexes)
+        self.error = error
+
+    async def insert_many(self, docs):
+        self.batches.append([doc['n'] for doc in docs])
+        if self.error is not None:
+            raise self.error
+        errors = [{'index': i, 'code': 11000, 'errmsg': 'duplicate key'} for i in sorted(self.fail_indexes) if i < len(docs)]
+        if errors:
+            raise BulkWriteError({'writeErrors': errors})
+
+
+def insert_all(coalescer, count):
+    return asyncio.gather(*(coalescer.insert({'n': n}) for n in range(count)), return_exceptions=True)
+
+
+def test_inserts_within_the_window_share_one_write():
+    collection = Collection()
+
+    async def scenario():
+        coalescer = WriteCoalescer(collection.insert_many, max_delay=0.01, max_batch=100)
+        return await insert_all(coalescer, 5)
+
+    assert asyncio.run(scenario()) == [None] * 5
+    assert collection.batches == [[0, 1, 2, 3, 4]]
+
+
+def test_a_full_batch_is_written_without_waiting():
+    collection = Collection()
+
+    async def scenario():
+        coalescer = WriteCoalescer(collection.insert_many, max_delay=60, max_batch=3)
+        return await asyncio.wait_for(insert_all(coalescer, 6), 1)
+
+    assert asyncio.run(scenario()) == [None] * 6
+    assert collection.batches == [[0, 1, 2], [3, 4, 5]]
+
+
+def test_only_the_failed_documents_see_a_write_error():
+    collection = Collection(fail_indexes=[1, 3])
+
+    async def scenario():
+        coalescer = WriteCoalescer(collection.insert_many, max_delay=0.01, max_batch=100)
+        return await insert_all(coalescer, 4)
+
+    results = asyncio.run(scenario())
+    assert results[0] is None and results[2] is None
+    for n in (1, 3):
+        assert isinstance(results[n], BulkWriteError)
+        assert [error['index'] for error in results[n].details['writeErrors']] == [n]
+
+
+def test_any_other_error_fails_the_whole_batch():
+    collection = Collection(error=ConnectionError('mongo went away'))
+
+    async def scenario():
+        coalescer = WriteCoalescer(collection.insert_many, max_delay=0.01, max_batch=100)
+        return await insert_all(coalescer, 3)
+
+    assert [type(r) for r in asyncio.run(scenario())] == [ConnectionError] * 3
+
+
+def test_drain_writes_what_is_buffered():
+    collection = Collection()
+
+    async def scenario():
+        coalescer = WriteCoalescer(collection.insert_many, max_delay=60, max_batch=100)
+        inserts = asyncio.ensure_future(insert_all(coalescer, 2))
+        await asyncio.sleep(0)
+        await coalescer.drain()
+        return await inserts
+
+    assert asyncio.run(scenario()) == [None, None]
+    assert collection.batches == [[0, 1]]
+
+
+def test_a_cancelled_caller_does_not_hold_up_the_rest():
+    collection = Collection()
+
+    async def scenario():
+        coalescer = WriteCoalescer(collection.insert_many, max_delay=0.01, max_batch=100)
+        first = asyncio.ensure_future(coalescer.insert({'n': 0}))
+        second = asyncio.ensure_future(coalescer.insert({'n': 1}))
+        await asyncio.sleep(0)
+        first.cancel()
+        await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+    # The cancelled caller's document was already buffered, so it is still written
+    assert collection.batches == [[0, 1]]